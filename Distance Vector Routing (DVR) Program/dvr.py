@@ -1,131 +1,410 @@
+import argparse
+import os
+import select # to wait for a DV table until the next announcement is due
 import sys
 import socket
-import pickle
+import struct # for the binary DV announcements
 import time
-import threading
+from array import array # for the cost matrix without NumPy
+
+try:
+    import numpy as np # optional, relaxes the routes of a distance vector in bulk
+except ImportError:
+    np = None
+
+# Seconds between two periodic announcements of the DV table
+UPDATE_INTERVAL = 30
+
+# Seconds a triggered announcement is held down after the previous announcement
+HOLD_DOWN = 1
+
+# Smallest cost from which a destination is unreachable, it bounds counting to infinity (see infinity_bound())
+INFINITY = 64
+
+# Seconds between two checks of the topology file for link cost changes
+TOPOLOGY_CHECK = 1
+
+# A DV announcement is a frame: its length, then the header and one entry per destination
+FRAME_LENGTH = struct.Struct('!I')
+DV_HEADER = struct.Struct('!HB') # node index of the sender, flags
+DV_ENTRY = struct.Struct('!HHI') # node index of the destination, node index of the next hop, cost
+
+# Flag of an announcement carrying only the routes changed since the previous one
+FLAG_DELTA = 0b1
+
+# Cost of an unreachable destination, and next hop of a destination without one, in an entry
+UNREACHABLE = 0xFFFFFFFF
+NO_HOP = 0xFFFF
+
+# Largest number of nodes, the node indices are 16 bits and NO_HOP is reserved
+MAX_NODES = NO_HOP
+
+# Largest frame, a full announcement in the largest network, a longer length means the stream is corrupt
+MAX_FRAME_SIZE = DV_HEADER.size + DV_ENTRY.size * MAX_NODES
+
+# The entries as a NumPy record, encoded and decoded without a loop
+DV_ENTRY_DTYPE = np.dtype([('dest', '>u2'), ('next_hop', '>u2'), ('cost', '>u4')]) if np is not None else None
+
+# Names of the nodes in the printed tables and the logs: letters while the alphabet lasts
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+
+def node_names(num_nodes):
+    """
+    The node_names function returns the names of the nodes of a network, in the order of their node indices.
+
+    The nodes are named by letters, a, b, c..., when there are at most as many as the letters of the alphabet, and by their node index, 0, 1, 2..., otherwise.
+    """
+    if num_nodes <= len(ALPHABET):
+        return list(ALPHABET[:num_nodes])
+    return [str(i) for i in range(num_nodes)]
 
 class RoutingTable:
     """
     The RoutingTable class is used to manage a routing table for a node in a network.
 
+    The costs are kept in a dense matrix with one row per node and one column per neighbor, since only a neighbor can be the next hop of a route. The best route to every destination is cached, and an incoming distance vector only recomputes the cache for the rows whose cost it changed, so an update costs O(N) rather than O(N²). The matrix is a NumPy array when NumPy is installed, a flat array of doubles otherwise.
+
+    The routes of a neighbor that go through the current node are taken as unreachable (poisoned reverse), and a cost reaching the infinity bound makes a route unreachable, so that the cost of a destination that became unreachable is counted up to the bound rather than forever.
+
     The class has the following methods:
-    1.) print()
-    2.) get_dv()
-    3.) update_routing_table()
-    4.) log_dv_table()
+    1.) position()
+    2.) route_costs()
+    3.) print()
+    4.) get_dv()
+    5.) routes_to_announce()
+    6.) update_routing_table()
+    7.) update_routes()
+    8.) set_link_cost()
+    9.) relax()
+    10.) update_column()
+    11.) recompute()
+    12.) log_dv_table()
     """
 
-    def __init__(self, table, num_nodes, my_ip):
+    def __init__(self, table, num_nodes, my_ip, infinity=float('inf')):
         """
         Initializes the node with a given IP address, number of nodes, and a routing table.
 
+        Routes whose cost reaches `infinity` are unreachable, there is no bound by default.
+
         The method does the following:
-        1. It creates a dictionary to map IP addresses to alphabet nodes.
-        2. It creates a reverse mapping from alphabet nodes back to IP addresses.
+        1. It creates a dictionary to map IP addresses to node names: letters, or node indices in a network larger than the alphabet (see node_names()).
+        2. It creates a reverse mapping from node names back to IP addresses.
         3. It prints the mapping of nodes to IP addresses.
-        4. It initializes the routing table for the current node (identified by `my_ip`). The routing table is a dictionary where the keys are tuples of (destination, next hop) and the values are the costs of the routes. Initially, all costs are set to infinity.
-        5. It updates the routing table with the initial costs and next hops provided in the `table` parameter. If a route from the `table` exists in the routing table, its cost is updated.
+        4. It numbers the nodes in the order of `num_nodes` and gives a column of the cost matrix to every next hop of the `table` parameter, in the same order. The costs of the matrix, of the routes announced by the neighbors and of the cached best routes are initially set to infinity.
+        5. It updates the matrix with the initial costs and next hops provided in the `table` parameter, the cost of the route to a neighbor through itself being the cost of the link, and computes the best route to every destination.
         """
 
-        # Create a dictionary to map IP addresses to alphabet nodes
-        nodes_alph = [chr(i) for i in range(ord('a'), ord('a') + len(num_nodes))]
+        if len(num_nodes) > MAX_NODES:
+            raise ValueError(f"Too many nodes: {len(num_nodes)}, at most {MAX_NODES}")
+
+        # Create a dictionary to map IP addresses to node names
+        nodes_alph = node_names(len(num_nodes))
         ip_addr = list(num_nodes)
         self.my_ip = my_ip
+        self.infinity = infinity
         self.node_map = dict(zip(ip_addr, nodes_alph))
-        # Create a reverse mapping from alphabet nodes to IP addresses
+        # Create a reverse mapping from node names to IP addresses
         self.reverse_node_map = {v: k for k, v in self.node_map.items()}
 
         for ip_addr, node in self.node_map.items():
             print(f"Node {node} has IP address {ip_addr}")
-        
-        # Initialize the routing table for my_ip
-        my_node = self.node_map[self.my_ip]
-        nodes_alph.remove(my_node)  # Remove the current node from the list (no need to include it in the routing table)
-        self.routing_table = {(dest, next_hop): float('inf') for dest in nodes_alph for next_hop in nodes_alph}
-        for (dest, next_hop), cost in table.items(): # Update the routing table with the initial costs and next hops
-            if (self.node_map[dest], self.node_map[next_hop]) in self.routing_table:
-                self.routing_table[(self.node_map[dest], self.node_map[next_hop])] = cost
+
+        # Number the nodes, the row of a destination and the column of a next hop are looked up by node name
+        self.nodes = nodes_alph
+        self.node_index = {node: i for i, node in enumerate(nodes_alph)}
+        self.my_node = self.node_map[self.my_ip]
+        self.me = self.node_index[self.my_node]
+        routes = {}
+        for (dest, next_hop), cost in table.items():
+            dest, next_hop = self.node_index[self.node_map[dest]], self.node_index[self.node_map[next_hop]]
+            if self.me not in (dest, next_hop): # no route to or through the current node
+                routes[(dest, next_hop)] = cost
+        self.neighbors = sorted({next_hop for _, next_hop in routes}) # node index of the next hop of every column
+        self.column = {next_hop: col for col, next_hop in enumerate(self.neighbors)}
+        self.link_costs = [routes.get((next_hop, next_hop), float('inf')) for next_hop in self.neighbors]
+
+        # Initialize the cost matrix and the best route cache
+        n, k = len(self.nodes), len(self.neighbors)
+        if np is not None:
+            self.costs = np.full((n, k), np.inf)
+            self.announced = np.full((n, k), np.inf) # cost announced by the neighbor of each column
+            self.best_costs = np.full(n, np.inf)
+            self.best_hops = np.zeros(n, dtype=np.intp) # column of the best next hop
+            self.sent_costs = np.full(n, np.inf) # best routes in the last announcement
+            self.sent_hops = np.zeros(n, dtype=np.intp)
+        else:
+            self.costs = array('d', [float('inf')]) * (n * k) # row-major, cost of (dest, col) at dest * k + col
+            self.announced = array('d', [float('inf')]) * (n * k)
+            self.best_costs = array('d', [float('inf')]) * n
+            self.best_hops = array('l', [0]) * n
+            self.sent_costs = array('d', [float('inf')]) * n
+            self.sent_hops = array('l', [0]) * n
+        for (dest, next_hop), cost in routes.items(): # Update the matrix with the initial costs and next hops
+            col = self.column[next_hop]
+            self.announced[self.position(dest, col)] = cost - self.link_costs[col] if self.link_costs[col] != float('inf') else cost
+        for col in range(k):
+            self.update_column(col, range(n))
         self.print()
         sys.stdout.flush()
         self.log_dv_table()
-            
+
+    def position(self, dest, col):
+        """
+        Returns the index of the cost of the route to `dest` through the next hop of column `col` in the cost matrix.
+        """
+        if np is not None:
+            return dest, col
+        return dest * len(self.neighbors) + col
+
+    def route_costs(self, dest):
+        """
+        Returns the costs of the routes to `dest` through every neighbor, in the order of the columns.
+        """
+        k = len(self.neighbors)
+        if np is not None:
+            return self.costs[dest].tolist()
+        return self.costs[dest * k:(dest + 1) * k].tolist()
+
     def print(self):
         """
         Prints the routing table.
 
         The method does the following:
-        1. It groups the routes in the routing table by destination.
-        2. It prints the node's name and its routing table.
-        3. For each destination, it prints the cost and next hop for each route.
-        4. If the cost is infinity, it prints '∞' instead of the cost.
-        """
-        routes_by_dest = {} # Group routes by destination
-        for (dest, next_hop), cost in self.routing_table.items():
-            if dest not in routes_by_dest:
-                routes_by_dest[dest] = []
-            routes_by_dest[dest].append((cost, next_hop))
-        # Print each destination and its routes
-        print(f"Distance Routing table for Node {self.node_map[self.my_ip]}")
-        for dest, routes in routes_by_dest.items():
-            print(f"to {dest}", end="\t")
-            for cost, next_hop in routes:
-                if cost == float('inf'):
-                    print(f"(∞, via {next_hop})", end="\t")
-                else:
-                    print(f"({cost}, via {next_hop})", end="\t")
-            print()
+        1. It prints the node's name and its routing table.
+        2. For each destination, it prints the cost and next hop of the route through each neighbor.
+        3. If the cost is infinity, it prints '∞' instead of the cost.
+        """
+        lines = [f"Distance Routing table for Node {self.my_node}"] # printed at once, a large table is mostly formatting
+        for dest, node in enumerate(self.nodes):
+            if dest == self.me:
+                continue
+            routes = "".join(f"(∞, via {self.nodes[next_hop]})\t" if cost == float('inf') else f"({int(cost)}, via {self.nodes[next_hop]})\t"
+                             for cost, next_hop in zip(self.route_costs(dest), self.neighbors))
+            lines.append(f"to {node}\t{routes}")
+        print("\n".join(lines))
         print()
-    
+
     def get_dv(self):
         """
         Returns the distance vector for the current node.
 
-        The method does the following:
-        1. It groups the routes in the routing table by destination.
-        2. For each group of routes, it finds the route with the minimum cost.
-        3. It creates a new distance vector table containing the minimum cost route for each destination.
-        4. It returns the new distance vector table.
-        """
-        group = {}
-        for (dest, next_hop), cost in self.routing_table.items():
-            if dest not in group:
-                group[dest] = []
-            group[dest].append(((dest, next_hop), cost))
-        dv_table = {min(costs, key=lambda x: x[1])[0]: min(costs, key=lambda x: x[1])[1] for costs in group.values()}
+        The method reads the best route to each destination from the cache and returns a table mapping (destination, next hop) to the cost of that route. A destination without neighbors to go through has no next hop.
+        """
+        dv_table = {}
+        best_costs, best_hops = self.best_costs.tolist(), self.best_hops.tolist()
+        for dest, node in enumerate(self.nodes):
+            if dest == self.me:
+                continue
+            cost = best_costs[dest]
+            next_hop = self.nodes[self.neighbors[best_hops[dest]]] if self.neighbors else None
+            dv_table[(node, next_hop)] = int(cost) if cost != float('inf') else cost
         return dv_table
 
+    def routes_to_announce(self, full):
+        """
+        Returns the routes to announce to the neighbors, and records them as announced.
+
+        The method takes one argument:
+        full: True to return the best route to every destination, False to return only the routes that changed since the last announcement.
+
+        It returns a tuple (node indices of the destinations, node indices of their next hops, costs), NO_HOP standing for a destination without neighbors to go through.
+        """
+        n = len(self.nodes)
+        if np is not None:
+            announce = np.ones(n, dtype=bool)
+            if not full:
+                announce = (self.best_costs != self.sent_costs) | (self.best_hops != self.sent_hops)
+            announce[self.me] = False
+            dests = np.flatnonzero(announce)
+            costs = self.best_costs[dests]
+            if self.neighbors:
+                next_hops = np.asarray(self.neighbors, dtype=np.intp)[self.best_hops[dests]]
+            else:
+                next_hops = np.full(len(dests), NO_HOP, dtype=np.intp)
+            self.sent_costs[dests] = costs
+            self.sent_hops[dests] = self.best_hops[dests]
+            return dests, next_hops, costs
+        dests, next_hops, costs = [], [], []
+        for dest in range(n):
+            cost, hop = self.best_costs[dest], self.best_hops[dest]
+            if dest == self.me or not (full or cost != self.sent_costs[dest] or hop != self.sent_hops[dest]):
+                continue
+            dests.append(dest)
+            next_hops.append(self.neighbors[hop] if self.neighbors else NO_HOP)
+            costs.append(cost)
+            self.sent_costs[dest] = cost
+            self.sent_hops[dest] = hop
+        return dests, next_hops, costs
+
     def update_routing_table(self, dv_table, ip_addr):
         """
         Updates the routing table based on the received distance vector (DV) table.
 
         The method takes two arguments:
-        dv_table: The DV table received from a neighbor node.
+        dv_table: The DV table received from a neighbor node, mapping (destination, next hop) to the cost of the route.
         ip_addr: The IP address of the neighbor node that sent the DV table.
 
+        The method numbers the destinations and next hops of the DV table and updates the routes through the neighbor with them (see update_routes()). It returns True if the best route to a destination changed.
+        """
+        dests, next_hops, costs = [], [], []
+        for (dest, next_hop), cost in dv_table.items():
+            if dest in self.node_index:
+                dests.append(self.node_index[dest])
+                next_hops.append(self.node_index.get(next_hop, NO_HOP))
+                costs.append(cost)
+        return self.update_routes(self.node_index[self.node_map[ip_addr]], dests, next_hops, costs)
+
+    def update_routes(self, sender, dests, next_hops, costs):
+        """
+        Updates the routing table with the routes announced by a neighbor.
+
+        The method takes four arguments:
+        sender: The node index of the neighbor.
+        dests: The node indices of the announced destinations.
+        next_hops: The node index of the next hop of the neighbor to each destination.
+        costs: The cost from the neighbor to each destination.
+
         The method does the following:
-        1. It gets the current DV table.
-        2. It calculates the new cost for each route in the received DV table.
-        3. If the new cost is less than the current cost in the routing table, it updates the routing table and sets the updated flag to True.
-        4. If the routing table is updated and the DV table has changed, it logs the new DV table, prints the new routing table, and flushes the standard output.
-        """
-        updated = False
-        dv_before = self.get_dv()
-        sender_node = self.node_map[ip_addr]
-        for (dest, next_hop) in dv_table.keys():
-            if (dest, next_hop) in self.routing_table:
-                cost_to_sender = self.routing_table[sender_node, sender_node]
-                #cost_to_sender = min(v for k, v in self.routing_table.items() if k[0] == sender_node)
-                new_cost = dv_table[(dest, next_hop)] + cost_to_sender
-                if new_cost < self.routing_table[(dest, next_hop)]:
-                    self.routing_table[(dest, sender_node)] = new_cost
-                    updated = True
-        dv_after = self.get_dv()
-        if updated and dv_before != dv_after:
+        1. It ignores routes from a node that is not a neighbor, since no route goes through it.
+        2. It skips the current node and unknown destinations. A route of the neighbor that goes through the current node is taken as unreachable (poisoned reverse): the overlay sends the same DV table to every neighbor, so the receiver applies split horizon from the next hops in the table.
+        3. It updates the routes through the neighbor with them (see relax()). The other destinations keep the routes the neighbor announced before.
+        4. If the best route to a destination changed, it logs the new DV table, prints the new routing table, and flushes the standard output.
+        5. It returns True if the best route to a destination changed, when the DV table should be announced.
+        """
+        col = self.column.get(sender)
+        if col is None:
+            return False
+        if np is not None:
+            dests = np.asarray(dests, dtype=np.intp)
+            costs = np.where(np.asarray(next_hops) == self.me, np.inf, np.asarray(costs, dtype=float))
+            keep = (dests < len(self.nodes)) & (dests != self.me)
+            dests, costs = dests[keep], costs[keep]
+        else:
+            routes = [(dest, cost if next_hop != self.me else float('inf')) for dest, next_hop, cost in zip(dests, next_hops, costs)
+                      if dest < len(self.nodes) and dest != self.me]
+            dests, costs = [dest for dest, _ in routes], [cost for _, cost in routes]
+        updated = self.relax(col, dests, costs)
+        if updated:
             self.log_dv_table()
-            print(f"Routing table updated by {sender_node}: ip_addr {ip_addr}")
-            print(f"Updated DV for node {my_ip}: {dv_after}")
+            print(f"Routing table updated by {self.nodes[sender]}: ip_addr {self.reverse_node_map[self.nodes[sender]]}")
+            print(f"Updated DV for node {self.my_ip}: {self.get_dv()}")
             self.print()
             sys.stdout.flush()
+        return updated
+
+    def set_link_cost(self, ip_addr, cost):
+        """
+        Changes the cost of the link to a neighbor node.
+
+        The method takes two arguments:
+        ip_addr: The IP address of the neighbor node.
+        cost: The new cost of the link, infinity if the link is down.
+
+        The method does the following:
+        1. It ignores a node that is not a neighbor, since the matrix has no column for it.
+        2. If the link is down, it forgets the routes the neighbor announced, they are announced again once the link is back.
+        3. It recomputes every route through the neighbor with the new cost (see update_column()).
+        4. If the best route to a destination changed, it logs the new DV table, prints the new routing table, and flushes the standard output.
+        5. It returns True if the best route to a destination changed, when the DV table should be announced.
+        """
+        neighbor = self.node_index[self.node_map[ip_addr]]
+        col = self.column.get(neighbor)
+        if col is None:
+            return False
+        self.link_costs[col] = cost
+        n = len(self.nodes)
+        if cost == float('inf'):
+            for dest in range(n):
+                self.announced[self.position(dest, col)] = float('inf')
+        self.announced[self.position(neighbor, col)] = 0
+        updated = self.update_column(col, np.arange(n) if np is not None else range(n))
+        if updated:
+            self.log_dv_table()
+            print(f"Link to {self.node_map[ip_addr]} changed: ip_addr {ip_addr}, cost {cost}")
+            print(f"Updated DV for node {self.my_ip}: {self.get_dv()}")
+            self.print()
+            sys.stdout.flush()
+        return updated
+
+    def relax(self, col, dests, costs):
+        """
+        Records the distance vector announced by a neighbor and updates the routes through it.
+
+        The method takes three arguments:
+        col: The column of the neighbor.
+        dests: The node indices of the destinations announced by the neighbor.
+        costs: The cost from the neighbor to each destination.
+
+        The method records the announced costs and updates the routes to the announced destinations (see update_column()). It returns True if the best route to any of them changed.
+        """
+        if np is not None:
+            dests = np.asarray(dests, dtype=np.intp)
+            self.announced[dests, col] = costs
+            return self.update_column(col, dests)
+        k = len(self.neighbors)
+        for dest, cost in zip(dests, costs):
+            self.announced[dest * k + col] = cost
+        return self.update_column(col, dests)
+
+    def update_column(self, col, rows):
+        """
+        Recomputes the costs of the routes through a neighbor to some destinations.
+
+        The method takes the column of the neighbor and the node indices of the destinations, and does the following:
+        1. It adds the cost of the link to the neighbor to the cost the neighbor announced for each destination. A cost reaching the infinity bound is infinite.
+        2. Where the cost differs from the cost of the route through the neighbor, lower or higher, it updates the matrix.
+        3. It recomputes the best route of the destinations whose row changed, and returns True if any of them changed.
+        """
+        link_cost = self.link_costs[col]
+        if np is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            new_costs = self.announced[rows, col] + link_cost
+            new_costs[new_costs >= self.infinity] = np.inf
+            changed = new_costs != self.costs[rows, col]
+            rows = rows[changed]
+            self.costs[rows, col] = new_costs[changed]
+            return self.recompute(rows)
+        k = len(self.neighbors)
+        changed = []
+        for dest in rows:
+            new_cost = self.announced[dest * k + col] + link_cost
+            if new_cost >= self.infinity:
+                new_cost = float('inf')
+            if new_cost != self.costs[dest * k + col]:
+                self.costs[dest * k + col] = new_cost
+                changed.append(dest)
+        return self.recompute(changed)
+
+    def recompute(self, rows):
+        """
+        Recomputes the cached best route of some destinations from their rows of the cost matrix.
+
+        The best route is the cheapest one, the first neighbor in column order breaking ties. The method takes the node indices of the destinations, and returns True if the cost or the next hop of any of their best routes changed.
+        """
+        if not self.neighbors:
+            return False
+        if np is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            if rows.size == 0:
+                return False
+            hops = self.costs[rows].argmin(axis=1)
+            best = self.costs[rows, hops]
+            changed = (best != self.best_costs[rows]) | (hops != self.best_hops[rows])
+            self.best_costs[rows] = best
+            self.best_hops[rows] = hops
+            return bool(changed.any())
+        k = len(self.neighbors)
+        changed = False
+        for dest in rows:
+            row = self.costs[dest * k:(dest + 1) * k]
+            best = min(row)
+            hop = row.index(best)
+            if best != self.best_costs[dest] or hop != self.best_hops[dest]:
+                self.best_costs[dest] = best
+                self.best_hops[dest] = hop
+                changed = True
+        return changed
 
     def log_dv_table(self):
         """
@@ -138,13 +417,132 @@ class RoutingTable:
         """
         dv_table = self.get_dv() # Get current dv table for
         with open(f"log_{self.my_ip}.txt", "a") as f:
-                for (node, next_hop), cost in dv_table.items():
-                    f.write(f"<{self.reverse_node_map[node]}>:{cost if cost != float('inf') else '∞'}:<{self.reverse_node_map[next_hop] if next_hop else ''}>")
+                f.write("".join(f"<{self.reverse_node_map[node]}>:{cost if cost != float('inf') else '∞'}:<{self.reverse_node_map[next_hop] if next_hop else ''}>"
+                                for (node, next_hop), cost in dv_table.items()))
                 f.write("\n")
 
 
-# Initialize neighbor table
-neighbors_table = {} 
+def encode_dv(sender, dests, next_hops, costs, delta=False):
+    """
+    The encode_dv function encodes a DV announcement as a frame.
+
+    It takes five arguments:
+
+    sender: The node index of the announcing node.
+    dests, next_hops, costs: The routes to announce, as returned by RoutingTable.routes_to_announce().
+    delta: True if the announcement only carries the routes changed since the previous one.
+
+    It returns the frame: its length, the header and an entry per route, an infinite cost being sent as UNREACHABLE.
+    """
+    header = DV_HEADER.pack(sender, FLAG_DELTA if delta else 0)
+    if np is not None:
+        entries = np.empty(len(dests), dtype=DV_ENTRY_DTYPE)
+        entries['dest'] = dests
+        entries['next_hop'] = next_hops
+        costs = np.asarray(costs, dtype=float)
+        entries['cost'] = np.where(np.isinf(costs), UNREACHABLE, costs)
+        body = header + entries.tobytes()
+    else:
+        body = header + b"".join(DV_ENTRY.pack(dest, next_hop, UNREACHABLE if cost == float('inf') else int(cost))
+                                 for dest, next_hop, cost in zip(dests, next_hops, costs))
+    return FRAME_LENGTH.pack(len(body)) + body
+
+class DVDecoder:
+    """
+    The DVDecoder class decodes the DV announcements of a TCP stream.
+
+    The stream carries no message boundaries: a read may end in the middle of a frame or hold several of them. The decoder keeps the bytes of an incomplete frame until the rest arrives.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Adds the bytes of a read to the stream and decodes the frames completed by them.
+
+        It returns a list of (node index of the sender, True for a delta announcement, destinations, next hops, costs) tuples, an UNREACHABLE cost being decoded as infinity. A frame with an impossible length means the frame boundaries are lost: it is reported and the bytes received so far are dropped.
+        """
+        self.buffer += data
+        announcements = []
+        offset = 0
+        while len(self.buffer) - offset >= FRAME_LENGTH.size:
+            length, = FRAME_LENGTH.unpack_from(self.buffer, offset)
+            if length < DV_HEADER.size or length > MAX_FRAME_SIZE or (length - DV_HEADER.size) % DV_ENTRY.size:
+                print(f"Invalid DV frame length: {length}, dropping {len(self.buffer) - offset} bytes")
+                self.buffer.clear()
+                return announcements
+            end = offset + FRAME_LENGTH.size + length
+            if end > len(self.buffer):
+                break
+            sender, flags = DV_HEADER.unpack_from(self.buffer, offset + FRAME_LENGTH.size)
+            start = offset + FRAME_LENGTH.size + DV_HEADER.size
+            if np is not None:
+                entries = np.frombuffer(self.buffer[start:end], dtype=DV_ENTRY_DTYPE)
+                costs = entries['cost'].astype(float)
+                costs[entries['cost'] == UNREACHABLE] = np.inf
+                announcements.append((sender, bool(flags & FLAG_DELTA), entries['dest'].astype(np.intp), entries['next_hop'].astype(np.intp), costs))
+            else:
+                entries = list(DV_ENTRY.iter_unpack(self.buffer[start:end]))
+                announcements.append((sender, bool(flags & FLAG_DELTA), [dest for dest, _, _ in entries], [next_hop for _, next_hop, _ in entries],
+                                      [float('inf') if cost == UNREACHABLE else float(cost) for _, _, cost in entries]))
+            offset = end
+        del self.buffer[:offset]
+        return announcements
+
+class UpdateTimer:
+    """
+    The UpdateTimer class decides when the node announces its DV table.
+
+    The table is announced every `update_interval` seconds, which refreshes the neighbors and makes up for a lost announcement, and as soon as it changes (a triggered update). A triggered update is held down until `hold_down` seconds after the previous announcement, so a burst of changes goes out as one announcement. A periodic announcement carries the full table, a triggered one only the routes that changed unless a full table was requested.
+    """
+
+    def __init__(self, update_interval, hold_down):
+        self.update_interval = update_interval
+        self.hold_down = hold_down
+        self.next_update = 0.0 # time of the next periodic announcement, the first one is due at once
+        self.last_sent = None
+        self.pending = False # the table changed since the last announcement
+        self.full = False # a full table was requested since the last announcement
+
+    def trigger(self, full=False):
+        """
+        Requests a triggered update, the DV table changed. With `full`, the update carries the full table, for a neighbor that did not get the previous ones.
+        """
+        self.pending = True
+        self.full |= full
+
+    def next_time(self):
+        """
+        Returns the time at which the next announcement is due.
+        """
+        if not self.pending:
+            return self.next_update
+        if self.last_sent is None:
+            return 0.0
+        return min(self.next_update, self.last_sent + self.hold_down)
+
+    def due(self, now):
+        """
+        Returns True if an announcement is due at time `now`.
+        """
+        return now >= self.next_time()
+
+    def full_due(self, now):
+        """
+        Returns True if the announcement due at time `now` carries the full table.
+        """
+        return self.full or now >= self.next_update
+
+    def sent(self, now):
+        """
+        Records an announcement at time `now`, the next periodic one is due `update_interval` seconds later.
+        """
+        self.last_sent = now
+        self.pending = False
+        self.full = False
+        self.next_update = now + self.update_interval
+
 
 # Get the internal IP of the current VM
 my_ip = socket.gethostbyname(socket.gethostname())
@@ -167,74 +565,190 @@ def connect_to_overlay(overlay_port):
         return None
     return sock
 
-def send_dvr(sock):
+def send_dvr(sock, full=True):
     """
-    The send_dvr function sends the current node's distance vector (DV) table to its neighbors. 
+    The send_dvr function sends the current node's distance vector (DV) table to its neighbors.
 
-    It takes one argument:
+    It takes two arguments:
 
     sock: The socket object used for communication.
+    full: True to send the full DV table, False to send only the routes that changed since the last announcement, nothing if none did.
     """
     try:
-        dv_table = rt.get_dv()
-        content = (my_ip, dv_table)
-        data = pickle.dumps(content, -1)
-        sock.sendall(data)
+        dests, next_hops, costs = rt.routes_to_announce(full)
+        if full or len(dests):
+            sock.sendall(encode_dv(rt.me, dests, next_hops, costs, not full))
     except Exception as e:
         print(f"Sending dv table Error: {e}")
         sys.stdout.flush()
 
-def receive_dvr(sock): 
+def receive_dvr(sock, decoder):
     """
-    The receive_dvr function receives a distance vector (DV) table from a neighbor node.
+    The receive_dvr function receives the distance vector (DV) tables of the neighbor nodes.
 
-    It takes one argument:
+    It takes two arguments:
 
     sock: The socket object used for communication.
+    decoder: The DVDecoder of the stream from the overlay.
+
+    It returns None once the overlay closed the connection, otherwise a list of (IP address of the neighbor, True if the DV table of the current node changed) tuples, one per DV table completed by the read.
     """
     try:
-        data = sock.recv(4096)
-        if data:
-            content = pickle.loads(data)
-            ip_addr, dv_table = content
-            sys.stdout.flush()
-            rt.update_routing_table(dv_table, ip_addr)
-    except Exception as e:
+        data = sock.recv(65536)
+    except OSError as e:
         print(f"receiving dv table Error: {e}")
         sys.stdout.flush()
+        return None
+    if not data:
+        return None
+    received = []
+    for sender, delta, dests, next_hops, costs in decoder.feed(data):
+        if sender < len(rt.nodes):
+            received.append((rt.reverse_node_map[rt.nodes[sender]], rt.update_routes(sender, dests, next_hops, costs)))
+    sys.stdout.flush()
+    return received
 
-# parse input arguments
-# <overlay_port> 
-# example: 60000
-if __name__ == '__main__':
-    overlay_port = int(sys.argv[1]) # the port used to send messages to neighbors
-    elements = []
+def read_topology(topology_file):
+    """
+    The read_topology function parses a topology file to retrieve the total number of nodes in the network and the neighbors of the current node with the corresponding cost.
 
-    #Parse the topology.dat file to retrieve the total number of nodes in the network and your neighbors with the corresponding cost
-    with open("topology.dat", "r") as f:
+    It takes one argument:
+
+    topology_file: The path of the topology file, each line holds two nodes and the cost of the link between them.
+
+    It returns a tuple (the nodes in the order they first appear, a table mapping (neighbor, neighbor) to the cost of the link, the largest cost of a link of the network).
+    """
+    elements = []
+    neighbors_table = {}
+    max_link_cost = 0
+    with open(topology_file, "r") as f:
         for line in f:
             try:
                 tokens = line.strip().split()
                 node1 = tokens[0]
                 node2 = tokens[1]
                 link_cost = int(tokens[2])
+                max_link_cost = max(max_link_cost, link_cost)
                 elements.append(node1)
                 elements.append(node2)
-                total_num_nodes = list(dict.fromkeys(elements))
                 if node1 == my_ip:
                     neighbors_table[(node2, node2)] = link_cost
                 elif node2 == my_ip:
                     neighbors_table[(node1,node1)] = link_cost
-            except ValueError as e:
+            except (ValueError, IndexError) as e:
                 print(f"Invalid topology file format: {line} ({e})")
+    return list(dict.fromkeys(elements)), neighbors_table, max_link_cost
 
-    rt = RoutingTable(neighbors_table, total_num_nodes, my_ip)
-    sock = connect_to_overlay(overlay_port)
-    sys.stdout.flush()
+def infinity_bound(num_nodes, max_link_cost):
+    """
+    The infinity_bound function returns the default infinity bound of a network.
+
+    It takes two arguments:
+
+    num_nodes: The number of nodes of the network.
+    max_link_cost: The largest cost of a link of the network.
+
+    A route without loops crosses at most num_nodes - 1 links, so no route of the network costs more than (num_nodes - 1) * max_link_cost. The bound is the next cost, and at least INFINITY, so that small networks keep room for link costs that grow. The larger the bound, the longer a loop counts the cost of a lost destination up to it.
+    """
+    return max(INFINITY, (num_nodes - 1) * max_link_cost + 1)
+
+def update_links(topology_file):
+    """
+    The update_links function applies the link costs of a changed topology file to the routing table.
+
+    It takes one argument:
+
+    topology_file: The path of the topology file.
+
+    A link missing from the file is down. A link to a node that was not a neighbor at the start is ignored, since the routing table has no column for it. It returns True if a link cost changed: the neighbor at the end of a link that came back up needs the full DV table.
+    """
+    try:
+        _, neighbors_table, _ = read_topology(topology_file)
+    except OSError as e:
+        print(f"Reading topology Error: {e}")
+        return False
+    updated = False
+    for col, neighbor in enumerate(rt.neighbors):
+        ip_addr = rt.reverse_node_map[rt.nodes[neighbor]]
+        cost = neighbors_table.get((ip_addr, ip_addr), float('inf'))
+        if cost != rt.link_costs[col]:
+            rt.set_link_cost(ip_addr, cost)
+            updated = True
+    return updated
+
+def run_dvr(sock, topology_file, timer):
+    """
+    The run_dvr function announces the DV table to the neighbors and updates it with theirs until the overlay closes the connection.
+
+    It takes three arguments:
+
+    sock: The socket object used for communication.
+    topology_file: The path of the topology file, checked for link cost changes every TOPOLOGY_CHECK seconds.
+    timer: The UpdateTimer deciding when the DV table is announced.
+
+    Between two announcements it waits for the DV tables of the neighbors. A change of the DV table triggers an update with the routes that changed. The first DV table of a neighbor and a link cost change trigger an update with the full table, so that a node that starts late or a link that comes back up gets every route at once rather than at the next periodic announcement.
+    """
+    heard = set() # neighbors a DV table was received from
+    decoder = DVDecoder()
+    try:
+        mtime = os.stat(topology_file).st_mtime
+    except OSError:
+        mtime = None
+    next_check = time.monotonic() + TOPOLOGY_CHECK
     while True:
-        send_dvr(sock)
-        receive_dvr(sock)
-        time.sleep(5)
+        now = time.monotonic()
+        if timer.due(now):
+            send_dvr(sock, timer.full_due(now))
+            timer.sent(now)
+        if now >= next_check:
+            next_check = now + TOPOLOGY_CHECK
+            try:
+                modified = os.stat(topology_file).st_mtime
+            except OSError:
+                modified = mtime
+            if modified != mtime:
+                mtime = modified
+                if update_links(topology_file):
+                    timer.trigger(full=True)
+        ready, _, _ = select.select([sock], [], [], max(0.0, min(timer.next_time(), next_check) - time.monotonic()))
+        if ready:
+            received = receive_dvr(sock, decoder)
+            if received is None:
+                print("The overlay closed the connection")
+                sys.stdout.flush()
+                return
+            for ip_addr, updated in received:
+                if ip_addr not in heard:
+                    timer.trigger(full=True)
+                    heard.add(ip_addr)
+                elif updated:
+                    timer.trigger()
+
+# parse input arguments
+# <overlay_port> [--topology topology.dat] [--infinity <cost>] [--update-interval 30] [--hold-down 1]
+# example: 60000
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='dvr.py',
+                    description='dvr.py announces the routing table of the node to its neighbors through the overlay and updates it with theirs.')
+    parser.add_argument('overlay_port', type=int, help='the port used to send messages to neighbors')
+    parser.add_argument('--topology', type=str, default='topology.dat', help='the topology file, read again when it changes to apply new link costs')
+    parser.add_argument('--infinity', type=int, default=None, help='the cost from which a destination is unreachable, above the cost of any route; by default (nodes - 1) * the largest link cost + 1, and at least 64')
+    parser.add_argument('--update-interval', type=float, default=UPDATE_INTERVAL, help='seconds between two periodic announcements')
+    parser.add_argument('--hold-down', type=float, default=HOLD_DOWN, help='seconds between an announcement and the next triggered one')
+
+    args = parser.parse_args()
+
+    #Parse the topology.dat file to retrieve the total number of nodes in the network and your neighbors with the corresponding cost
+    total_num_nodes, neighbors_table, max_link_cost = read_topology(args.topology)
+
+    infinity = args.infinity if args.infinity is not None else infinity_bound(len(total_num_nodes), max_link_cost)
+    rt = RoutingTable(neighbors_table, total_num_nodes, my_ip, infinity)
+    sock = connect_to_overlay(args.overlay_port)
+    sys.stdout.flush()
+    if sock is None:
+        sys.exit(1)
+    run_dvr(sock, args.topology, UpdateTimer(args.update_interval, args.hold_down))
 
 
 
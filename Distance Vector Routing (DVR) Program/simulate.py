@@ -0,0 +1,282 @@
+import argparse
+import contextlib
+import heapq # for the events of the simulation, in time order
+import io
+import itertools
+import math
+import os
+import pickle # for the DV tables as they were sent before the binary frames
+import random
+import sys
+import timeit
+
+with contextlib.redirect_stdout(io.StringIO()): # dvr.py prints the internal IP of the machine when imported
+    import dvr
+
+# Seconds a frame takes through the overlay
+DELAY = 0.005
+
+# Seconds simulated before the link change, the tables have settled long before
+SETTLE_TIME = 200.0
+
+class SimulatedTable(dvr.RoutingTable):
+    """
+    The SimulatedTable class is a RoutingTable that neither prints its routing table nor logs it to a file, since a simulation runs every node of the network in one process.
+    """
+
+    def print(self):
+        pass
+
+    def log_dv_table(self):
+        pass
+
+
+def random_topology(num_nodes, seed):
+    """
+    The random_topology function draws a connected network.
+
+    It takes two arguments:
+
+    num_nodes: The number of nodes.
+    seed: The seed of the random costs and links.
+
+    It returns a tuple (the IP addresses of the nodes, a table mapping (node, node) to the cost of the link between them). The links are a random spanning tree plus about num_nodes / 2 other links, with costs from 1 to 10.
+    """
+    r = random.Random(seed)
+    nodes = [f"10.0.{i // 250}.{i % 250}" for i in range(num_nodes)]
+    links = {}
+    for i in range(1, num_nodes):
+        links[(nodes[r.randrange(i)], nodes[i])] = r.randint(1, 10)
+    for _ in range(num_nodes // 2):
+        node1, node2 = r.sample(nodes, 2)
+        if (node1, node2) not in links and (node2, node1) not in links:
+            links[(node1, node2)] = r.randint(1, 10)
+    return nodes, links
+
+def neighbor_costs(nodes, links):
+    """
+    The neighbor_costs function returns a table mapping each node to a table mapping its neighbors to the cost of the link to them.
+    """
+    costs = {node: {} for node in nodes}
+    for (node1, node2), cost in links.items():
+        costs[node1][node2] = cost
+        costs[node2][node1] = cost
+    return costs
+
+def shortest_paths(costs, source):
+    """
+    The shortest_paths function returns a table mapping each node reachable from `source` to the cost of the shortest path to it (Dijkstra).
+    """
+    distances = {source: 0}
+    queue = [(0, source)]
+    while queue:
+        distance, node = heapq.heappop(queue)
+        if distance > distances[node]:
+            continue
+        for neighbor, cost in costs[node].items():
+            if distance + cost < distances.get(neighbor, math.inf):
+                distances[neighbor] = distance + cost
+                heapq.heappush(queue, (distance + cost, neighbor))
+    return distances
+
+def wrong_routes(tables, nodes, links, infinity):
+    """
+    The wrong_routes function counts the routes of the routing tables whose cost is not the cost of the shortest path, a path of `infinity` or more being unreachable.
+    """
+    costs = neighbor_costs(nodes, links)
+    wrong = 0
+    for node in nodes:
+        distances = shortest_paths(costs, node)
+        rt = tables[node]
+        for (dest, _), cost in rt.get_dv().items():
+            expected = distances.get(rt.reverse_node_map[dest], math.inf)
+            if expected != (cost if cost < infinity else math.inf):
+                wrong += 1
+    return wrong
+
+def simulate(nodes, links, change, update_interval, hold_down, triggered, infinity, duration):
+    """
+    The simulate function runs dvr.py on every node of a network, on a virtual clock, and changes the cost of a link once the tables have settled.
+
+    It takes eight arguments:
+
+    nodes, links: The network, as returned by random_topology().
+    change: A tuple (node, node, new cost) of the link changed at SETTLE_TIME, an infinite cost taking the link down. `links` is updated with it.
+    update_interval, hold_down: The announcement timing of every node (see UpdateTimer).
+    triggered: False to announce the tables only every `update_interval` seconds, without triggered updates.
+    infinity: The cost from which a destination is unreachable.
+    duration: The seconds simulated after the change.
+
+    The nodes run the loop of run_dvr(): the announcements are encoded with encode_dv(), they reach the neighbors after DELAY seconds split at a random byte as by a TCP stream, and are decoded with a DVDecoder.
+
+    It returns a tuple (the routing tables, the seconds from the change to the last change of a route, the number of announcements sent after the change).
+    """
+    costs = neighbor_costs(nodes, links)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tables = {node: SimulatedTable({(neighbor, neighbor): cost for neighbor, cost in costs[node].items()}, nodes, node, infinity) for node in nodes}
+    timers = {node: dvr.UpdateTimer(update_interval, hold_down) for node in nodes}
+    decoders = {node: dvr.DVDecoder() for node in nodes}
+    heard = {node: set() for node in nodes}
+    up = {frozenset(link) for link in links}
+    r = random.Random(1)
+    events = []
+    order = itertools.count() # events at the same time run in the order they were scheduled
+    wake = {}
+    now = 0.0
+    last_change = None
+    announcements = 0
+
+    def schedule(node):
+        at = max(timers[node].next_time(), now)
+        if wake.get(node) != at:
+            wake[node] = at
+            heapq.heappush(events, (at, next(order), 'wake', node, None))
+
+    for node in nodes: # the nodes start within a second
+        timers[node].next_update = r.uniform(0, 1)
+        schedule(node)
+    heapq.heappush(events, (SETTLE_TIME, next(order), 'change', None, None))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): # the routing tables print their updates
+        while events:
+            now, _, kind, node, data = heapq.heappop(events)
+            if now > SETTLE_TIME + duration:
+                break
+            if kind == 'wake':
+                if wake.get(node) != now: # rescheduled since
+                    continue
+                if timers[node].due(now):
+                    full = timers[node].full_due(now)
+                    dests, next_hops, route_costs = tables[node].routes_to_announce(full)
+                    if full or len(dests):
+                        frame = dvr.encode_dv(tables[node].me, dests, next_hops, route_costs, not full)
+                        announcements += now >= SETTLE_TIME
+                        for neighbor in costs[node]:
+                            if frozenset((node, neighbor)) in up:
+                                split = r.randrange(len(frame) + 1)
+                                heapq.heappush(events, (now + DELAY, next(order), 'receive', neighbor, frame[:split]))
+                                heapq.heappush(events, (now + DELAY, next(order), 'receive', neighbor, frame[split:]))
+                    timers[node].sent(now)
+                schedule(node)
+            elif kind == 'receive':
+                rt = tables[node]
+                for sender, delta, dests, next_hops, route_costs in decoders[node].feed(data):
+                    updated = rt.update_routes(sender, dests, next_hops, route_costs)
+                    if updated and now >= SETTLE_TIME:
+                        last_change = now
+                    if triggered and sender not in heard[node]:
+                        timers[node].trigger(full=True)
+                        heard[node].add(sender)
+                    elif triggered and updated:
+                        timers[node].trigger()
+                schedule(node)
+            elif kind == 'change':
+                node1, node2, cost = change
+                if cost == math.inf:
+                    up.discard(frozenset((node1, node2)))
+                for node, neighbor in ((node1, node2), (node2, node1)):
+                    if tables[node].set_link_cost(neighbor, cost):
+                        last_change = now
+                    if triggered:
+                        timers[node].trigger(full=True)
+                    schedule(node)
+    node1, node2, cost = change
+    link = (node1, node2) if (node1, node2) in links else (node2, node1)
+    if cost == math.inf:
+        del links[link]
+    else:
+        links[link] = cost
+    return tables, (last_change - SETTLE_TIME if last_change is not None else 0.0), announcements
+
+def convergence(args):
+    """
+    The convergence function raises the cost of a link of a random network, and compares the time the routing tables take to converge, and the announcements sent, with triggered updates and with periodic announcements only.
+
+    It returns the number of wrong routes left at the end.
+    """
+    wrong = 0
+    for label, update_interval, triggered in ((f"triggered updates, full table every {dvr.UPDATE_INTERVAL} s", dvr.UPDATE_INTERVAL, True),
+                                              (f"periodic announcements every {args.periodic_interval:g} s", args.periodic_interval, False)):
+        nodes, links = random_topology(args.nodes, args.seed)
+        node1, node2 = next(iter(links))
+        infinity = args.infinity if args.infinity is not None else dvr.infinity_bound(len(nodes), max(max(links.values()), args.cost))
+        tables, converged, announcements = simulate(nodes, links, (node1, node2, args.cost), update_interval, dvr.HOLD_DOWN, triggered, infinity, args.duration)
+        errors = wrong_routes(tables, nodes, links, infinity)
+        wrong += errors
+        print(f"{label}: converged {converged:.2f} s after the change, {announcements} announcements in {args.duration:g} s"
+              + (f", {errors} wrong routes" if errors else ""))
+    return wrong
+
+def count_to_infinity(args):
+    """
+    The count_to_infinity function takes down the only link to a node d hanging off a loop of three nodes a, b and c, with triggered updates. Poisoned reverse does not break a loop of three nodes: they count the cost of d up, until it reaches the infinity bound.
+
+    It returns the number of wrong routes left at the end with a bound, an unbounded count is expected to go on.
+    """
+    nodes = ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4']
+    wrong = 0
+    for infinity in (args.infinity if args.infinity is not None else dvr.infinity_bound(len(nodes), 1), math.inf):
+        links = {(nodes[0], nodes[1]): 1, (nodes[1], nodes[2]): 1, (nodes[0], nodes[2]): 1, (nodes[2], nodes[3]): 1}
+        tables, converged, announcements = simulate(nodes, links, (nodes[2], nodes[3], math.inf), dvr.UPDATE_INTERVAL, dvr.HOLD_DOWN, True, infinity, args.duration)
+        errors = wrong_routes(tables, nodes, links, infinity)
+        if not errors:
+            print(f"infinity {infinity:g}: d unreachable from every node {converged:.1f} s after the cut, {announcements} announcements")
+            continue
+        cost = max(cost for node in nodes[:3] for (dest, _), cost in tables[node].get_dv().items() if dest == 'd' and cost != math.inf)
+        print(f"infinity {infinity:g}: d still counted up, at cost {cost:g}, {args.duration:g} s after the cut, {announcements} announcements")
+        if infinity != math.inf:
+            wrong += errors
+    return wrong
+
+def message_sizes(args):
+    """
+    The message_sizes function compares a full DV table of a node of a random network, as a binary frame and pickled as dvr.py sent it before, in bytes and in the time taken to build it from the routing table and to update the routing table of a neighbor with it.
+
+    It returns 0, there is nothing to check.
+    """
+    nodes, links = random_topology(args.nodes, args.seed)
+    sender, receiver = next(iter(links))
+    infinity = args.infinity if args.infinity is not None else dvr.infinity_bound(len(nodes), max(links.values()))
+    costs = neighbor_costs(nodes, links)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        sender_table, receiver_table = (SimulatedTable({(neighbor, neighbor): cost for neighbor, cost in costs[node].items()}, nodes, node, infinity)
+                                        for node in (sender, receiver))
+        frame = dvr.encode_dv(sender_table.me, *sender_table.routes_to_announce(True))
+        pickled = pickle.dumps((sender, sender_table.get_dv()), -1)
+        times = {
+            'binary send': timeit.timeit(lambda: dvr.encode_dv(sender_table.me, *sender_table.routes_to_announce(True)), number=args.repeat),
+            'binary receive': timeit.timeit(lambda: [receiver_table.update_routes(node, dests, next_hops, route_costs)
+                                                     for node, _, dests, next_hops, route_costs in dvr.DVDecoder().feed(frame)], number=args.repeat),
+            'pickle send': timeit.timeit(lambda: pickle.dumps((sender, sender_table.get_dv()), -1), number=args.repeat),
+            'pickle receive': timeit.timeit(lambda: receiver_table.update_routing_table(*reversed(pickle.loads(pickled))), number=args.repeat),
+        }
+    print(f"full DV table of {args.nodes} nodes: {len(frame)} bytes binary, {len(pickled)} bytes pickled")
+    for label, seconds in times.items():
+        print(f"{label}: {seconds / args.repeat * 1000:.3f} ms")
+    return 0
+
+EXPERIMENTS = {
+    'convergence': convergence,
+    'count-to-infinity': count_to_infinity,
+    'sizes': message_sizes,
+}
+
+# parse input arguments
+# [experiment] [--nodes 40] [--seed 3] [--cost 30] [--periodic-interval 5] [--infinity <cost>] [--duration 600] [--repeat 200]
+# example: convergence
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='simulate.py',
+                    description='simulate.py runs dvr.py on every node of a simulated network, on a virtual clock, and measures how fast the routing tables converge after a link change, or the size of the DV announcements.')
+    parser.add_argument('experiment', type=str, nargs='?', default='convergence', choices=list(EXPERIMENTS))
+    parser.add_argument('--nodes', type=int, default=40, help='the number of nodes of the random network')
+    parser.add_argument('--seed', type=int, default=3, help='the seed of the random network')
+    parser.add_argument('--cost', type=int, default=30, help='the new cost of the changed link')
+    parser.add_argument('--periodic-interval', type=float, default=5, help='seconds between two announcements without triggered updates')
+    parser.add_argument('--infinity', type=int, default=None, help='the cost from which a destination is unreachable, by default as dvr.py derives it from the network (see infinity_bound())')
+    parser.add_argument('--duration', type=float, default=600, help='seconds simulated after the link change')
+    parser.add_argument('--repeat', type=int, default=200, help='times each DV table is encoded and decoded by the sizes experiment')
+
+    args = parser.parse_args()
+
+    if EXPERIMENTS[args.experiment](args):
+        sys.exit(1)
@@ -0,0 +1,170 @@
+import pytest
+import dvr
+
+INF = float('inf')
+
+# Announcements as (sender, delta, dests, next_hops, costs)
+ANNOUNCEMENTS = [
+    (0, False, [0, 1, 2, 3], [0, 1, 1, dvr.NO_HOP], [0.0, 4.0, 7.0, INF]),
+    (3, True, [2], [1], [5.0]),
+    (65534, False, [], [], []),
+]
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def codec(request, monkeypatch):
+    """
+    runs a test with the NumPy codec and with the struct fallback
+    """
+    if request.param == 'numpy':
+        if dvr.np is None:
+            pytest.skip('NumPy is not installed')
+    else:
+        monkeypatch.setattr(dvr, 'np', None)
+    return request.param
+
+
+def as_lists(announcements):
+    return [(sender, delta, list(map(int, dests)), list(map(int, next_hops)), list(map(float, costs)))
+            for sender, delta, dests, next_hops, costs in announcements]
+
+
+def encode(announcement):
+    sender, delta, dests, next_hops, costs = announcement
+    return dvr.encode_dv(sender, dests, next_hops, costs, delta)
+
+
+def stream():
+    return b''.join(map(encode, ANNOUNCEMENTS))
+
+
+def test_round_trip(codec):
+    for announcement in ANNOUNCEMENTS:
+        frame = encode(announcement)
+        assert len(frame) == dvr.FRAME_LENGTH.size + dvr.DV_HEADER.size + dvr.DV_ENTRY.size * len(announcement[2])
+        assert as_lists(dvr.DVDecoder().feed(frame)) == [announcement]
+
+
+def test_unreachable_cost_is_encoded_as_the_sentinel(codec):
+    frame = dvr.encode_dv(1, [2], [dvr.NO_HOP], [INF])
+    assert frame[-dvr.DV_ENTRY.size:] == dvr.DV_ENTRY.pack(2, dvr.NO_HOP, dvr.UNREACHABLE)
+
+
+def test_several_frames_in_one_chunk(codec):
+    assert as_lists(dvr.DVDecoder().feed(stream())) == ANNOUNCEMENTS
+
+
+def test_split_at_every_byte_boundary(codec):
+    data = stream()
+    for split in range(len(data) + 1):
+        decoder = dvr.DVDecoder()
+        decoded = decoder.feed(data[:split]) + decoder.feed(data[split:])
+        assert as_lists(decoded) == ANNOUNCEMENTS, split
+        assert not decoder.buffer
+
+
+def test_one_byte_at_a_time(codec):
+    data = stream()
+    decoder = dvr.DVDecoder()
+    decoded = []
+    for i in range(len(data)):
+        decoded += decoder.feed(data[i:i + 1])
+    assert as_lists(decoded) == ANNOUNCEMENTS
+
+
+def test_truncated_body_waits_for_the_rest(codec):
+    frame = encode(ANNOUNCEMENTS[0])
+    decoder = dvr.DVDecoder()
+    assert decoder.feed(frame[:-1]) == []
+    assert len(decoder.buffer) == len(frame) - 1
+    assert as_lists(decoder.feed(frame[-1:])) == [ANNOUNCEMENTS[0]]
+
+
+@pytest.mark.parametrize('length', [dvr.MAX_FRAME_SIZE + 1, 0xFFFFFFFF, dvr.DV_HEADER.size - 1, dvr.DV_HEADER.size + 1])
+def test_invalid_length_drops_the_stream(codec, length):
+    decoder = dvr.DVDecoder()
+    valid = dvr.encode_dv(1, [0], [0], [3.0])
+    # The frames decoded before the invalid length are kept, the rest of the read is dropped
+    decoded = decoder.feed(valid + dvr.FRAME_LENGTH.pack(length) + bytes(16) + valid)
+    assert as_lists(decoded) == [(1, False, [0], [0], [3.0])]
+    assert not decoder.buffer
+    # The decoder starts over with the next read
+    assert as_lists(decoder.feed(valid)) == [(1, False, [0], [0], [3.0])]
+
+
+def test_oversized_length_is_rejected_before_its_body_arrives(codec):
+    decoder = dvr.DVDecoder()
+    assert decoder.feed(dvr.FRAME_LENGTH.pack(dvr.MAX_FRAME_SIZE + dvr.DV_ENTRY.size)) == []
+    assert not decoder.buffer
+
+
+def test_largest_frame_is_accepted(codec):
+    dests = list(range(dvr.MAX_NODES))
+    frame = dvr.encode_dv(0, dests, dests, [1.0] * dvr.MAX_NODES)
+    assert len(frame) == dvr.FRAME_LENGTH.size + dvr.MAX_FRAME_SIZE
+    (sender, delta, decoded, _, costs), = dvr.DVDecoder().feed(frame)
+    assert list(map(int, decoded)) == dests
+    assert len(costs) == dvr.MAX_NODES
+
+
+CHAIN = [f"10.0.0.{i}" for i in range(12)]
+
+
+@pytest.fixture
+def chain_table(tmp_path, monkeypatch):
+    """
+    returns a function building the routing table of the first node of a chain of links of cost 10, the log file goes to a temporary directory
+    """
+    monkeypatch.chdir(tmp_path)
+    return lambda infinity: dvr.RoutingTable({(CHAIN[1], CHAIN[1]): 10}, CHAIN, CHAIN[0], infinity)
+
+
+def test_infinity_bound():
+    assert dvr.infinity_bound(3, 7) == dvr.INFINITY
+    assert dvr.infinity_bound(12, 10) == 111
+    assert dvr.infinity_bound(2000, 10) == 19991
+
+
+def test_route_costing_more_than_64_survives(codec, chain_table):
+    rt = chain_table(dvr.infinity_bound(len(CHAIN), 10))
+    # The neighbor reaches the end of the chain through 10 links
+    assert rt.update_routes(1, [11], [2], [100.0])
+    assert rt.get_dv()[(rt.nodes[11], rt.nodes[1])] == 110
+
+
+def test_route_reaching_the_bound_is_unreachable(codec, chain_table):
+    rt = chain_table(dvr.INFINITY)
+    assert not rt.update_routes(1, [11], [2], [100.0])
+    assert rt.get_dv()[(rt.nodes[11], rt.nodes[1])] == INF
+
+
+def test_read_topology_returns_the_largest_link_cost(tmp_path, monkeypatch):
+    monkeypatch.setattr(dvr, 'my_ip', '10.0.0.1')
+    topology = tmp_path / 'topology.dat'
+    topology.write_text("10.0.0.1 10.0.0.2 7\n10.0.0.2 10.0.0.3 40\n10.0.0.1 10.0.0.3 2\n")
+    nodes, neighbors_table, max_link_cost = dvr.read_topology(topology)
+    assert nodes == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert neighbors_table == {('10.0.0.2', '10.0.0.2'): 7, ('10.0.0.3', '10.0.0.3'): 2}
+    assert max_link_cost == 40
+
+
+def test_node_names():
+    assert dvr.node_names(3) == ['a', 'b', 'c']
+    assert dvr.node_names(26)[-1] == 'z'
+    assert dvr.node_names(27) == [str(i) for i in range(27)]
+    # Every name of the largest network can be printed
+    names = dvr.node_names(dvr.MAX_NODES)
+    assert len(set(names)) == dvr.MAX_NODES
+    '\n'.join(names).encode('utf-8')
+
+
+def test_large_network_names_nodes_by_index(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    nodes = [f"10.0.0.{i}" for i in range(30)]
+    rt = dvr.RoutingTable({(nodes[1], nodes[1]): 4}, nodes, nodes[0])
+    assert rt.my_node == '0'
+    assert rt.reverse_node_map['29'] == nodes[29]
+    assert rt.get_dv()[('1', '1')] == 4
+    out = capsys.readouterr().out
+    assert "Node 29 has IP address 10.0.0.29" in out
+    assert "to 1\t(4, via 1)" in out
@@ -1,19 +1,25 @@
 
 import sys
 from mrt_client import Client
+from segmentClass import MAX_SEGMENT_SIZE
 
 # parse input arguments
-# <client_port> <network_addr> <network_port> <segment_size>
-# example: 50000 127.0.0.1 51000 1460
+# <client_port> <network_addr> <network_port> <segment_size> [transfer_mode] [congestion_control] [fec_block]
+# example: 50000 127.0.0.1 51000 1460 sr cubic 8
+# a segment_size of 'auto' offers the largest segment the server accepts and adapts the segment size to the corruption of the link
 if __name__ == '__main__':
     client_port = int(sys.argv[1]) # the port the client is using to send segments
     server_addr = sys.argv[2] # the address of the server/network simulator
     server_port = int(sys.argv[3]) # the port of the server/network simulator
-    segment_size = int(sys.argv[4]) # the maximum size of a segment (including the header)
+    adapt = sys.argv[4] == 'auto' # adapt the segment size to the corruption rate reported by the server
+    segment_size = MAX_SEGMENT_SIZE if adapt else int(sys.argv[4]) # the maximum size of a segment (including the header)
+    mode = sys.argv[5] if len(sys.argv) > 5 else 'sr' # 'sr' (selective-repeat) or 'gbn' (go-back-n)
+    congestion = sys.argv[6] if len(sys.argv) > 6 else 'reno' # 'reno' or 'cubic'
+    fec = int(sys.argv[7]) if len(sys.argv) > 7 else 0 # data segments per parity segment, 0 to disable forward error correction
 
     # initialize and connect to the server
     client = Client()
-    client.init(client_port, server_addr, server_port, segment_size)
+    client.init(client_port, server_addr, server_port, segment_size, mode, congestion, fec=fec, adapt_segment_size=adapt)
     client.connect()
 
     # open a file and send it to the server
@@ -21,6 +27,7 @@ if __name__ == '__main__':
         data = f.read()
     sent = client.send(data)
     print(f">> sent {sent} bytes of data")
+    print(f">> congestion state {client.congestion_state()}")
     
     # close the connection
     client.close()
@@ -0,0 +1,362 @@
+import asyncio # for the event loop the endpoints are registered with
+import ctypes # for recvmmsg and sendmmsg
+import ctypes.util
+import errno
+import mmap # for buffers that only take memory for the bytes actually used
+import os
+import socket
+import struct
+import sys
+
+# Number of datagrams read or written by one system call
+BATCH_SIZE = 32
+
+# Size of a datagram slot of the batch buffers, the largest UDP payload fits
+MAX_DATAGRAM = 65536
+
+# Size of the address slot of a message (struct sockaddr_storage)
+SOCKADDR_SIZE = 128
+
+# Socket buffer size requested for the endpoints, so that a burst of a window of segments is not dropped by the kernel (capped by net.core.rmem_max and wmem_max)
+SOCKET_BUFFER = 4 * 1024 * 1024
+
+MSG_DONTWAIT = 0x40
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.c_void_p), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', msghdr), ('msg_len', ctypes.c_uint)]
+
+
+def load_mmsg():
+    """
+    return the recvmmsg and sendmmsg functions of the C library, or None where they are not available (outside of Linux, or without ctypes support)
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        recvmmsg, sendmmsg = libc.recvmmsg, libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return recvmmsg, sendmmsg
+
+MMSG = load_mmsg()
+
+
+def encode_address(family, addr):
+    """
+    return the C socket address (struct sockaddr_in or sockaddr_in6) of a resolved address tuple
+    """
+    if family == socket.AF_INET:
+        return struct.pack('=H', family) + struct.pack('!H', addr[1]) + socket.inet_pton(family, addr[0]) + bytes(8)
+    return struct.pack('=H', family) + struct.pack('!HI', addr[1], addr[2]) + socket.inet_pton(family, addr[0]) + struct.pack('=I', addr[3])
+
+
+def decode_address(raw):
+    """
+    return the address tuple of a C socket address, in the form socket.recvfrom returns it
+    """
+    family = int.from_bytes(raw[:2], sys.byteorder)
+    port = int.from_bytes(raw[2:4], 'big')
+    if family == socket.AF_INET:
+        return (socket.inet_ntop(family, raw[4:8]), port)
+    return (socket.inet_ntop(family, raw[8:24]), port, int.from_bytes(raw[4:8], 'big'), int.from_bytes(raw[24:28], sys.byteorder))
+
+
+class MessageVector:
+    """
+    The preallocated message headers, scatter/gather entries and buffers of one direction of batched I/O.
+
+    Every message of the vector owns a slot of MAX_DATAGRAM bytes and an address slot. The slots are anonymous memory maps, so only the pages a datagram actually touches take memory.
+    """
+
+    def __init__(self, size=BATCH_SIZE):
+        """
+        arguments:
+        size -- the number of messages of the vector
+        """
+        self.data = mmap.mmap(-1, size * MAX_DATAGRAM)
+        self.names = mmap.mmap(-1, size * SOCKADDR_SIZE)
+        data_base = ctypes.addressof(ctypes.c_char.from_buffer(self.data))
+        name_base = ctypes.addressof(ctypes.c_char.from_buffer(self.names))
+        self.iovecs = (iovec * size)()
+        self.headers = (mmsghdr * size)()
+        for i in range(size):
+            self.iovecs[i].iov_base = data_base + i * MAX_DATAGRAM
+            self.iovecs[i].iov_len = MAX_DATAGRAM
+            hdr = self.headers[i].msg_hdr
+            hdr.msg_name = name_base + i * SOCKADDR_SIZE
+            hdr.msg_namelen = SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.addressof(self.iovecs[i])
+            hdr.msg_iovlen = 1
+        self.pointer = ctypes.addressof(self.headers)
+
+
+class BatchedDatagramTransport(asyncio.DatagramTransport):
+    """
+    A datagram transport that reads and writes many datagrams per system call.
+
+    The asyncio datagram transport reads one datagram each time the selector reports the socket readable, and writes each datagram with its own sendto. This transport drains up to BATCH_SIZE datagrams per readiness event with one recvmmsg, and queues the datagrams the protocol sends during one callback (a window of segments, a burst of acknowledgments) to write them with one sendmmsg at the next iteration of the event loop. Where recvmmsg and sendmmsg are not available it falls back to loops of non-blocking recvfrom and sendto calls, which still save one select per datagram.
+
+    A queued datagram is copied once, by sendto, straight into the next free slot of the outgoing message vectors, where sendmmsg reads it. There are as many vectors as the largest burst needs; they are kept and reused from the first slot once the queue is empty.
+
+    Datagrams are handed to the protocol as bytes, in the order they arrived, with addresses in the form of socket.recvfrom.
+    """
+
+    def __init__(self, loop, sock, protocol, mmsg=MMSG):
+        """
+        arguments:
+        loop -- the selector event loop watching the socket
+        sock -- the bound, non-blocking UDP socket
+        protocol -- the datagram protocol receiving the datagrams
+        mmsg -- the recvmmsg and sendmmsg functions, None for the fallback
+        """
+        super().__init__()
+        self.loop = loop
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.family = sock.family
+        self.protocol = protocol
+        self.mmsg = mmsg
+        self.closing = False
+        self.pending = [] # datagrams waiting for the next flush without sendmmsg, (bytes, address)
+        self.flush_scheduled = False
+        self.writing = False # set while the socket buffer is full and the writer callback waits for room
+        self.peers = {} # address given by the protocol -> (resolved address, C socket address)
+        self.names = {} # C socket address -> address tuple
+        if mmsg is not None:
+            self.received = MessageVector()
+            self.outgoing = [MessageVector()] # the datagrams waiting for the next flush, BATCH_SIZE per vector
+            self.head = 0 # index of the first queued datagram not yet written, in the slots of all the outgoing vectors
+            self.tail = 0 # index of the first free slot
+        loop.add_reader(self.fd, self.read_ready)
+
+    def get_extra_info(self, name, default=None):
+        if name == 'socket':
+            return self.sock
+        if name == 'sockname':
+            return self.sock.getsockname()
+        return default
+
+    def is_closing(self):
+        return self.closing
+
+    def sendto(self, data, addr=None):
+        """
+        queue a datagram, it is sent with the others queued during the same iteration of the event loop
+
+        the data is copied into the slot of the datagram in the outgoing vectors (or into a bytes object without sendmmsg), so the caller may reuse its buffer right away
+        """
+        if self.closing:
+            return
+        if self.mmsg is None:
+            self.pending.append((bytes(data), addr))
+        else:
+            vector, i = divmod(self.tail, BATCH_SIZE)
+            if vector == len(self.outgoing):
+                self.outgoing.append(MessageVector())
+            vector = self.outgoing[vector]
+            try:
+                name = self.peer(addr)[1]
+            except OSError as exc:
+                self.protocol.error_received(exc)
+                return
+            vector.data[i * MAX_DATAGRAM:i * MAX_DATAGRAM + len(data)] = data
+            vector.names[i * SOCKADDR_SIZE:i * SOCKADDR_SIZE + len(name)] = name
+            vector.iovecs[i].iov_len = len(data)
+            vector.headers[i].msg_hdr.msg_namelen = len(name)
+            self.tail += 1
+        if not self.flush_scheduled and not self.writing:
+            self.flush_scheduled = True
+            self.loop.call_soon(self.flush)
+
+    def peer(self, addr):
+        """
+        return the resolved address and the C socket address of a destination, resolved once
+        """
+        entry = self.peers.get(addr)
+        if entry is None:
+            resolved = socket.getaddrinfo(addr[0], addr[1], self.family, socket.SOCK_DGRAM)[0][4]
+            entry = self.peers[addr] = (resolved, encode_address(self.family, resolved))
+        return entry
+
+    def queued(self):
+        """
+        return the number of datagrams waiting for the next flush
+        """
+        return len(self.pending) if self.mmsg is None else self.tail - self.head
+
+    def dequeue(self, count):
+        """
+        drop the first queued datagrams, once written or failed
+        """
+        if self.mmsg is None:
+            del self.pending[:count]
+            return
+        self.head += count
+        if self.head == self.tail:
+            self.head = self.tail = 0
+
+    def flush(self):
+        """
+        write the queued datagrams, BATCH_SIZE per system call, until the queue is empty or the socket buffer is full
+        """
+        self.flush_scheduled = False
+        while self.queued():
+            try:
+                sent = self.send_batch()
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError as exc:
+                # The first datagram failed (e.g. unreachable destination), drop it like a lost datagram
+                self.dequeue(1)
+                self.protocol.error_received(exc)
+                continue
+            if sent == 0:
+                if not self.writing and not self.closing:
+                    self.writing = True
+                    self.loop.add_writer(self.fd, self.write_ready)
+                return
+            self.dequeue(sent)
+        if self.writing:
+            self.writing = False
+            self.loop.remove_writer(self.fd)
+
+    def write_ready(self):
+        self.flush()
+
+    def send_batch(self):
+        """
+        write the first queued datagrams, at most BATCH_SIZE and never past the end of an outgoing vector
+
+        return:
+        the number of datagrams written, the first ones of the queue
+        """
+        if self.mmsg is None:
+            batch = self.pending[:BATCH_SIZE]
+            for i, (data, addr) in enumerate(batch):
+                try:
+                    self.sock.sendto(data, self.peer(addr)[0])
+                except (BlockingIOError, InterruptedError):
+                    return i
+                except OSError:
+                    if i == 0:
+                        raise
+                    return i
+            return len(batch)
+        vector, i = divmod(self.head, BATCH_SIZE)
+        count = min(BATCH_SIZE - i, self.tail - self.head)
+        sent = self.mmsg[1](self.fd, self.outgoing[vector].pointer + i * ctypes.sizeof(mmsghdr), count, MSG_DONTWAIT)
+        if sent < 0:
+            code = ctypes.get_errno()
+            raise BlockingIOError() if code in (errno.EAGAIN, errno.EWOULDBLOCK) else OSError(code, os.strerror(code))
+        return sent
+
+    def read_ready(self):
+        """
+        read up to BATCH_SIZE datagrams and hand them to the protocol
+        """
+        if self.mmsg is None:
+            for _ in range(BATCH_SIZE):
+                if self.closing:
+                    return
+                try:
+                    data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError as exc:
+                    self.protocol.error_received(exc)
+                    return
+                self.protocol.datagram_received(data, addr)
+            return
+        vector = self.received
+        for i in range(BATCH_SIZE):
+            vector.headers[i].msg_hdr.msg_namelen = SOCKADDR_SIZE
+        count = self.mmsg[0](self.fd, vector.pointer, BATCH_SIZE, MSG_DONTWAIT, None)
+        if count < 0:
+            code = ctypes.get_errno()
+            if code not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                self.protocol.error_received(OSError(code, os.strerror(code)))
+            return
+        for i in range(count):
+            if self.closing:
+                return
+            header = vector.headers[i]
+            raw = vector.names[i * SOCKADDR_SIZE:i * SOCKADDR_SIZE + header.msg_hdr.msg_namelen]
+            addr = self.names.get(raw)
+            if addr is None:
+                addr = self.names[raw] = decode_address(raw)
+            self.protocol.datagram_received(vector.data[i * MAX_DATAGRAM:i * MAX_DATAGRAM + header.msg_len], addr)
+
+    def close(self):
+        """
+        write what is still queued, as far as the socket buffer allows, and close the socket
+        """
+        if self.closing:
+            return
+        self.flush()
+        self.closing = True
+        self.loop.remove_reader(self.fd)
+        if self.writing:
+            self.loop.remove_writer(self.fd)
+        self.sock.close()
+        self.loop.call_soon(self.protocol.connection_lost, None)
+
+    def abort(self):
+        self.pending.clear()
+        if self.mmsg is not None:
+            self.head = self.tail = 0
+        self.close()
+
+
+async def create_endpoint(loop, protocol_factory, local_addr, family=socket.AF_INET):
+    """
+    create a UDP endpoint bound to a local address, with batched I/O on selector event loops
+
+    loops that provide their own datagram endpoints (simulated loops set batched_io to False) or have no selector (the proactor loop of Windows) get the endpoint of loop.create_datagram_endpoint
+
+    arguments:
+    loop -- the event loop
+    protocol_factory -- returns the datagram protocol of the endpoint
+    local_addr -- the (host, port) to bind to, the first address of the family the host resolves to that can be bound is used
+    family -- the address family of the socket, IPv4 by default: network.py forwards to IPv4 addresses, and 'localhost' may resolve to ::1 first
+
+    the socket buffers are enlarged to SOCKET_BUFFER, as far as the system allows
+
+    return:
+    the transport and the protocol
+    """
+    if not getattr(loop, 'batched_io', True) or not isinstance(loop, asyncio.SelectorEventLoop):
+        return await loop.create_datagram_endpoint(protocol_factory, local_addr=local_addr, family=family)
+    error = None
+    for family, kind, proto, _, addr in await loop.getaddrinfo(local_addr[0], local_addr[1], family=family, type=socket.SOCK_DGRAM):
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.setblocking(False)
+            for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+                sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+            sock.bind(addr)
+        except OSError as exc:
+            sock.close()
+            error = exc
+            continue
+        protocol = protocol_factory()
+        transport = BatchedDatagramTransport(loop, sock, protocol)
+        protocol.connection_made(transport)
+        return transport, protocol
+    raise error or OSError(f"Cannot bind to {local_addr}")
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3.10
+import argparse
+import asyncio # for the event loop of the udp backend
+import contextlib
+import csv
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess # to record the commit that was measured
+import sys
+import time
+import batch_io # for the socket of the relay, like those of the endpoints
+import network # for the loss file, the link model and the bit errors
+import simulation # for the virtual-clock backend, the transfer scenario and the loss profiles
+
+# Columns of the CSV output, in order
+FIELDS = ['backend', 'profile', 'size', 'segment_size', 'receive_buffer_size', 'mode', 'congestion', 'fec', 'seed',
+          'ok', 'completion_time', 'goodput', 'segments', 'transmissions', 'retransmission_ratio', 'timeouts', 'parities',
+          'datagrams', 'dropped', 'cpu_per_mb', 'error']
+
+
+class Relay(simulation.Channel, asyncio.DatagramProtocol):
+    """
+    A lossy link between a client and a server over real UDP sockets, on the event loop of the endpoints.
+
+    It is the Channel of simulation.py with a socket in place of the in-memory endpoints: it forwards the datagrams of the client to the server and back through the same link model, but the delayed datagrams are callbacks of the event loop: the relay, the client and the server share one thread, so the CPU time measured is the cost of the protocol and its link only.
+    """
+
+    def __init__(self, client_addr, server_addr, loss, link):
+        """
+        arguments:
+        client_addr -- the address of the client
+        server_addr -- the address of the server
+        loss -- the loss table of the profile
+        link -- the link table of the profile
+        """
+        super().__init__(loss, link)
+        self.client_addr = client_addr
+        self.server_addr = server_addr
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+
+    def datagram_received(self, data, addr):
+        self.send(data, addr, self.client_addr if addr == self.server_addr else self.server_addr)
+
+    def deliver(self, arrival):
+        for data, src, dst in self.arrivals.pop(arrival):
+            self.transport.sendto(data, dst)
+
+
+async def udp_transfer(data, loss, link, port, segment_size, receive_buffer_size, mode, congestion, fec):
+    """
+    run one transfer over real UDP sockets through a Relay
+
+    return:
+    the bytes received by the server, the AsyncClient, the Relay and the completion time in seconds
+    """
+    loop = asyncio.get_running_loop()
+    relay = Relay(('127.0.0.1', port + 1), ('127.0.0.1', port + 2), loss, link)
+    transport, _ = await batch_io.create_endpoint(loop, lambda: relay, ('127.0.0.1', port))
+    try:
+        start = loop.time()
+        received, client = await simulation.transfer(data, segment_size, receive_buffer_size, mode, congestion, 'auto', port + 2, port + 1, port, fec)
+        return received, client, relay, loop.time() - start
+    finally:
+        transport.close()
+
+
+def run_case(backend, data, loss, link, seed, segment_size, receive_buffer_size, mode, congestion, fec, port, timeout):
+    """
+    run one transfer and measure it
+
+    arguments:
+    backend -- 'sim' for the virtual clock of simulation.py, 'udp' for real sockets on the local host
+    data -- the bytes to send
+    loss, link -- the loss and link tables of the profile
+    seed -- the seed of the random generators of the link
+    segment_size, receive_buffer_size, mode, congestion, fec -- the parameters of the client and server
+    port -- the first of the three ports used by the udp backend
+    timeout -- the time after which the transfer is abandoned, in seconds (virtual seconds for the sim backend)
+
+    return:
+    a dict with the measurements of FIELDS
+    """
+    network.seedRandom(seed)
+    result = {'ok': False, 'error': ''}
+    cpu = time.process_time()
+    if backend == 'sim':
+        sim = simulation.run_transfer(data, loss, link, seed, segment_size, receive_buffer_size, mode, congestion, timeout=timeout, fec=fec)
+        cpu = time.process_time() - cpu
+        result.update(ok=sim['ok'], completion_time=sim['duration'], datagrams=sim['datagrams'], dropped=sim['dropped'], error=sim.get('error', ''))
+        result.update(segments=sim.get('segments', 0), transmissions=sim.get('transmissions', 0), timeouts=sim.get('timeouts', 0), parities=sim.get('parities', 0))
+    else:
+        loop = asyncio.new_event_loop()
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                received, client, relay, elapsed = loop.run_until_complete(asyncio.wait_for(udp_transfer(data, loss, link, port, segment_size, receive_buffer_size, mode, congestion, fec), timeout))
+            result.update(ok=received == data, completion_time=elapsed, datagrams=relay.sent, dropped=relay.dropped)
+            if not result['ok']:
+                result['error'] = f"data mismatch at offset {simulation.first_difference(received, data)} ({len(received)} bytes received, {len(data)} sent)"
+            result.update(segments=client.num_segments, transmissions=client.metrics.transmissions, timeouts=client.metrics.timeouts, parities=client.metrics.parities_sent)
+        except Exception as e:
+            result.update(error=repr(e), completion_time=None, segments=0, transmissions=0, timeouts=0, parities=0, datagrams=0, dropped=0)
+        finally:
+            loop.close()
+        cpu = time.process_time() - cpu
+    mb = len(data) / 1e6
+    result['goodput'] = len(data) / result['completion_time'] if result['ok'] and result['completion_time'] else 0.0
+    result['retransmission_ratio'] = (result['transmissions'] - result['segments']) / result['segments'] if result['segments'] else 0.0
+    result['cpu_per_mb'] = cpu / mb if mb else 0.0
+    return result
+
+
+def run_matrix(backend, sizes, segment_sizes, buffer_sizes, profiles, modes=('sr',), congestions=('reno',), repeat=1, seed=0, port=57000, timeout=600, fecs=(0,)):
+    """
+    run every combination of the parameters and return one record per transfer
+
+    arguments:
+    backend -- 'sim' or 'udp'
+    sizes -- the payload sizes in bytes
+    segment_sizes -- the segment sizes of the client
+    buffer_sizes -- the receive buffer sizes of the server
+    profiles -- the loss profiles, names of simulation.SCENARIOS or paths of loss files
+    modes -- the transfer modes, 'sr' and/or 'gbn'
+    congestions -- the congestion control strategies
+    repeat -- the number of transfers of each combination, with the seeds seed, seed + 1...
+    seed -- the first seed
+    port -- the first port of the udp backend, each transfer uses the next three ports
+    timeout -- the time after which a transfer is abandoned, in seconds
+    fecs -- the FEC block sizes of the client, 0 without forward error correction; go-back-n is only run without it
+
+    return:
+    a list of dicts with the keys of FIELDS
+    """
+    records = []
+    tables = {profile: simulation.load_scenario(profile) for profile in profiles}
+    for profile, size, segment_size, buffer_size, mode, congestion, fec, i in itertools.product(profiles, sizes, segment_sizes, buffer_sizes, modes, congestions, fecs, range(repeat)):
+        if fec and mode != 'sr':
+            continue
+        data = random.Random(seed + i).randbytes(size)
+        loss, link = tables[profile]
+        record = {'backend': backend, 'profile': profile, 'size': size, 'segment_size': segment_size, 'receive_buffer_size': buffer_size,
+                  'mode': mode, 'congestion': congestion, 'fec': fec, 'seed': seed + i}
+        record.update(run_case(backend, data, loss, link, seed + i, segment_size, buffer_size, mode, congestion, fec, port, timeout))
+        port += 3
+        records.append(record)
+        print(f"{profile} size={size} segment={segment_size} buffer={buffer_size} {mode}/{congestion} fec={fec} seed={seed + i}: "
+              f"ok={record['ok']} goodput={record['goodput'] / 1000:.0f}KB/s retransmissions={record['retransmission_ratio']:.3f} cpu={record['cpu_per_mb']:.3f}s/MB")
+    return records
+
+
+def commit_id():
+    """
+    return the git commit of the working tree, with a '+' when it has uncommitted changes, or None outside of a git repository
+    """
+    try:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no', '.'], cwd=directory, capture_output=True, text=True).stdout.strip()
+        return commit + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, records):
+    """
+    write the records to a JSON file (with the commit, host and time of the run) or to a CSV file, depending on the extension of the path
+    """
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(records)
+        return
+    meta = {'commit': commit_id(), 'python': platform.python_version(), 'machine': platform.machine(), 'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': records}, f, indent=1)
+
+
+def compare(path, records):
+    """
+    print the change of goodput and CPU per MB of every combination against an earlier JSON result file, skipping the combinations that failed in either run
+    """
+    with open(path) as f:
+        old = json.load(f)
+    # Results written before the FEC column ran without forward error correction
+    key = lambda r: tuple(r.get(k, 0) for k in FIELDS[:9])
+    baseline = {key(r): r for r in old['results']}
+    print(f"compared to {old['meta'].get('commit')}:")
+    for r in records:
+        b = baseline.get(key(r))
+        if b is None or not r['ok'] or not b['ok'] or not b['goodput'] or not b['cpu_per_mb']:
+            continue
+        print(f"  {r['profile']} size={r['size']} segment={r['segment_size']} buffer={r['receive_buffer_size']} {r['mode']}/{r['congestion']} fec={r.get('fec', 0)} seed={r['seed']}: "
+              f"goodput {r['goodput'] / b['goodput'] - 1:+.1%} cpu/MB {r['cpu_per_mb'] / b['cpu_per_mb'] - 1:+.1%}")
+
+
+def integers(text):
+    return [int(v) for v in text.split(',')]
+
+
+if __name__ == '__main__':
+    # accepts commandline arguments
+    parser = argparse.ArgumentParser(
+                    prog='benchmark.py',
+                    description='benchmark.py measures MRT goodput, retransmissions, completion time and CPU cost over a matrix of parameters and loss profiles.')
+    parser.add_argument('--backend', choices=['sim', 'udp'], default='sim', help='virtual clock (deterministic) or real UDP sockets')
+    parser.add_argument('--sizes', type=integers, default=[100000, 1000000], help='comma separated payload sizes in bytes')
+    parser.add_argument('--segment-sizes', type=integers, default=[1460], help='comma separated segment sizes')
+    parser.add_argument('--buffer-sizes', type=integers, default=[65536], help='comma separated receive buffer sizes')
+    parser.add_argument('--profiles', type=lambda text: text.split(','), default=['clean', 'loss1', 'loss5'], help=f'comma separated loss files or profiles among {", ".join(simulation.SCENARIOS)}')
+    parser.add_argument('--modes', type=lambda text: text.split(','), default=['sr'])
+    parser.add_argument('--congestion', type=lambda text: text.split(','), default=['reno'])
+    parser.add_argument('--fec', type=integers, default=[0], help='comma separated FEC block sizes, 0 without forward error correction')
+    parser.add_argument('--repeat', type=int, default=1, help='transfers per combination, with consecutive seeds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=57000, help='first port of the udp backend')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', type=str, default='benchmark.json', help='result file, .json or .csv')
+    parser.add_argument('--compare', type=str, default=None, help='an earlier .json result file to compare with')
+
+    args = parser.parse_args()
+
+    records = run_matrix(args.backend, args.sizes, args.segment_sizes, args.buffer_sizes, args.profiles, args.modes, args.congestion, args.repeat, args.seed, args.port, args.timeout, args.fec)
+    write_results(args.output, records)
+    failed = [r for r in records if not r['ok']]
+    print(f">> {len(records) - len(failed)}/{len(records)} transfers succeeded, results written to {args.output}")
+    if args.compare:
+        compare(args.compare, records)
+    # A failed transfer measures nothing, its goodput must not be taken for a result
+    for r in failed:
+        print(f">> {r['profile']} size={r['size']} segment={r['segment_size']} buffer={r['receive_buffer_size']} {r['mode']}/{r['congestion']} fec={r['fec']} seed={r['seed']} failed: {r['error']}")
+    if failed:
+        sys.exit(1)
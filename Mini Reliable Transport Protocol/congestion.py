@@ -0,0 +1,180 @@
+import math # for the cubic root of CUBIC
+
+# Congestion window bounds, in segments
+INITIAL_CWND = 10
+MIN_CWND = 1
+MIN_SSTHRESH = 2
+
+# CUBIC constants (RFC 9438)
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+
+
+class CongestionControl:
+    """
+    Base class of the congestion control strategies used by the MRT sender.
+
+    A strategy owns the congestion window (cwnd) and the slow start threshold (ssthresh), both counted in segments. The sender consults window() before putting a new segment on the link and reports the events of the connection back to the strategy:
+
+    1.) on_ack() when the window base moves forward outside of loss recovery
+    2.) on_loss() once per loss event detected through duplicate ACKs or SACK holes
+    3.) on_timeout() when the retransmission timer expires
+
+    Subclasses implement the growth of the window in congestion avoidance and the reaction to losses.
+    """
+
+    name = 'base'
+
+    def __init__(self, initial_cwnd=INITIAL_CWND):
+        """
+        arguments:
+        initial_cwnd -- the congestion window at the start of the connection, in segments
+        """
+        self.cwnd = float(initial_cwnd)
+        self.ssthresh = float('inf')
+
+    def window(self):
+        """
+        return the number of segments the sender may have outstanding
+        """
+        return max(MIN_CWND, int(self.cwnd))
+
+    def in_slow_start(self):
+        """
+        return True while the window is below the slow start threshold
+        """
+        return self.cwnd < self.ssthresh
+
+    def on_ack(self, acked, now, srtt):
+        """
+        grow the window after new segments were acknowledged
+
+        arguments:
+        acked -- the number of segments newly acknowledged
+        now -- the current time in seconds
+        srtt -- the smoothed round-trip time of the connection, None before the first sample
+        """
+        raise NotImplementedError
+
+    def on_loss(self, now):
+        """
+        multiplicative decrease after a loss detected by duplicate ACKs or SACK blocks
+
+        arguments:
+        now -- the current time in seconds
+        """
+        raise NotImplementedError
+
+    def on_timeout(self, now):
+        """
+        collapse the window after the retransmission timer expired
+
+        arguments:
+        now -- the current time in seconds
+        """
+        self.ssthresh = max(self.cwnd / 2, MIN_SSTHRESH)
+        self.cwnd = MIN_CWND
+
+    def state(self):
+        """
+        return a snapshot of the congestion state of the connection
+        """
+        return {'algorithm': self.name, 'cwnd': self.cwnd, 'ssthresh': self.ssthresh}
+
+
+class Reno(CongestionControl):
+    """
+    TCP Reno congestion control (RFC 5681).
+
+    Slow start grows the window by one segment per acknowledged segment, congestion avoidance by one segment per window of acknowledged segments. A loss halves the window.
+    """
+
+    name = 'reno'
+
+    def on_ack(self, acked, now, srtt):
+        if self.in_slow_start():
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+
+    def on_loss(self, now):
+        self.ssthresh = max(self.cwnd / 2, MIN_SSTHRESH)
+        self.cwnd = self.ssthresh
+
+
+class Cubic(CongestionControl):
+    """
+    CUBIC congestion control (RFC 9438).
+
+    After a loss the window grows along a cubic function of the time since the loss, centered on the window at which the loss happened (W_max), so it quickly returns close to W_max, plateaus there and then probes for more bandwidth. A Reno-friendly estimate keeps it at least as aggressive as Reno on short round-trip times. A loss reduces the window by the factor beta = 0.7.
+    """
+
+    name = 'cubic'
+
+    def __init__(self, initial_cwnd=INITIAL_CWND):
+        super().__init__(initial_cwnd)
+        self.w_max = 0.0
+        self.epoch_start = None
+        self.origin = 0.0
+        self.k = 0.0
+        self.w_est = 0.0
+
+    def on_ack(self, acked, now, srtt):
+        if self.in_slow_start():
+            self.cwnd += acked
+            return
+        if self.epoch_start is None:
+            # First acknowledgment of a congestion avoidance epoch
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = math.pow((self.w_max - self.cwnd) / CUBIC_C, 1 / 3)
+                self.origin = self.w_max
+            else:
+                self.k = 0.0
+                self.origin = self.cwnd
+            self.w_est = self.cwnd
+        t = now - self.epoch_start + (srtt or 0)
+        target = self.origin + CUBIC_C * (t - self.k) ** 3
+        target = min(max(target, self.cwnd), 1.5 * self.cwnd)
+        # Reno-friendly region
+        self.w_est += 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * acked / self.cwnd
+        target = max(target, self.w_est)
+        self.cwnd += (target - self.cwnd) / self.cwnd * acked
+
+    def on_loss(self, now):
+        # Fast convergence: release bandwidth faster when the window stopped growing
+        if self.cwnd < self.w_max:
+            self.w_max = self.cwnd * (1 + CUBIC_BETA) / 2
+        else:
+            self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * CUBIC_BETA, MIN_SSTHRESH)
+        self.cwnd = self.ssthresh
+        self.epoch_start = None
+
+    def on_timeout(self, now):
+        self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * CUBIC_BETA, MIN_SSTHRESH)
+        self.cwnd = MIN_CWND
+        self.epoch_start = None
+
+
+# Strategies that can be selected by name in Client.init
+CONGESTION_CONTROLS = {
+    'reno': Reno,
+    'cubic': Cubic,
+}
+
+
+def create_congestion_control(name):
+    """
+    create the congestion control strategy registered under the given name
+
+    arguments:
+    name -- the name of the strategy, a key of CONGESTION_CONTROLS
+
+    return:
+    a new CongestionControl instance
+    """
+    if name not in CONGESTION_CONTROLS:
+        raise ValueError(f"Unknown congestion control: {name}")
+    return CONGESTION_CONTROLS[name]()
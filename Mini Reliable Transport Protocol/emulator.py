@@ -0,0 +1,282 @@
+#!/usr/bin/env python3.10
+import argparse
+import selectors # to wait on the sockets of every flow at once
+import socket
+import time
+import network # for the link model, the timer heap and the bit errors
+
+# Parameters of an emulated link: the link model of network.py plus the loss rates of the loss file
+EMULATOR_DEFAULTS = dict(network.LINK_DEFAULTS, loss=0.0, biterr=0.0)
+
+
+class Flow:
+    """
+    A client/server pair routed through the emulator.
+
+    The client sends to the network port of the flow, and the emulator forwards its datagrams over the links of the forward path to the server. Datagrams the server sends back to that port follow the links of the reverse path to the client.
+    """
+
+    def __init__(self, name, sock, client_addr, server_addr, forward, reverse):
+        """
+        arguments:
+        name -- the name of the flow in the statistics
+        sock -- the socket bound to the network port of the flow
+        client_addr -- the address of the client
+        server_addr -- the address of the server
+        forward -- the names of the links from the client to the server, in order
+        reverse -- the names of the links from the server to the client, in order
+        """
+        self.name = name
+        self.sock = sock
+        self.client_addr = client_addr
+        self.server_addr = server_addr
+        self.forward = forward
+        self.reverse = reverse
+        self.bytes = 0 # bytes of the client delivered to the server
+        self.datagrams = 0 # datagrams of the client delivered to the server
+        self.drops = 0 # datagrams of either direction lost on the way
+
+
+class Emulator:
+    """
+    Routes any number of MRT client/server pairs through shared links.
+
+    Each link is a network.Link with its own queue and token bucket, whose parameters (EMULATOR_DEFAULTS) follow a time schedule like the loss file. Flows that share a link compete for its bandwidth and queue, which makes the emulator suited to measuring the fairness and aggregate throughput of concurrent transfers.
+
+    Everything runs on one thread: a selectors loop waits for the datagrams of every flow, but no longer than the earliest event of a priority queue of hop arrivals (network.TimerHeap). A datagram crosses its path one link at a time, each hop being scheduled when the previous one delivers it, so it meets the queue of the next link in the state it has at that time.
+    """
+
+    def __init__(self, seed=None):
+        """
+        arguments:
+        seed -- seed of the random generators of the links, None for a fresh random seed
+        """
+        network.seedRandom(seed)
+        self.selector = selectors.DefaultSelector()
+        self.timers = network.TimerHeap()
+        self.links = {} # name -> network.Link
+        self.schedules = {} # name -> list of (time, parameters), sorted by time
+        self.flows = []
+        self.start = None
+        self.running = False
+
+    def set_link(self, name, at=0.0, **params):
+        """
+        create a link, or change its parameters from a given time on
+
+        arguments:
+        name -- the name of the link
+        at -- the time from which the parameters apply, in seconds since the start of the emulation
+        params -- parameters of EMULATOR_DEFAULTS, those not given take their default value
+        """
+        for key in params:
+            if key not in EMULATOR_DEFAULTS:
+                raise ValueError(f"Unknown link parameter: {key}")
+        if name not in self.links:
+            self.links[name] = network.Link()
+            self.schedules[name] = []
+        self.schedules[name].append((at, dict(EMULATOR_DEFAULTS, **params)))
+        self.schedules[name].sort(key=lambda entry: entry[0])
+
+    def link_params(self, name, now):
+        """
+        return the parameters of a link at the given time
+        """
+        current = EMULATOR_DEFAULTS
+        for at, params in self.schedules[name]:
+            if now - self.start >= at:
+                current = params
+        return current
+
+    def add_flow(self, port, client_addr, server_addr, forward, reverse, name=None):
+        """
+        route a client/server pair through the emulator
+
+        arguments:
+        port -- the network port the client sends to, and the server answers to
+        client_addr -- the address of the client
+        server_addr -- the address of the server
+        forward -- the names of the links from the client to the server, in order
+        reverse -- the names of the links from the server to the client, in order
+
+        return:
+        the Flow
+        """
+        for link in list(forward) + list(reverse):
+            if link not in self.links:
+                raise ValueError(f"Unknown link: {link}")
+        sock = network.createSocket(port)
+        sock.setblocking(False)
+        flow = Flow(name or f'flow{len(self.flows)}', sock, client_addr, server_addr, list(forward), list(reverse))
+        self.selector.register(sock, selectors.EVENT_READ, flow)
+        self.flows.append(flow)
+        return flow
+
+    def receive(self, flow):
+        """
+        read every datagram waiting on the socket of a flow and send it on the first link of its path
+        """
+        while True:
+            try:
+                data, addr = flow.sock.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionError:
+                continue # ICMP port unreachable from an endpoint that is not running yet
+            if addr == flow.client_addr:
+                self.hop(flow, bytearray(data), flow.forward, 0, flow.server_addr, True)
+            elif addr == flow.server_addr:
+                self.hop(flow, bytearray(data), flow.reverse, 0, flow.client_addr, False)
+
+    def hop(self, flow, data, path, index, dest, forward):
+        """
+        put a datagram on the next link of its path, or hand it to its destination at the end of the path
+
+        arguments:
+        flow -- the flow of the datagram
+        data -- the datagram, a bytearray
+        path -- the names of the links of the path
+        index -- the position of the next link in the path
+        dest -- the address of the destination
+        forward -- True for a datagram from the client to the server
+        """
+        if index == len(path):
+            try:
+                flow.sock.sendto(data, dest)
+            except OSError:
+                flow.drops += 1
+                return
+            if forward:
+                flow.bytes += len(data)
+                flow.datagrams += 1
+            return
+        now = time.time()
+        params = self.link_params(path[index], now)
+        if network.rng.random() < params['loss']:
+            flow.drops += 1
+            return
+        network.corrupt(data, params['biterr'])
+        arrival = self.links[path[index]].transmit(len(data), now, params)
+        if arrival is None:
+            flow.drops += 1
+            return
+        self.timers.push(arrival, self.hop, flow, data, path, index + 1, dest, forward)
+
+    def run(self, duration=None, report=None):
+        """
+        forward datagrams until stop is called or the duration elapsed
+
+        arguments:
+        duration -- the time to run in seconds, None to run until stop
+        report -- print the statistics every report seconds, None to stay quiet
+        """
+        self.start = time.time()
+        self.running = True
+        next_report = self.start + report if report else None
+        while self.running:
+            now = time.time()
+            if duration is not None and now - self.start >= duration:
+                break
+            timeout = self.timers.timeout(now)
+            for deadline in (next_report, self.start + duration if duration is not None else None):
+                if deadline is not None:
+                    timeout = max(0.0, deadline - now) if timeout is None else min(timeout, max(0.0, deadline - now))
+            for key, _ in self.selector.select(timeout):
+                self.receive(key.data)
+            self.timers.runDue(time.time())
+            if next_report is not None and time.time() >= next_report:
+                print(self.format_stats())
+                next_report += report
+
+    def stop(self):
+        """
+        make run return after its current iteration
+        """
+        self.running = False
+
+    def stats(self):
+        """
+        return the statistics of the emulation
+
+        return:
+        a dict with the elapsed time, the per-flow delivered bytes, datagrams, drops and throughput, the aggregate throughput (bytes per second) and Jain's fairness index of the per-flow throughputs (1 when every flow gets the same share, 1/n when one flow gets everything)
+        """
+        elapsed = max(time.time() - self.start, 1e-9) if self.start is not None else 1e-9
+        flows = {flow.name: {'bytes': flow.bytes, 'datagrams': flow.datagrams, 'drops': flow.drops, 'throughput': flow.bytes / elapsed} for flow in self.flows}
+        throughputs = [flow['throughput'] for flow in flows.values()]
+        squares = sum(t * t for t in throughputs)
+        fairness = sum(throughputs) ** 2 / (len(throughputs) * squares) if squares else 1.0
+        links = {name: {'drops': link.drops} for name, link in self.links.items()}
+        return {'elapsed': elapsed, 'flows': flows, 'links': links, 'aggregate': sum(throughputs), 'fairness': fairness}
+
+    def format_stats(self):
+        """
+        return the statistics as one line
+        """
+        stats = self.stats()
+        flows = ' '.join(f"{name}={flow['throughput'] / 1000:.0f}KB/s" for name, flow in stats['flows'].items())
+        return f"{stats['elapsed']:.1f}s aggregate={stats['aggregate'] / 1000:.0f}KB/s fairness={stats['fairness']:.3f} {flows}"
+
+    def close(self):
+        """
+        close the sockets of every flow
+        """
+        for flow in self.flows:
+            self.selector.unregister(flow.sock)
+            flow.sock.close()
+        self.selector.close()
+
+
+def load_topology(emulator, path):
+    """
+    configure an emulator from a topology file
+
+    every line is either a link, optionally scheduled from a given time on:
+
+        link <name> [at=<seconds>] [key=value ...]
+
+    with the keys of EMULATOR_DEFAULTS, or a flow:
+
+        flow <networkPort> <clientAddr> <clientPort> <serverAddr> <serverPort> <forward links> <reverse links>
+
+    where the paths are comma separated link names. Empty lines and lines starting with # are ignored
+
+    arguments:
+    emulator -- the Emulator to configure
+    path -- the path of the topology file
+    """
+    for line in open(path, 'r').readlines():
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        if fields[0] == 'link':
+            params = dict(field.split('=') for field in fields[2:])
+            at = float(params.pop('at', 0))
+            emulator.set_link(fields[1], at, **{key: float(value) for key, value in params.items()})
+        elif fields[0] == 'flow':
+            port, client_addr, client_port, server_addr, server_port, forward, reverse = fields[1:8]
+            emulator.add_flow(int(port), (client_addr, int(client_port)), (server_addr, int(server_port)), forward.split(','), reverse.split(','))
+        else:
+            raise ValueError(f"Unknown topology line: {line.strip()}")
+
+
+if __name__ == '__main__':
+    # accepts commandline arguments
+    parser = argparse.ArgumentParser(
+                    prog='emulator.py',
+                    description='emulator.py routes many client/server pairs through shared links and reports their throughput and fairness.')
+    parser.add_argument('topologyFile', type=str)
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random generators, for reproducible runs')
+    parser.add_argument('--duration', type=float, default=None, help='seconds to run, forever by default')
+    parser.add_argument('--report', type=float, default=1.0, help='seconds between two statistics lines')
+
+    args = parser.parse_args()
+
+    emulator = Emulator(args.seed)
+    load_topology(emulator, args.topologyFile)
+    try:
+        emulator.run(args.duration, args.report)
+    except KeyboardInterrupt:
+        pass
+    print(emulator.format_stats())
+    emulator.close()
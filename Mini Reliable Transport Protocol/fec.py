@@ -0,0 +1,105 @@
+import struct # for the length and flags of the covered segments
+
+# Length and end-of-message flag of every covered segment, XORed into the parity together with its data
+PARITY_TERM = struct.Struct('!HB')
+
+# Bytes a parity segment needs on top of the largest payload it covers: the count of covered segments and PARITY_TERM
+FEC_OVERHEAD = 1 + PARITY_TERM.size
+
+# Largest number of data segments covered by one parity segment, the count is one byte
+MAX_FEC_BLOCK = 255
+
+
+def parity_term(payload, eom):
+    """
+    return the contribution of a data segment to the parity of its block
+
+    the length and end-of-message flag are prepended to the data so that a rebuilt segment gets them back, and the bytes are read as a little-endian integer: shorter segments are implicitly padded with zeros up to the longest one, and XORing whole integers runs in C rather than byte by byte
+
+    arguments:
+    payload -- the data of the segment
+    eom -- True if the segment ends a message
+
+    return:
+    a tuple (integer, size in bytes)
+    """
+    term = PARITY_TERM.pack(len(payload), eom) + payload
+    return int.from_bytes(term, 'little'), len(term)
+
+
+class ParityEncoder:
+    """
+    Accumulates the XOR parity of the block of data segments being sent.
+
+    Segments are added in packet number order as they are sent for the first time. A block covers block consecutive segments; the client sends the parity of a block once it is complete, and the parity of the partial block so far when a message ends, so that the tail of a transfer is protected too.
+    """
+
+    def __init__(self, block):
+        """
+        arguments:
+        block -- the number of data segments covered by the parity of a full block
+        """
+        self.block = block
+        self.start = 0 # packet number of the first segment of the block
+        self.next = 0 # packet number of the next segment to add
+        self.count = 0 # segments added to the block so far
+        self.value = 0
+        self.size = 0
+
+    def add(self, packet_num, payload, eom):
+        """
+        add a data segment to the parity of the current block
+
+        arguments:
+        packet_num -- the packet number of the segment, next
+        payload -- the data of the segment
+        eom -- True if the segment ends a message
+        """
+        if self.count == 0:
+            self.start = packet_num
+        self.next = packet_num + 1
+        value, size = parity_term(payload, eom)
+        self.value ^= value
+        self.size = max(self.size, size)
+        self.count += 1
+
+    def full(self):
+        """
+        return True once the block holds block segments
+        """
+        return self.count == self.block
+
+    def payload(self):
+        """
+        return the payload of the parity segment of the current block: the count of covered segments and the parity
+        """
+        return bytes([self.count]) + self.value.to_bytes(self.size, 'little')
+
+    def reset(self):
+        """
+        start the next block
+        """
+        self.count = 0
+        self.value = 0
+        self.size = 0
+
+
+def recover_segment(parity, others):
+    """
+    rebuild the one missing data segment of a block from its parity and the other segments
+
+    arguments:
+    parity -- the parity of the block without its count byte
+    others -- (payload, eom) tuples of every other segment covered by the parity
+
+    return:
+    a tuple (payload, eom) of the missing segment, None if the parity does not decode to a valid segment
+    """
+    value = int.from_bytes(parity, 'little')
+    for payload, eom in others:
+        value ^= parity_term(payload, eom)[0]
+    term = value.to_bytes(len(parity), 'little')
+    length, eom = PARITY_TERM.unpack_from(term)
+    if eom > 1 or PARITY_TERM.size + length > len(term):
+        return None
+    return term[PARITY_TERM.size:PARITY_TERM.size + length], bool(eom)
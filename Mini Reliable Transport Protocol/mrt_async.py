@@ -0,0 +1,1893 @@
+import asyncio # for the event loop and the datagram endpoints
+import collections # for the message boundaries of each connection
+import math # for the adaptive segment size
+import socket # for the address family of the endpoints
+import struct # for packing and unpacking data
+import threading # for the background event loop of the synchronous API
+import weakref # for the timer wheel of each event loop
+from batch_io import create_endpoint
+from congestion import create_congestion_control
+from fec import ParityEncoder, FEC_OVERHEAD, MAX_FEC_BLOCK, recover_segment
+from mrt_log import LogSink, LOG_PACKET
+from mrt_metrics import Metrics, ServerMetrics, MetricsDump
+from segmentClass import Segment, OPT_SACK_PERMITTED, OPT_CHECKSUM, OPT_WINDOW_SCALE, OPT_FAST_OPEN, OPT_FEC, OPT_MSS, MAX_SACK_BLOCKS, CHECKSUM_MD5, SUPPORTED_CHECKSUMS, MAX_HEADER_SIZE
+from segmentClass import MAX_WINDOW, MAX_WINDOW_SCALE, MAX_SEGMENT_SIZE, FLAGS_OFFSET, SEQ_MODULUS
+from segmentClass import pack_options, unpack_options, split_early_data, pack_sack, unpack_sack, checksum_offer, choose_checksum, header_size, unwrap, window_scale
+from timer_wheel import TimerWheel
+
+# Number of SACKed segments above a hole (or duplicate ACKs) before the hole is considered lost
+DUP_THRESH = 3
+
+# Retransmission timeout bounds in seconds (RFC 6298, with a lower floor for local links)
+INITIAL_RTO = 1.0
+MIN_RTO = 0.2
+MAX_RTO = 60.0
+CLOCK_GRANULARITY = 0.01
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+
+# Client states
+CLIENT_CLOSED = 'CLOSED'           # not connected yet, or closed
+CLIENT_SYN_SENT = 'SYN-SENT'       # the SYN was sent, waiting for the SYN-ACK
+CLIENT_ESTABLISHED = 'ESTABLISHED' # the SYN-ACK arrived, data can be sent while the ACK of the handshake is confirmed
+CLIENT_FIN_SENT = 'FIN-SENT'       # the FIN was sent, waiting for the FIN-ACK
+
+# Server connection states
+STATE_SYN_RECEIVED = 'SYN-RECEIVED' # the SYN-ACK was sent, waiting for the ACK of the handshake or the first data segment
+STATE_ESTABLISHED = 'ESTABLISHED'   # the handshake completed, data is being received
+STATE_CLOSED = 'CLOSED'             # the FIN was answered, retransmitted FINs are still answered
+
+# Seconds a closed connection stays in the connection table to answer retransmitted FINs
+TIME_WAIT = 10
+
+# Number of FIN transmissions before the client gives up on the FIN-ACK
+FIN_ATTEMPTS = 4
+
+# Delayed acknowledgments: the server acknowledges every ACK_EVERY in-order segments, or ACK_DELAY seconds after the first unacknowledged one
+ACK_EVERY = 2
+ACK_DELAY = 0.02
+
+# Adaptive segment size: payloads start at INITIAL_PAYLOAD bytes and never shrink below MIN_PAYLOAD, the corruption rate is measured over every SIZE_SAMPLE data segments and smoothed with SIZE_ALPHA
+INITIAL_PAYLOAD = 128
+MIN_PAYLOAD = 32
+SIZE_SAMPLE = 16
+SIZE_ALPHA = 1 / 4
+
+# Smallest segment size a server accepts, room for the largest header, a parity and MIN_PAYLOAD bytes of data
+MIN_SEGMENT_SIZE = MAX_HEADER_SIZE + FEC_OVERHEAD + MIN_PAYLOAD
+
+
+class RTTEstimator:
+    """
+    Estimates the round-trip time of a connection and derives the retransmission timeout (RTO) from it.
+
+    The estimator follows Jacobson's algorithm as specified in RFC 6298: every sample updates a smoothed round-trip time (SRTT) and its mean deviation (RTTVAR), and the timeout is SRTT + 4 * RTTVAR. The caller is responsible for Karn's rule, that is only feeding samples from segments that were never retransmitted. Every timeout doubles the RTO (exponential backoff) until the next valid sample recomputes it.
+    """
+
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        """
+        arguments:
+        initial_rto -- the timeout used before the first sample is taken
+        min_rto -- the lower bound of the timeout
+        max_rto -- the upper bound of the timeout, also caps the backoff
+        """
+        self.srtt = None
+        self.rttvar = None
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.rto = initial_rto
+
+    def sample(self, rtt):
+        """
+        update the estimate with a round-trip time measurement
+
+        arguments:
+        rtt -- the measured round-trip time in seconds
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + max(CLOCK_GRANULARITY, 4 * self.rttvar)))
+
+    def backoff(self):
+        """
+        double the timeout after a retransmission timer expired
+        """
+        self.rto = min(self.max_rto, self.rto * 2)
+
+
+class SegmentSizer:
+    """
+    Picks the payload size of the data segments from the share of them the server reports as corrupt.
+
+    With independent bit errors a segment of n bytes arrives intact with probability exp(-q * n), where q = -8 * ln(1 - bit error rate) is the error rate per byte. Large segments are lost more often on a noisy link, small ones waste more of it on headers. Every SIZE_SAMPLE data segments, the sizer estimates q from the share of them reported as corrupt and their mean size, and smooths the estimate. The payload L that maximizes the goodput L / (L + h) * exp(-q * (L + h)), h being the bytes each segment adds to its payload, is the positive root of L^2 + h * L - h / q.
+
+    A payload cut at a size too large for the link can take many transmissions to get through, and its size cannot change once it was sent. The sender therefore starts small, at INITIAL_PAYLOAD bytes, and the payload at most doubles from one sample to the next, like a slow start of the segment size; it shrinks at once.
+    """
+
+    def __init__(self):
+        self.error_rate = None # smoothed estimate of q, None before the first sample
+        self.sent = 0 # data segments sent in the current sample
+        self.sent_bytes = 0 # bytes of the data segments sent in the current sample
+        self.corrupt = 0 # corrupt segments reported during the current sample
+
+    def segment_sent(self, size):
+        """
+        count a data segment sent
+
+        arguments:
+        size -- the length of the datagram
+
+        return:
+        True if the segment completed a sample and the estimate changed
+        """
+        self.sent += 1
+        self.sent_bytes += size
+        if self.sent < SIZE_SAMPLE:
+            return False
+        # A sample where every segment was corrupt only bounds the rate, count it as all but half a segment
+        share = min(self.corrupt / self.sent, (self.sent - 0.5) / self.sent)
+        sample = -math.log(1 - share) * self.sent / self.sent_bytes
+        self.error_rate = sample if self.error_rate is None else (1 - SIZE_ALPHA) * self.error_rate + SIZE_ALPHA * sample
+        self.sent = self.sent_bytes = self.corrupt = 0
+        return True
+
+    def corrupt_reported(self):
+        """
+        count a data segment the server reported as corrupt
+        """
+        self.corrupt += 1
+
+    def payload_size(self, current, max_payload, overhead):
+        """
+        return the payload size that maximizes the goodput at the estimated error rate, at most twice the current one
+
+        arguments:
+        current -- the payload size used so far
+        max_payload -- the largest payload, allowed by the negotiated segment size
+        overhead -- the bytes each segment adds to its payload
+
+        return:
+        the payload size, between MIN_PAYLOAD and max_payload
+        """
+        best = max_payload
+        if self.error_rate:
+            best = int((math.sqrt(overhead * overhead + 4 * overhead / self.error_rate) - overhead) / 2)
+        return min(max_payload, 2 * current, max(MIN_PAYLOAD, best))
+
+
+def payload_sizer(payload_size):
+    """
+    return a callable giving the maximum size of the data of the next segment
+
+    arguments:
+    payload_size -- a fixed size, or already such a callable
+    """
+    if callable(payload_size):
+        return payload_size
+    return lambda: payload_size
+
+
+def split_chunk(pending, chunk, payload_size):
+    """
+    yield the full payloads that a chunk of a stream completes, keeping the remainder in pending
+
+    arguments:
+    pending -- a bytearray holding the start of a payload left over by the previous chunks, updated in place
+    chunk -- the next bytes-like chunk of the stream
+    payload_size -- a callable returning the maximum size of the data of the next segment
+    """
+    view = memoryview(chunk).cast('B')
+    while True:
+        size = payload_size()
+        if pending:
+            # Complete the partial payload left over by the previous chunk
+            missing = size - len(pending)
+            if missing > 0:
+                pending += view[:missing]
+                view = view[missing:]
+                if len(pending) < size:
+                    return
+            payload = bytes(pending[:size])
+            del pending[:size]
+            yield payload
+        elif len(view) >= size:
+            yield view[:size]
+            view = view[size:]
+        else:
+            pending += view
+            return
+
+
+def read_segments(source, payload_size):
+    """
+    yield the payloads of the segments of the data to send, reading the source only as far as the sender asks for
+
+    a bytes-like source is cut into views without copying, a file object is read one payload at a time, any other iterable is taken as a stream of chunks of arbitrary size which are regrouped into full payloads (chunks must not be modified once they were produced)
+
+    the size of each payload is read when the payload is cut, so an adaptive sender can change it in the middle of the data
+
+    arguments:
+    source -- a bytes-like object, a binary file object or an iterable of bytes-like chunks
+    payload_size -- the maximum size of the data of a segment, or a callable returning it for the next segment
+    """
+    payload_size = payload_sizer(payload_size)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast('B')
+        i = 0
+        while i < len(view):
+            size = payload_size()
+            yield view[i:i+size]
+            i += size
+        return
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(payload_size())
+            if not chunk:
+                return
+            yield chunk
+    pending = bytearray()
+    for chunk in source:
+        yield from split_chunk(pending, chunk, payload_size)
+    if pending:
+        yield bytes(pending)
+
+
+async def read_segments_async(source, payload_size):
+    """
+    yield the payloads of the segments of an asynchronous iterable of bytes-like chunks, regrouped into full payloads
+
+    arguments:
+    source -- an asynchronous iterable of bytes-like chunks
+    payload_size -- the maximum size of the data of a segment, or a callable returning it for the next segment
+    """
+    payload_size = payload_sizer(payload_size)
+    pending = bytearray()
+    async for chunk in source:
+        for payload in split_chunk(pending, chunk, payload_size):
+            yield payload
+    if pending:
+        yield bytes(pending)
+
+
+_timer_wheels = weakref.WeakKeyDictionary()
+
+
+def get_timer_wheel(loop):
+    """
+    return the timer wheel shared by every connection of an event loop
+    """
+    wheel = _timer_wheels.get(loop)
+    if wheel is None:
+        wheel = _timer_wheels[loop] = TimerWheel(loop)
+    return wheel
+
+
+_background_loop = None
+_background_lock = threading.Lock()
+
+
+def background_loop():
+    """
+    return the event loop that runs the connections of the synchronous Client and Server, started in a daemon thread on first use
+    every synchronous client and server of the process shares this one loop
+    """
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name='mrt-event-loop', daemon=True).start()
+    return _background_loop
+
+
+def run_sync(coroutine):
+    """
+    run a coroutine on the background event loop and wait for its result
+    must not be called from the event loop thread itself
+
+    arguments:
+    coroutine -- the coroutine to run
+
+    return:
+    the result of the coroutine, its exception is raised in the caller
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, background_loop()).result()
+
+
+#
+# Client
+#
+class AsyncClient(asyncio.DatagramProtocol):
+    """
+    The sending side of MRT on an asyncio event loop.
+
+    The client is the datagram protocol of its own UDP endpoint. Segments from the server are handled in datagram_received as they arrive, the retransmission timers run on the timer wheel of the loop, and the coroutines of the API only wait for the events the handlers signal. No thread and no queue sits between the socket and the protocol. Every time is read from the clock of the event loop, so the same code also runs against the virtual clock of simulation.py. The endpoint comes from batch_io.create_endpoint, which reads and writes datagrams in batches on real sockets.
+    """
+
+    async def init(self, src_port, dst_addr, dst_port, segment_size, mode='sr', congestion='reno', checksum='auto', log_level='packet', log_binary=False, fast_open=False, metrics_interval=None, fec=0, adapt_segment_size=False):
+        """
+        initialize the client and create the client UDP endpoint
+
+        arguments:
+        src_port -- the port the client is using to send segments
+        dst_addr -- the address of the server/network simulator
+        dst_port -- the port of the server/network simulator
+        segment_size -- the maximum size of a segment (including the header), offered in the SYN; the server may lower it
+        mode -- the transfer mode requested in the SYN, 'sr' (selective-repeat with SACK) or 'gbn' (go-back-n)
+        congestion -- the congestion control strategy, a key of congestion.CONGESTION_CONTROLS ('reno' or 'cubic')
+        checksum -- the checksum offered in the SYN, 'auto' for every mode this host supports or one of 'crc32c', 'crc32', 'inet', 'md5'
+        log_level -- 'off', 'summary' or 'packet' (one record per segment in log_{src_port}.txt)
+        log_binary -- write the per-packet log as binary records to log_{src_port}.bin
+        fast_open -- defer the handshake to the first send and carry the first data segment in the SYN
+        metrics_interval -- append a snapshot of the metrics to metrics_{src_port}.jsonl every metrics_interval seconds, None to only keep them in memory
+        fec -- send a parity segment every fec data segments so the server can rebuild a lost one without a retransmission, 0 to disable forward error correction (selective-repeat only)
+        adapt_segment_size -- shrink the segments on links where the server reports corrupt segments, and grow them back up to the negotiated segment size as the corruption stops
+        """
+        if mode not in ('sr', 'gbn'):
+            raise ValueError(f"Unknown transfer mode: {mode}")
+        self.mode = mode
+        if not 0 <= fec <= MAX_FEC_BLOCK:
+            raise ValueError(f"The FEC block size must be between 0 and {MAX_FEC_BLOCK}: {fec}")
+        if fec and mode != 'sr':
+            raise ValueError("Forward error correction needs the selective-repeat mode")
+        self.fec = fec
+        if segment_size > MAX_SEGMENT_SIZE:
+            raise ValueError(f"The segment size must be at most {MAX_SEGMENT_SIZE}: {segment_size}")
+        self.segment_size = segment_size
+        self.checksum_offer = checksum_offer(checksum)
+        self.fast_open = fast_open
+        if fast_open and self.early_payload_size(segment_size) < 1:
+            raise ValueError(f"Segment size too small for fast open: {segment_size}")
+        self.cc = create_congestion_control(congestion)
+        self.log_sink = LogSink(src_port, log_level, log_binary)
+        self.verbose = self.log_sink.level == LOG_PACKET # per-segment progress messages are only printed along with the per-packet log
+        self.loop = asyncio.get_running_loop()
+        self.wheel = get_timer_wheel(self.loop)
+        self.metrics = Metrics(self.loop.time)
+        self.metrics_dump = MetricsDump(self.wheel, src_port, metrics_interval, self.metrics) if metrics_interval is not None else None
+        self.rtt = RTTEstimator()
+        self.retry = 100
+        self.retries_left = self.retry
+        self.src_port = src_port
+        self.dst_addr = dst_addr
+        self.dst_port = dst_port
+        self.payload_size = segment_size - header_size(CHECKSUM_MD5) # the size of the next payloads cut from the data, set once the handshake completes
+        self.sizer = SegmentSizer() if adapt_segment_size else None
+        self.corrupt_cursor = 0 # the packet number after the last one resent for a corrupt segment report
+        self.corrupt_reports = 0 # corrupt segments reported since the last loss recovery episode started
+        self.state = CLIENT_CLOSED
+        self.seq_num = 0
+        self.ack_num = 0
+        self.num_segments = 0
+        self.source = iter(()) # payloads of the data being sent, pulled as the window advances
+        self.payloads = {} # packet number -> payload, for the segments pulled and not yet acknowledged
+        self.end_of_data = False # set once the source is exhausted, num_segments is then final
+        self.message_start = 0 # packet number of the first segment of the message being sent
+        self.message_ends = set() # packet numbers of the last segments of messages, not yet acknowledged
+        self.bytes_sent = 0
+        self.datagram = bytearray(MAX_HEADER_SIZE + segment_size) # reused for every data segment
+        self.base = 0
+        self.next_seq_num = 0
+        self.high_seq = 0 # one past the highest packet number sent so far
+        self.recovery_point = 0 # the window base must pass this packet number to leave loss recovery
+        self.packet_num = 0
+        self.receive_buffer_size = 0
+        self.receive_window = 0 # bytes the server can take, updated by the window field of every acknowledgment
+        self.full_window = 0 # the window the server advertises while its receive buffer is empty
+        self.window_scale = 0 # shift count of the window field of the server, 0 unless granted in the SYN-ACK
+        self.ready = False # set once the server confirmed the ACK of the handshake, by its 'ready' segment or any acknowledgment
+        self.selective_repeat = False # set once the server grants selective-repeat in the SYN-ACK
+        self.checksum_mode = CHECKSUM_MD5 # replaced by the mode chosen by the server in the SYN-ACK
+        self.parity = None # the ParityEncoder of the data sent, once the server grants forward error correction
+        self.acked = set() # packet numbers above the base reported in SACK blocks
+        self.sack_retransmitted = set() # holes already retransmitted since the last timeout
+        self.send_times = {} # packet number -> time of its last transmission
+        self.retransmitted = set() # packet numbers sent more than once, never used as RTT samples (Karn)
+        self.dup_acks = 0
+        self.syn_attempts = 0
+        self.syn_sent_at = None
+        self.fin_attempts = 0
+        self.timer = None # the retransmission timer on the timer wheel, None when it is stopped
+        self.persist_timer = None # the zero-window probe timer, None unless the receive window is closed
+        self.persist_interval = 0 # the delay before the next zero-window probe
+        self.failure = None # the exception that ended the connection
+        self.established = self.loop.create_future()
+        self.closed = self.loop.create_future()
+        self.window_open = asyncio.Event()
+        self.transport, _ = await create_endpoint(self.loop, lambda: self, ('localhost', src_port), family=socket.AF_INET) # network.py forwards to IPv4 addresses
+
+    def datagram_received(self, datagram, addr):
+        """
+        Processes a segment received from the server, according to the state of the connection.
+
+        In SYN-SENT a SYN-ACK completes the negotiation, establishes the connection and is answered with the ACK of the handshake, in ESTABLISHED the 'ready' segment of the server confirms that ACK and acknowledgments drive the sliding window (see handle_ack), and in FIN-SENT the FIN-ACK closes the connection. Corrupt segments, and segments that do not fit the state, are ignored: the retransmission timer recovers from their loss.
+
+        Args:
+            datagram (bytes): The segment.
+            addr (tuple): The address of the sender.
+
+        Returns:
+            None
+        """
+        self.metrics.received(len(datagram))
+        segment = Segment(self.src_port, self.dst_port, self.seq_num, self.ack_num, self.packet_num, False, False, False, log_sink=self.log_sink)
+        # The mode is only known once the SYN-ACK chose it, handle_syn_ack checks that the SYN-ACK uses the mode it grants
+        _, self.ack_num, packet_num, SYN, ACK, FIN, corrupt, data = segment.from_bytes(datagram, None if self.state == CLIENT_SYN_SENT else self.checksum_mode)
+        if corrupt:
+            if self.verbose:
+                print("Received corrupt segment, ignoring...")
+            self.metrics.corrupt += 1
+            return
+
+        if self.state == CLIENT_SYN_SENT and SYN and ACK:
+            self.handle_syn_ack(data, unwrap(packet_num, self.base), segment.checksum_mode)
+        elif self.state == CLIENT_ESTABLISHED and not (SYN or ACK or FIN) and data[:5] == b'ready':
+            # The server answers the ACK with a 'ready' segment, the timer only keeps running for outstanding data
+            self.ready = True
+            if self.base >= self.high_seq:
+                self.stop_timer()
+        elif self.state == CLIENT_ESTABLISHED and ACK and not (SYN or FIN):
+            # The server only acknowledges data once the connection is established on its side
+            self.ready = True
+            if segment.corrupt_seen:
+                self.corrupt_reported()
+            window = segment.window << self.window_scale
+            update = window != self.receive_window
+            self.receive_window = window
+            if self.handle_ack(unwrap(packet_num, self.base), data, update):
+                self.retries_left = self.retry
+            if update:
+                # A window update is a sign of life of the server, and may let new segments out
+                self.retries_left = self.retry
+                self.window_open.set()
+            self.update_persist()
+            self.metrics.record_window(self.receive_window, self.cc.window())
+        elif self.state == CLIENT_FIN_SENT and ACK and FIN:
+            # Late acknowledgments of data segments may still be in flight, only a FIN-ACK closes the connection
+            self.stop_timer()
+            self.state = CLIENT_CLOSED
+            if not self.closed.done():
+                self.closed.set_result(None)
+
+    def error_received(self, exc):
+        print("Socket error:", exc)
+
+    def handle_syn_ack(self, data, packet_num, checksum_mode):
+        """
+        Completes the negotiation with the SYN-ACK, establishes the connection and sends the ACK of the handshake.
+
+        The SYN-ACK carries the receive buffer size of the server followed by the options it granted: selective-repeat if the client asked for it, the checksum picked among the offered ones and the shift count of the window field of its acknowledgments. It is a valid RTT sample only if the SYN was sent once (Karn).
+
+        The handshake is pipelined: data may follow the ACK of the handshake right away instead of waiting for the 'ready' segment of the server, which establishes the connection on the first data segment if the ACK was lost. The retransmission timer keeps running until the server confirms, and the ACK is resent when it expires. With fast open, the packet number of the SYN-ACK acknowledges the data segment that the SYN carried.
+
+        Args:
+            data (bytes-like): The payload of the SYN-ACK.
+            packet_num (int): The packet number of the SYN-ACK, the next data segment the server expects.
+            checksum_mode (int): The checksum mode of the SYN-ACK, which must be the one it grants.
+
+        Returns:
+            None
+        """
+        # Extract the receive_buffer_size from data
+        if len(data) < 4:
+            print("Received corrupt segment, ignoring...")
+            return
+        options = unpack_options(data[4:])
+        # The server picks one of the offered checksum modes, servers without the option only know MD5
+        chosen = options.get(OPT_CHECKSUM, b'')
+        chosen = chosen[0] if len(chosen) == 1 and chosen[0] in self.checksum_offer and chosen[0] in SUPPORTED_CHECKSUMS else CHECKSUM_MD5
+        if checksum_mode != chosen:
+            # A damaged flags byte would have the SYN-ACK checked with another checksum than the one it grants
+            print("Received corrupt segment, ignoring...")
+            self.metrics.corrupt += 1
+            return
+        print("SYN-ACK packet received")
+        self.receive_buffer_size = struct.unpack('!I', data[:4])[0]
+        # Without the window scale option the window field of the acknowledgments is in bytes, which caps the window at 64 KB
+        scale = options.get(OPT_WINDOW_SCALE, b'')
+        self.window_scale = min(scale[0], MAX_WINDOW_SCALE) if len(scale) == 1 else 0
+        self.full_window = min(self.receive_buffer_size >> self.window_scale, MAX_WINDOW) << self.window_scale
+        self.receive_window = self.full_window
+        print("Window scale:", self.window_scale)
+        # The server grants selective-repeat only if we asked for it
+        self.selective_repeat = OPT_SACK_PERMITTED in options
+        print("Transfer mode:", "selective-repeat" if self.selective_repeat else "go-back-n")
+        self.checksum_mode = chosen
+        print("Checksum mode:", self.checksum_mode)
+        # The server grants forward error correction with the block size asked for, and only in selective-repeat mode
+        block = options.get(OPT_FEC, b'')
+        if self.fec and len(block) == 1 and block[0]:
+            self.parity = ParityEncoder(block[0])
+            print("FEC block:", block[0])
+        # The server caps the segment size at the largest segment it accepts
+        mss = options.get(OPT_MSS, b'')
+        if len(mss) == 2:
+            self.segment_size = min(self.segment_size, struct.unpack('!H', mss)[0])
+        self.payload_size = self.max_payload_size() if self.sizer is None else min(self.max_payload_size(), INITIAL_PAYLOAD)
+        print("Segment size:", self.segment_size)
+        if self.syn_attempts == 1:
+            self.sample_rtt(self.loop.time() - self.syn_sent_at)
+        self.state = CLIENT_ESTABLISHED
+        self.retries_left = self.retry
+        if OPT_FAST_OPEN in options and packet_num > 0:
+            # The data of the SYN is the first segment covered by the parity
+            self.add_parity(0)
+            self.handle_ack(packet_num, b'')
+        self.send_handshake_ack()
+        self.metrics.record_window(self.receive_window, self.cc.window())
+        self.established.set_result(None)
+
+    def syn_options(self):
+        """
+        return the options of the SYN, the fast open option coming last since the data of the SYN follows it
+        """
+        # The client receives no data, so it asks for window scaling with a shift count of 0
+        options = {OPT_CHECKSUM: self.checksum_offer, OPT_WINDOW_SCALE: bytes([0]), OPT_MSS: struct.pack('!H', self.segment_size)}
+        if self.mode == 'sr':
+            options[OPT_SACK_PERMITTED] = b''
+        if self.fec:
+            options[OPT_FEC] = bytes([self.fec])
+        if self.fast_open:
+            options[OPT_FAST_OPEN] = b''
+        return options
+
+    def max_payload_size(self):
+        """
+        return the largest payload of a data segment: the negotiated segment size less the header, and less the room a parity needs with forward error correction
+        """
+        return self.segment_size - self.payload_overhead()
+
+    def payload_overhead(self):
+        """
+        return the bytes each data segment adds to its payload: the header, and the room a parity needs with forward error correction
+        """
+        return header_size(self.checksum_mode) + (FEC_OVERHEAD if self.parity else 0)
+
+    def next_payload_size(self):
+        """
+        return the size of the next payload cut from the data being sent, read by read_segments as it cuts each one
+        """
+        return self.payload_size
+
+    def early_payload_size(self, segment_size):
+        """
+        return the payload size of the segments of the first message in fast open mode, whose first segment travels in the SYN after the options
+        """
+        return segment_size - header_size(CHECKSUM_MD5) - len(pack_options(self.syn_options())) - (FEC_OVERHEAD if self.fec else 0)
+
+    def send_syn(self):
+        """
+        send the SYN with the options of the client and arm the retransmission timer
+        in fast open mode the SYN also carries the first data segment, pulled by send
+        """
+        early = self.payloads.get(0, b'') if self.fast_open and self.base == 0 else b''
+        segment = Segment(self.src_port, self.dst_port, self.seq_num, self.ack_num, self.packet_num, True, False, False, log_sink=self.log_sink, eom=bool(early) and 0 in self.message_ends)
+        self.send_datagram(segment.to_bytes(pack_options(self.syn_options()) + early))
+        self.syn_sent_at = self.loop.time()
+        self.syn_attempts += 1
+        if early:
+            self.metrics.transmissions += 1
+            if self.syn_attempts > 1:
+                self.metrics.retransmissions += 1
+        print("SYN packet sent")
+        self.start_timer()
+
+    def send_handshake_ack(self):
+        """
+        send the ACK of the handshake and arm the retransmission timer until the server is ready
+        """
+        self.seq_num += 1
+        segment = Segment(self.src_port, self.dst_port, self.seq_num, self.ack_num, self.packet_num, False, True, False, self.checksum_mode, log_sink=self.log_sink)
+        self.send_datagram(segment.to_bytes(b''))
+        print("ACK packet sent")
+        self.start_timer()
+
+    def send_fin(self):
+        """
+        send the FIN and arm the retransmission timer until the FIN-ACK arrives
+        """
+        self.seq_num += 1
+        segment = Segment(self.src_port, self.dst_port, self.seq_num, self.ack_num, self.packet_num, False, False, True, self.checksum_mode, log_sink=self.log_sink)
+        self.send_datagram(segment.to_bytes(b''))
+        self.fin_attempts += 1
+        print("FIN packet sent")
+        self.start_timer()
+
+    def send_segment(self, packet_num):
+        """
+        build the data segment with the given packet number and send it to the server
+
+        The transmission time is recorded for RTT sampling, a segment sent a second time is excluded from sampling (Karn's algorithm) and the retransmission timer is started if it is not running.
+        The segment is built in the preallocated datagram buffer of the client, the payload pulled from the source by read_ahead is copied into it once. The last segment of a message carries the end-of-message flag.
+
+        arguments:
+        packet_num -- the index of the segment in the data being sent
+        """
+        segment = Segment(self.src_port, self.dst_port, self.seq_num, self.ack_num, packet_num, False, False, False, self.checksum_mode, log_sink=self.log_sink, eom=packet_num in self.message_ends)
+        datagram = segment.to_buffer(self.datagram, self.payloads[packet_num])
+        self.send_datagram(datagram)
+        self.adapt_segment_size(len(datagram))
+        self.seq_num += 1
+        self.metrics.transmissions += 1
+        self.high_seq = max(self.high_seq, packet_num + 1)
+        if packet_num in self.send_times:
+            self.retransmitted.add(packet_num)
+            self.metrics.retransmissions += 1
+        self.send_times[packet_num] = self.loop.time()
+        if self.timer is None:
+            self.restart_timer()
+        self.add_parity(packet_num)
+
+    def adapt_segment_size(self, size):
+        """
+        count a data segment towards the corruption rate in adaptive mode, and resize the next payloads once a sample is complete
+
+        arguments:
+        size -- the length of the datagram
+        """
+        if self.sizer is not None and self.sizer.segment_sent(size):
+            payload_size = self.sizer.payload_size(self.payload_size, self.max_payload_size(), self.payload_overhead())
+            if payload_size != self.payload_size:
+                print("Payload size:", payload_size)
+                self.payload_size = payload_size
+
+    def corrupt_reported(self):
+        """
+        count a corrupt segment reported by the server towards the corruption rate in adaptive mode, and resend one of the segments not yet acknowledged
+
+        on a noisy link most transmissions of a large segment arrive damaged, whether the segment size is fixed or the segment was cut before the payload size shrank; waiting for the backed-off retransmission timer would stall the connection for seconds each time. A report shows that the server is alive and that one transmission was lost to corruption rather than congestion, so one segment is resent per report, cycling through the outstanding segments that were neither acknowledged nor SACKed; the client never sends more than the server answers
+        """
+        if self.sizer is not None:
+            self.sizer.corrupt_reported()
+        self.corrupt_reports += 1
+        outstanding = [p for p in range(self.base, self.high_seq) if p not in self.acked]
+        if not outstanding:
+            return
+        later = [p for p in outstanding if p >= self.corrupt_cursor]
+        packet_num = later[0] if later else outstanding[0]
+        self.corrupt_cursor = packet_num + 1
+        if self.verbose:
+            print("Corrupt segment reported, retransmitting packet number:", packet_num)
+        self.retries_left = self.retry
+        self.send_segment(packet_num)
+
+    def add_parity(self, packet_num):
+        """
+        add a data segment sent for the first time to the parity of its block, and send the parity once the block is complete or the segment ends a message
+
+        the parity of a partial block is sent at the end of every message, so the last segments of a message, whose loss only the retransmission timer would otherwise detect, can be rebuilt too; the block goes on with the next message and its parity then covers the whole block
+
+        arguments:
+        packet_num -- the packet number of the segment sent
+        """
+        if self.parity is None or packet_num != self.parity.next:
+            return
+        eom = packet_num in self.message_ends
+        self.parity.add(packet_num, self.payloads[packet_num], eom)
+        if self.parity.full() or eom:
+            segment = Segment(self.src_port, self.dst_port, self.seq_num, self.ack_num, self.parity.start, False, False, False, self.checksum_mode, log_sink=self.log_sink, parity=True)
+            self.send_datagram(segment.to_bytes(self.parity.payload()))
+            self.metrics.parities_sent += 1
+            if self.parity.full():
+                self.parity.reset()
+
+    def send_datagram(self, datagram):
+        """
+        send a segment to the server and count it in the metrics
+        """
+        self.transport.sendto(datagram, (self.dst_addr, self.dst_port))
+        self.metrics.sent(len(datagram))
+
+    def sample_rtt(self, rtt):
+        """
+        feed a round-trip time measurement to the estimator and record it in the metrics
+        """
+        self.rtt.sample(rtt)
+        self.metrics.record_rtt(rtt, self.rtt.srtt, self.rtt.rto)
+
+    def start_timer(self):
+        """
+        (re)start the retransmission timer with the current RTO
+        """
+        self.stop_timer()
+        self.timer = self.wheel.schedule(self.rtt.rto, self.on_timeout)
+
+    def stop_timer(self):
+        """
+        stop the retransmission timer
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def restart_timer(self):
+        """
+        (re)start the retransmission timer with the current RTO, or stop it when no segment is outstanding
+        """
+        if self.base < self.high_seq:
+            self.start_timer()
+        else:
+            self.stop_timer()
+
+    def on_timeout(self):
+        """
+        Called by the timer wheel when the retransmission timer expires.
+
+        The timeout backs off and the last segment of the current state is retransmitted: the SYN, the ACK of the handshake until the server confirmed it, the outstanding data (see retransmit) or the FIN. After too many timeouts without progress the connection fails; a FIN that is never answered is given up on, since the data already arrived.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.timer = None
+        self.metrics.timeouts += 1
+        if self.state == CLIENT_FIN_SENT:
+            if self.fin_attempts >= FIN_ATTEMPTS:
+                print("Server Disconnected")
+                self.state = CLIENT_CLOSED
+                if not self.closed.done():
+                    self.closed.set_result(None)
+                return
+            print("Timeout occurred, trying again...")
+            self.rtt.backoff()
+            self.send_fin()
+            return
+        if self.retries_left <= 0:
+            print("Timeout occurred")
+            self.fail(Exception(f"Failed to receive packet after {self.retry} attempts"))
+            return
+        self.retries_left -= 1
+        self.rtt.backoff()
+        if self.state == CLIENT_SYN_SENT:
+            print("Timeout occurred, resending SYN...")
+            self.send_syn()
+        elif self.state == CLIENT_ESTABLISHED:
+            if not self.ready:
+                print("Timeout occurred, trying again...")
+                self.send_handshake_ack()
+            if self.base < self.high_seq:
+                print("Timeout occurred, retransmitting...")
+                self.retransmit()
+                print("Congestion window:", self.congestion_state())
+
+    def fail(self, exc):
+        """
+        end the connection with an error, raised by the coroutine waiting on it
+        """
+        self.failure = exc
+        self.stop_timer()
+        self.state = CLIENT_CLOSED
+        self.update_persist()
+        for future in (self.established, self.closed):
+            if not future.done():
+                future.set_exception(exc)
+                future.exception() # the exception is also raised by send, do not report it as never retrieved
+        self.window_open.set()
+
+    def handle_ack(self, packet_num, data, window_update=False):
+        """
+        Processes an acknowledgment received from the server during the data transfer.
+
+        The packet number of an acknowledgment is the next in-order segment the server expects, so every segment below it has been delivered and the window base slides forward. The newest acknowledged segment provides an RTT sample unless it was retransmitted, the retransmission timer is restarted and, outside of loss recovery, the congestion window grows.
+
+        An acknowledgment that repeats the current base while segments are outstanding, with an unchanged window, is a duplicate; one that changes the window only reports that the application read data. On the third duplicate the base segment is retransmitted right away (fast retransmit): alone in selective-repeat mode, together with the rest of the window in go-back-n mode.
+
+        In selective-repeat mode the payload holds SACK blocks for the segments the server buffered out of order; these are marked as acknowledged and any hole with at least DUP_THRESH SACKed segments above it is retransmitted once, without waiting for the timeout.
+
+        Both kinds of loss detection start a loss recovery episode, which reduces the congestion window once until every segment outstanding at the time of the loss has been acknowledged.
+
+        Args:
+            packet_num (int): The cumulative acknowledgment carried by the segment.
+            data (bytes): The payload of the acknowledgment.
+            window_update (bool): True if the acknowledgment changed the receive window.
+
+        Returns:
+            bool: True if the acknowledgment moved the window base forward.
+        """
+        progress = False
+        if packet_num > self.base:
+            if self.verbose:
+                print("ACK for packet number:", packet_num - 1)
+            now = self.loop.time()
+            newest = min(packet_num, self.num_segments) - 1
+            if newest in self.send_times and newest not in self.retransmitted:
+                self.sample_rtt(now - self.send_times[newest])
+            for p in range(self.base, newest + 1):
+                self.metrics.bytes_delivered += len(self.payloads.pop(p, b''))
+                self.send_times.pop(p, None)
+                self.retransmitted.discard(p)
+                self.message_ends.discard(p)
+            acked = newest + 1 - self.base
+            self.base = newest + 1
+            self.high_seq = max(self.high_seq, self.base) # a zero-window probe may be acknowledged before it counts as sent
+            self.next_seq_num = max(self.next_seq_num, self.base)
+            self.acked = {p for p in self.acked if p >= self.base}
+            self.sack_retransmitted = {p for p in self.sack_retransmitted if p >= self.base}
+            self.dup_acks = 0
+            # Grow the window outside of loss recovery, and only while it limits the sender
+            if self.base >= self.recovery_point and self.cc.window() <= self.flow_window():
+                self.cc.on_ack(acked, now, self.rtt.srtt)
+            self.restart_timer()
+            if self.verbose:
+                print("update base value:", self.base)
+            self.window_open.set()
+            progress = True
+
+        elif packet_num == self.base and self.base < self.high_seq and not window_update:
+            self.dup_acks += 1
+            self.metrics.dup_acks += 1
+            # Limited transmit: the first duplicates let a new segment out to keep the ACK clock running
+            self.window_open.set()
+            if self.dup_acks == DUP_THRESH:
+                print(f"Fast retransmit of packet number: {self.base}")
+                self.enter_recovery()
+                if not self.selective_repeat:
+                    self.next_seq_num = self.base # go back to the missing packet
+                elif self.base not in self.sack_retransmitted:
+                    self.send_segment(self.base)
+                    self.sack_retransmitted.add(self.base)
+
+        if not self.selective_repeat:
+            return progress
+
+        for start, end in unpack_sack(data):
+            start = unwrap(start, self.base)
+            end = start + (end - start) % SEQ_MODULUS
+            self.acked.update(range(max(start, self.base), min(end, self.high_seq)))
+
+        # Retransmit the holes that have enough SACKed segments above them
+        sacked_above = len(self.acked)
+        for p in range(self.base, self.high_seq):
+            if sacked_above < DUP_THRESH:
+                break
+            if p in self.acked:
+                sacked_above -= 1
+            elif p not in self.sack_retransmitted:
+                print(f"Packet num: {p} was not received. Retransmitting the hole")
+                self.enter_recovery()
+                self.send_segment(p)
+                self.sack_retransmitted.add(p)
+        return progress
+
+    def enter_recovery(self):
+        """
+        start a loss recovery episode unless one is already running
+        the congestion window is reduced once per episode, which ends when the base passes the highest packet sent at its start
+        an episode that starts after the server reported corrupt segments is put down to corruption rather than congestion, and leaves the window alone; timeouts still collapse it
+        """
+        if self.base >= self.recovery_point:
+            if self.corrupt_reports:
+                print("Loss put down to corruption, congestion window kept")
+            else:
+                self.cc.on_loss(self.loop.time())
+            self.corrupt_reports = 0
+            self.recovery_point = self.high_seq
+            print("Congestion window:", self.congestion_state())
+
+    def retransmit(self):
+        """
+        Retransmits the outstanding segments after the retransmission timer expired.
+
+        The congestion window collapses and the send pointer is rewound to the window base, so the send loop resends the outstanding segments as the window reopens. In go-back-n mode every segment from the base is resent, in selective-repeat mode the segments that were SACKed (or already retransmitted as holes) are skipped. The timer is then restarted with the backed-off RTO.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.cc.on_timeout(self.loop.time())
+        self.recovery_point = self.high_seq
+        self.sack_retransmitted.clear()
+        print("base value:", self.base)
+        self.next_seq_num = self.base # missing packet
+        self.restart_timer()
+        self.window_open.set()
+
+    def congestion_state(self):
+        """
+        return a snapshot of the congestion control state of the connection
+
+        return:
+        a dict with the algorithm name, the congestion window (cwnd) and slow start threshold (ssthresh) in segments, the window that is currently used for sending and whether a loss recovery is in progress
+        """
+        state = self.cc.state()
+        state['window'] = min(self.cc.window(), self.flow_window())
+        state['in_recovery'] = self.base < self.recovery_point
+        return state
+
+    def send_window(self):
+        """
+        return the number of segments the sender may have outstanding: the congestion window, plus one segment for each of the first two duplicate ACKs (limited transmit, RFC 3042), capped by the receive window
+        """
+        return min(self.cc.window() + min(self.dup_acks, DUP_THRESH - 1), self.flow_window())
+
+    def flow_window(self):
+        """
+        return the number of segments that fit in the receive window advertised by the server, 0 while the window is closed
+        a receive buffer smaller than one segment still takes one segment at a time while it is empty
+        """
+        segments = self.receive_window // min(self.segment_size, self.payload_size + self.payload_overhead())
+        if segments == 0 and self.receive_window >= self.full_window:
+            return 1
+        return segments
+
+    def update_persist(self):
+        """
+        arm the persist timer when the receive window closed with nothing outstanding, stop it once the window opens
+
+        without segments in flight no acknowledgment would ever tell the client that the window reopened if the window update of the server were lost, so the client probes the window instead
+        """
+        closed = self.state == CLIENT_ESTABLISHED and self.flow_window() == 0 and self.base >= self.high_seq and self.base in self.payloads and (self.base + 1 < self.num_segments or self.end_of_data)
+        if not closed:
+            if self.persist_timer is not None:
+                self.persist_timer.cancel()
+                self.persist_timer = None
+            self.persist_interval = 0
+        elif self.persist_timer is None:
+            self.persist_interval = self.persist_interval or self.rtt.rto
+            self.persist_timer = self.wheel.schedule(self.persist_interval, self.on_persist)
+
+    def on_persist(self):
+        """
+        Called by the timer wheel when the persist timer expires: sends a zero-window probe.
+
+        The probe is the next segment of the data. A server without room holds it and answers with its current window, a server that made room in the meantime delivers and acknowledges it. Probes back off like the RTO, but they neither collapse the congestion window nor count as retransmission attempts, since the server answers them.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.persist_timer = None
+        if self.state != CLIENT_ESTABLISHED or self.flow_window() > 0 or self.base not in self.payloads:
+            return
+        print(f"Zero window, probing with packet number: {self.base}")
+        segment = Segment(self.src_port, self.dst_port, self.seq_num, self.ack_num, self.base, False, False, False, self.checksum_mode, log_sink=self.log_sink, eom=self.base in self.message_ends)
+        datagram = segment.to_buffer(self.datagram, self.payloads[self.base])
+        self.send_datagram(datagram)
+        self.adapt_segment_size(len(datagram))
+        self.seq_num += 1
+        self.metrics.transmissions += 1
+        self.metrics.probes += 1
+        self.add_parity(self.base)
+        self.persist_interval = min(self.persist_interval * 2, MAX_RTO)
+        self.persist_timer = self.wheel.schedule(self.persist_interval, self.on_persist)
+
+    async def read_ahead(self, limit):
+        """
+        pull payloads from the source until the segments below limit are available or the source is exhausted
+        an asynchronous source is awaited, so a slow producer never holds up the event loop
+        once the source is exhausted, the last segment of the message is marked as its end
+
+        arguments:
+        limit -- one past the highest packet number that may be sent next
+        """
+        while not self.end_of_data and self.num_segments < limit:
+            if hasattr(self.source, '__anext__'):
+                payload = await anext(self.source, None)
+            else:
+                payload = next(self.source, None)
+            if payload is None:
+                self.end_of_data = True
+                if self.num_segments > self.message_start:
+                    self.message_ends.add(self.num_segments - 1)
+                break
+            if not len(payload):
+                continue
+            self.payloads[self.num_segments] = payload
+            self.bytes_sent += len(payload)
+            self.num_segments += 1
+
+    def pump(self):
+        """
+        send every segment that fits in both the congestion window and the receive window
+        the last segment pulled waits until the segment after it is pulled or the source is exhausted, so it is sent knowing whether it ends the message
+        """
+        windowSize = self.send_window()
+        available = self.num_segments if self.end_of_data else self.num_segments - 1
+        while self.next_seq_num < min(self.base + windowSize, available):
+            if self.next_seq_num not in self.acked and self.next_seq_num not in self.sack_retransmitted:
+                if self.verbose:
+                    print("sending Packet number sent:", self.next_seq_num)
+                self.send_segment(self.next_seq_num)
+            self.next_seq_num += 1
+
+    async def connect(self):
+        """
+        connect to the server
+        waits until the connection is established
+
+        it should support protection against segment loss/corruption/reordering
+
+        in fast open mode the handshake is deferred to the first send, which carries its first segment in the SYN
+        """
+        if self.fast_open:
+            print("Fast open, connecting with the first message")
+            return
+        self.state = CLIENT_SYN_SENT
+        self.send_syn()
+        await self.established
+        print("Connection established")
+
+    async def send(self, data):
+        """
+        send a chunk of data of arbitrary size to the server
+        waits until all data is acknowledged
+
+        it should support protection against segment loss/corruption/reordering and flow control
+
+        the data is consumed as a stream: segments are pulled from it only when they fit in the window and released once they are acknowledged, so memory stays bounded by the window whatever the size of the data
+
+        every call sends one message over the same connection, its last segment carries the end-of-message flag so the server can tell the messages apart (see AsyncConnection.recv_message); empty messages are not sent. In fast open mode the first call also opens the connection, the payload of its segments shrinks by the size of the SYN options so that its first segment fits in the SYN
+
+        arguments:
+        data -- the data to be sent to the server: a bytes-like object (not modified until send returns), a binary file object, an iterable or an asynchronous iterable of bytes-like chunks
+
+        return:
+        the number of bytes of the message sent
+        """
+        opening = self.fast_open and self.state == CLIENT_CLOSED and not self.established.done()
+        if opening:
+            # The SYN-ACK sets the payload size of the segments after those pulled for the SYN
+            self.payload_size = self.early_payload_size(self.segment_size)
+        else:
+            await self.established
+        start = self.bytes_sent
+        self.message_start = self.num_segments
+        self.end_of_data = False
+        if hasattr(data, '__aiter__'):
+            self.source = read_segments_async(data, self.next_payload_size)
+        else:
+            self.source = read_segments(data, self.next_payload_size)
+        if opening:
+            # Pull the segment after the first too, so the SYN knows whether it carries the whole message
+            await self.read_ahead(2)
+            self.state = CLIENT_SYN_SENT
+            self.send_syn()
+            await self.established
+        print("Window size:", self.flow_window())
+        print("Sending data to server...")
+        self.seq_num += 1
+        while True:
+            self.window_open.clear()
+            # Pull one segment more than the window holds, so the end of the message is noticed before its last segment is sent, even while the window is closed
+            await self.read_ahead(self.base + max(self.send_window(), 1) + 1)
+            if self.failure is not None:
+                raise self.failure
+            if self.end_of_data and self.base >= self.num_segments:
+                break
+            self.pump()
+            self.update_persist()
+            # Sliding the window once acknowledgments arrive
+            await self.window_open.wait()
+
+        print("All segments have been sent")
+        print("Number of packets:", self.num_segments)
+        return self.bytes_sent - start
+
+    async def close(self):
+        """
+        request to close the connection with the server
+        waits until the server acknowledged the FIN
+        """
+        if self.state == CLIENT_ESTABLISHED:
+            self.state = CLIENT_FIN_SENT
+            self.send_fin()
+            await asyncio.shield(self.closed)
+        self.stop_timer()
+        self.update_persist()
+        if self.metrics_dump is not None:
+            self.metrics_dump.close()
+        print("Closing connection...")
+        self.transport.close()
+        self.log_sink.close()
+
+
+#
+# Server
+#
+class AsyncConnection:
+    """
+    The server side of the connection with one client.
+
+    Every connection has its own state, receive buffers and counters. The server routes the datagrams of the client to segment_received, which runs on the event loop; the application reads the data with the receive, recv_into and stream coroutines, or message by message with recv_message.
+    """
+
+    def __init__(self, server, addr):
+        """
+        arguments:
+        server -- the AsyncServer that owns the endpoint
+        addr -- the address of the client
+        """
+        self.server = server
+        self.addr = addr
+        self.state = STATE_SYN_RECEIVED
+        self.seq_num = 0
+        self.ack_num = 0
+        self.packet_num = 0
+        self.selective_repeat = False
+        self.checksum_mode = CHECKSUM_MD5
+        self.window_scale = 0 # shift count of the window field, granted when the client sends the window scale option
+        self.expected_packet = 0
+        self.reorder_buffer = {} # out-of-order segments, and the next in-order one while the data buffer is full
+        self.buffered_bytes = 0
+        self.advertised = 0 # the window in bytes carried by the last acknowledgment
+        self.unacked = 0 # in-order segments received since the last acknowledgment
+        self.ack_timer = None # the delayed acknowledgment timer on the timer wheel, None when no acknowledgment is pending
+        self.metrics = Metrics(server.loop.time)
+        self.largest_segment = 0 # the largest data segment received, in bytes, for the window update threshold
+        self.length = 0
+        self.consumed = 0 # bytes handed to the application
+        self.eom_packets = set() # packet numbers of segments that end a message, not yet delivered
+        self.message_ends = collections.deque() # offsets in the stream of the ends of the delivered messages not yet read
+        self.fec_block = 0 # data segments covered by a parity segment, granted when the client sends the FEC option
+        self.fec_payloads = {} # packet number -> (data, end of message), for the segments received in the blocks not yet delivered
+        self.parities = {} # first packet number of a block -> number of segments covered -> parity, for the blocks not yet delivered
+        self.fec_floor = 0 # first packet number of the oldest block not yet delivered
+        self.data_buffer = bytearray() # in-order data not yet read by the application, at most receive_buffer_size bytes
+        self.data_ready = asyncio.Event() # set when data arrives or the client closes
+        self.end_of_stream = False # set when the FIN arrives, no more data will be added to the data buffer
+        self.discard = False # set by close, data that the application will never read is dropped on arrival
+        self.datagram = bytearray(MAX_HEADER_SIZE + 4 * MAX_SACK_BLOCKS) # reused for every acknowledgment
+        self.closing_conn = asyncio.Event()
+
+    def segment_received(self, datagram):
+
+        """
+        Handles a segment from the client. This method is responsible for the server-side implementation of the transport protocol.
+
+        The segment is decoded into its constituent parts and the flags determine the type of the packet (SYN, ACK, FIN).
+
+        If the segment is a SYN packet, the method sends a SYN-ACK back to the client. If it's an ACK packet, the method sends a message to the client indicating readiness to receive data and hands the connection to accept(). If it's a FIN packet, the method sends a FIN-ACK and sets a flag to indicate the closing of the connection. Retransmitted SYNs, ACKs and FINs are answered again, so the client recovers from a lost reply.
+
+        The client sends data right after the SYN-ACK without waiting for the readiness message, so a data segment or a FIN arriving before the ACK of the handshake also establishes the connection. A SYN with the fast open option establishes it at once and its data is delivered as the first segment; the packet number of the SYN-ACK then acknowledges it. There is no cookie guarding fast open, so a spoofed SYN can make the server accept a connection and deliver one segment of data to the application, which is acceptable on the trusted links MRT is meant for.
+
+        If the server is in a state to receive data (after receiving an ACK packet), it processes incoming data packets. It checks the sequence number of the packet and if it matches the expected sequence number and the packet is not corrupt, it processes the data and sends an ACK. If the sequence number doesn't match or the packet is corrupt, it discards the data and sends an ACK for the last received in-order segment.
+
+        When the client negotiated selective-repeat in the SYN, out-of-order segments are kept in a reorder buffer (bounded by the receive buffer size) instead of being discarded, and every ACK carries SACK blocks describing the buffered ranges so that the client only retransmits the holes.
+
+        Acknowledgments always carry the packet number of the next in-order segment the server expects (cumulative acknowledgment), so one acknowledgment covers every segment delivered before it, and the room left in the receive buffer (see window), so the client never sends more than the application can absorb. When the application has not read enough to make room for the next in-order segment, that segment (usually a zero-window probe) is held and acknowledged with the closed window; reading the data releases it (see recv_into).
+
+        In-order segments are acknowledged lazily (see ack_data): every server.ack_every segments, or server.ack_delay seconds after the first one left unacknowledged. Segments the client needs to hear about at once, out-of-order, duplicate, corrupt or held ones, those filling a hole and those ending a message, are acknowledged right away, so fast retransmit and SACK work as before and the send of a message completes without waiting for the delayed acknowledgment.
+
+        The method also handles timeouts and retries for buffering data.
+
+        Args:
+            datagram (bytes): The segment.
+
+        Returns:
+            None
+        """
+
+        server = self.server
+        addr = self.addr
+        self.metrics.received(len(datagram))
+        segment = Segment(server.src_port, addr[1], self.seq_num, self.ack_num, self.packet_num, False, False, False, log_sink=server.log_sink)
+        # A SYN is sent before the checksum is negotiated and always uses MD5, every other segment must use the negotiated mode
+        syn = len(datagram) > FLAGS_OFFSET and datagram[FLAGS_OFFSET] & 0b100
+        self.seq_num, _, packet_num, SYN, ACK, FIN, corrupt, data = segment.from_bytes(datagram, CHECKSUM_MD5 if syn else self.checksum_mode)
+        self.packet_num = unwrap(packet_num, self.expected_packet)
+        self.metrics.corrupt += corrupt
+
+        # A corrupt control segment cannot be trusted, wait for the client to resend it
+        if corrupt and (SYN or ACK or FIN):
+            return
+
+        # Once closed, only answer retransmitted FINs
+        if self.state == STATE_CLOSED:
+            if FIN and not SYN and not ACK:
+                self.send_fin_ack()
+            return
+
+        # Check if the segment is a SYN packet
+        if SYN == True and ACK == False and FIN == False:
+            print("SYN packet received")
+            # Negotiate the transfer mode requested by the client, the data of a fast open SYN follows its options
+            options, early = split_early_data(data)
+            options = unpack_options(options)
+            self.selective_repeat = OPT_SACK_PERMITTED in options
+            granted = {OPT_SACK_PERMITTED: b''} if self.selective_repeat else {}
+            print("Transfer mode:", "selective-repeat" if self.selective_repeat else "go-back-n")
+            # Pick the checksum for the rest of the connection, clients without the option only know MD5
+            if OPT_CHECKSUM in options:
+                self.checksum_mode = choose_checksum(options[OPT_CHECKSUM])
+                granted[OPT_CHECKSUM] = bytes([self.checksum_mode])
+            else:
+                self.checksum_mode = CHECKSUM_MD5
+            print("Checksum mode:", self.checksum_mode)
+            # Scale the window field only if the client understands the option
+            if OPT_WINDOW_SCALE in options:
+                self.window_scale = window_scale(server.receive_buffer_size)
+                granted[OPT_WINDOW_SCALE] = bytes([self.window_scale])
+            # Cap the segment size offered by the client at the largest segment the server accepts
+            mss = options.get(OPT_MSS, b'')
+            if len(mss) == 2:
+                granted[OPT_MSS] = struct.pack('!H', min(struct.unpack('!H', mss)[0], server.max_segment_size))
+            # Forward error correction with the block size of the client, the parity of a block rebuilds one segment of it from the reorder buffer
+            block = options.get(OPT_FEC, b'')
+            if self.selective_repeat and len(block) == 1 and block[0]:
+                self.fec_block = block[0]
+                granted[OPT_FEC] = bytes([self.fec_block])
+            # Fast open: the connection is established and the data of the SYN is the first segment, unless a retransmitted SYN already delivered it
+            if OPT_FAST_OPEN in options:
+                granted[OPT_FAST_OPEN] = b''
+                self.establish()
+                if early and self.expected_packet == 0:
+                    print("Fast open data received")
+                    self.largest_segment = max(self.largest_segment, len(datagram))
+                    if segment.eom:
+                        self.eom_packets.add(0)
+                    if self.fec_block:
+                        self.fec_payloads[0] = (early, segment.eom)
+                    self.deliver(early)
+            # Send SYN-ACK, its packet number acknowledges the data of a fast open SYN
+            self.ack_num += 1
+            segment = Segment(server.src_port, addr[1], self.seq_num, self.ack_num, self.expected_packet, True, True, False, self.checksum_mode, log_sink=server.log_sink, window=self.window())
+            self.send_datagram(segment.to_bytes(struct.pack('!I', server.receive_buffer_size) + pack_options(granted)))
+            print("SYN-ACK packet sent")
+        # Check if the segment is an ACK packet
+        elif SYN == False and ACK == True and FIN == False:
+            print("ACK packet received")
+            self.ack_num += 1
+            segment = Segment(server.src_port, addr[1], self.seq_num, self.ack_num, self.packet_num, False, False, False, self.checksum_mode, log_sink=server.log_sink, window=self.window())
+            self.send_datagram(segment.to_bytes(b'ready'))
+            self.establish()
+        # Checks if the segment is a FIN packet
+        elif SYN == False and ACK == False and FIN == True:
+            print("FIN packet received")
+            self.establish()
+            self.state = STATE_CLOSED
+            self.cancel_delayed_ack()
+            self.end_of_stream = True
+            self.data_ready.set()
+            self.send_fin_ack()
+            self.closing_conn.set()
+            server.wheel.schedule(TIME_WAIT, server.purge, self)
+
+        elif segment.parity and not corrupt:
+            # Parity segments are only sent once the client is established, and ignored unless forward error correction was granted
+            self.establish()
+            if self.fec_block:
+                if self.parity_received(self.packet_num, data):
+                    self.send_ack()
+                self.trim_fec()
+
+        elif not corrupt or self.state == STATE_ESTABLISHED:
+            # Handle data packet, the first one establishes the connection if the ACK of the handshake was lost
+            self.establish()
+            if self.server.verbose:
+                print(f"Data packet {self.packet_num}")
+            self.largest_segment = max(self.largest_segment, len(datagram))
+            if segment.eom and not corrupt:
+                self.eom_packets.add(self.packet_num)
+
+            delayable = False
+            # If the sequence number is what we expect, deliver the data and every buffered segment that follows it
+            if self.packet_num == self.expected_packet and not corrupt:
+                if self.has_room(len(data)):
+                    self.deliver(data)
+                    # A segment that fills a hole or ends a message is acknowledged at once, so the client learns of the recovery or completes its send
+                    delayable = not self.reorder_buffer and not segment.eom
+                    self.drain()
+                elif self.packet_num not in self.reorder_buffer:
+                    # Hold it until the application reads, recv_into acknowledges it then
+                    self.reorder_buffer[self.packet_num] = data
+                    self.buffered_bytes += len(data)
+
+            # In selective-repeat mode, hold an out-of-order segment until the hole before it is filled
+            elif self.selective_repeat and self.packet_num > self.expected_packet and not corrupt:
+                if self.packet_num not in self.reorder_buffer and self.buffered_bytes + len(data) <= server.receive_buffer_size:
+                    self.reorder_buffer[self.packet_num] = data
+                    self.buffered_bytes += len(data)
+                    if self.server.verbose:
+                        print(f"Out-of-order packet {self.packet_num} buffered, expected packet {self.expected_packet}")
+                self.metrics.out_of_order += 1
+
+            # Otherwise discard the data, the ACK below repeats the last in-order position
+            else:
+                if not corrupt:
+                    if self.packet_num < self.expected_packet:
+                        self.metrics.duplicates += 1
+                    else:
+                        self.metrics.out_of_order += 1
+
+            # Keep the segments delivered or buffered for the parity of their block, a recovered segment is acknowledged at once
+            if self.fec_block and not corrupt and self.packet_num >= self.fec_floor and (self.packet_num < self.expected_packet or self.packet_num in self.reorder_buffer):
+                self.fec_payloads.setdefault(self.packet_num, (data, segment.eom))
+                if self.recover(self.packet_num - self.packet_num % self.fec_block):
+                    delayable = False
+                self.trim_fec()
+
+            if delayable:
+                self.ack_data()
+            else:
+                self.send_ack(corrupt)
+
+    def parity_received(self, start, payload):
+        """
+        Stores the parity of a block of data segments and rebuilds the segment it covers that did not arrive, if only one did not.
+
+        Args:
+            start (int): The packet number of the first segment of the block.
+            payload (bytes-like): The payload of the parity segment, the number of segments covered followed by the parity.
+
+        Returns:
+            bool: True if a segment was rebuilt.
+        """
+        count = payload[0] if payload else 0
+        if not count or start < self.fec_floor or start + count <= self.expected_packet:
+            return False
+        self.parities.setdefault(start, {})[count] = payload[1:]
+        return self.recover(start)
+
+    def recover(self, start):
+        """
+        Rebuilds the missing data segments of a block from its parities.
+
+        A parity covers the first segments of the block, the client sends one for the partial block at the end of every message and one for the whole block. A parity rebuilds the segment it covers when it is the only one missing; that may leave a single segment missing under another parity of the block, so the parities are tried again until none helps. A parity is dropped once it has nothing left to rebuild.
+
+        Args:
+            start (int): The packet number of the first segment of the block.
+
+        Returns:
+            bool: True if a segment was rebuilt.
+        """
+        parities = self.parities.get(start)
+        recovered = False
+        progress = True
+        while parities and progress:
+            progress = False
+            for count, parity in list(parities.items()):
+                missing = [p for p in range(start, start + count) if p not in self.fec_payloads]
+                if len(missing) > 1:
+                    continue
+                del parities[count]
+                if not missing:
+                    continue
+                result = recover_segment(parity, [self.fec_payloads[p] for p in range(start, start + count) if p != missing[0]])
+                if result is not None and self.accept_recovered(missing[0], *result):
+                    recovered = progress = True
+        return recovered
+
+    def accept_recovered(self, packet_num, data, eom):
+        """
+        Delivers or buffers a segment rebuilt from a parity, as if it had arrived.
+
+        Args:
+            packet_num (int): The packet number of the segment, at or above the next in-order one.
+            data (bytes): The data of the segment.
+            eom (bool): True if the segment ends a message.
+
+        Returns:
+            bool: True if the segment was kept, False if the reorder buffer had no room for it.
+        """
+        if packet_num == self.expected_packet and self.has_room(len(data)):
+            if eom:
+                self.eom_packets.add(packet_num)
+            self.deliver(data)
+            self.drain()
+        elif packet_num == self.expected_packet or self.buffered_bytes + len(data) <= self.server.receive_buffer_size:
+            if eom:
+                self.eom_packets.add(packet_num)
+            self.reorder_buffer[packet_num] = data
+            self.buffered_bytes += len(data)
+        else:
+            return False
+        if self.server.verbose:
+            print(f"Data packet {packet_num} recovered")
+        self.fec_payloads[packet_num] = (data, eom)
+        self.metrics.recovered += 1
+        return True
+
+    def trim_fec(self):
+        """
+        Drops the segments and parities of the blocks delivered in full.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        floor = self.expected_packet - self.expected_packet % self.fec_block
+        if floor <= self.fec_floor:
+            return
+        for p in range(self.fec_floor, floor):
+            self.fec_payloads.pop(p, None)
+        for start in [start for start in self.parities if start < floor]:
+            del self.parities[start]
+        self.fec_floor = floor
+
+    def establish(self):
+        """
+        Establishes the connection on the first segment that shows the client completed the handshake, and hands it to accept().
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self.state == STATE_SYN_RECEIVED:
+            self.state = STATE_ESTABLISHED
+            self.server.accept_queue.put_nowait(self)
+
+    def ack_data(self):
+        """
+        Acknowledges in-order data lazily: the acknowledgment is sent once server.ack_every segments are pending, otherwise the delayed acknowledgment timer sends it after server.ack_delay seconds. A segment that leaves less than the update threshold of room is acknowledged at once, since the client cannot send more until it learns about the window, and a later window update is only sent if the last advertised window was below the threshold.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.unacked += 1
+        if self.unacked >= self.server.ack_every or self.window() << self.window_scale < self.update_threshold():
+            self.send_ack()
+        elif self.ack_timer is None:
+            self.ack_timer = self.server.wheel.schedule(self.server.ack_delay, self.on_ack_timer)
+
+    def on_ack_timer(self):
+        """
+        Called by the timer wheel when the delayed acknowledgment timer expires.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.ack_timer = None
+        if self.unacked and self.state == STATE_ESTABLISHED:
+            self.send_ack()
+
+    def cancel_delayed_ack(self):
+        """
+        Stops the delayed acknowledgment timer, the next acknowledgment covers the pending segments.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        self.unacked = 0
+        if self.ack_timer is not None:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+
+    def send_ack(self, corrupt_seen=False):
+        """
+        Acknowledges the next in-order packet expected, with SACK blocks in selective-repeat mode.
+
+        The acknowledgment is cumulative, so it also stands for any delayed acknowledgment that was pending. An acknowledgment answering a corrupt segment says so with its corrupt-seen flag, which the client uses to size its segments.
+
+        Args:
+            corrupt_seen (bool): True if the acknowledgment answers a corrupt segment.
+
+        Returns:
+            None
+        """
+        server = self.server
+        self.cancel_delayed_ack()
+        self.metrics.acks_sent += 1
+        self.ack_num += 1
+        window = self.window()
+        self.advertised = window << self.window_scale
+        self.metrics.record_window(self.advertised)
+        segment = Segment(server.src_port, self.addr[1], self.seq_num, self.ack_num, self.expected_packet, False, True, False, self.checksum_mode, log_sink=server.log_sink, window=window, corrupt_seen=corrupt_seen)
+        payload = pack_sack(self.sack_blocks()) if self.selective_repeat else b''
+        self.send_datagram(segment.to_buffer(self.datagram, payload))
+        if self.server.verbose:
+            print(f"Ack packet number {self.expected_packet} sent")
+
+    def window(self):
+        """
+        Returns the value of the window field of the segments sent to the client: the room left in the receive buffer, in units of 2^window_scale bytes (rounded down, so the client never overruns the buffer).
+
+        The window counts from the next in-order segment, so out-of-order segments held for selective-repeat lie inside it and do not shrink it.
+
+        Args:
+            None
+
+        Returns:
+            int: The window, at most MAX_WINDOW.
+        """
+        return min(self.free_space() >> self.window_scale, MAX_WINDOW)
+
+    def free_space(self):
+        """
+        Returns the number of bytes the data buffer can still take before the application reads.
+
+        Args:
+            None
+
+        Returns:
+            int: The free space, the whole buffer while data is being discarded.
+        """
+        if self.discard:
+            return self.server.receive_buffer_size
+        return max(0, self.server.receive_buffer_size - len(self.data_buffer))
+
+    def send_fin_ack(self):
+        """
+        Answers a FIN with a FIN-ACK, so the client can tell it apart from late data acknowledgments.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        server = self.server
+        self.ack_num += 1
+        segment = Segment(server.src_port, self.addr[1], self.seq_num, self.ack_num, self.packet_num, False, True, True, self.checksum_mode, log_sink=server.log_sink, window=self.window())
+        self.send_datagram(segment.to_bytes(b''))
+
+    def send_datagram(self, datagram):
+        """
+        Sends a segment to the client and counts it in the metrics.
+
+        Args:
+            datagram (bytes-like): The segment.
+
+        Returns:
+            None
+        """
+        self.server.transport.sendto(datagram, self.addr)
+        self.metrics.sent(len(datagram))
+
+    def has_room(self, size):
+        """
+        Tells whether the data buffer can take a segment of the given size.
+
+        Args:
+            size (int): The length of the data of the segment.
+
+        Returns:
+            bool: True if the unread data plus the segment fit in the receive buffer, if the data buffer is empty or if the data is being discarded.
+        """
+        return self.discard or not self.data_buffer or len(self.data_buffer) + size <= self.server.receive_buffer_size
+
+    def deliver(self, data):
+        """
+        Appends the next in-order data to the data buffer and wakes up the application. The end of a message is recorded as an offset in the stream for recv_message.
+
+        Args:
+            data (bytes-like): The data of the segment.
+
+        Returns:
+            None
+        """
+        self.length += len(data)
+        self.metrics.bytes_delivered += len(data)
+        if self.server.verbose:
+            print("packet length:", len(data))
+            print(f"current data_buffer length: {self.length}")
+        if not self.discard:
+            self.data_buffer += data
+            if self.expected_packet in self.eom_packets:
+                self.message_ends.append(self.length)
+        self.eom_packets.discard(self.expected_packet)
+        self.expected_packet += 1
+        self.data_ready.set()
+
+    def drain(self):
+        """
+        Delivers the buffered segments that follow the data delivered so far, as long as the data buffer has room for them.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        while self.expected_packet in self.reorder_buffer and self.has_room(len(self.reorder_buffer[self.expected_packet])):
+            data = self.reorder_buffer.pop(self.expected_packet)
+            self.buffered_bytes -= len(data)
+            self.deliver(data)
+
+    def sack_blocks(self):
+        """
+        Builds the SACK blocks describing the segments held in the reorder buffer.
+
+        Contiguous packet numbers are merged into half-open [start, end) ranges, lowest first, so that the client learns about the holes closest to its window base first.
+
+        Args:
+            None
+
+        Returns:
+            list: A list of (start, end) tuples.
+        """
+        blocks = []
+        for packet_num in sorted(self.reorder_buffer):
+            if blocks and blocks[-1][1] == packet_num:
+                blocks[-1][1] = packet_num + 1
+            else:
+                blocks.append([packet_num, packet_num + 1])
+        return [tuple(block) for block in blocks]
+
+    def release(self):
+        """
+        Reopens the receive window once the application has read.
+
+        The segment held for lack of room is delivered and acknowledged. Otherwise a window update is sent when the window grows from less than one segment to at least one segment (or to the whole buffer, when it is smaller than a segment): the client can send again, and is neither left waiting for its zero-window probe nor flooded with an update for every read.
+
+        Args:
+            None
+
+        Returns:
+            None
+        """
+        if self.state != STATE_ESTABLISHED:
+            return
+        if self.expected_packet in self.reorder_buffer:
+            self.drain()
+            if self.expected_packet not in self.reorder_buffer:
+                self.send_ack()
+            return
+        threshold = self.update_threshold()
+        if self.advertised < threshold <= self.window() << self.window_scale:
+            if self.server.verbose:
+                print("Window update sent")
+            self.send_ack()
+
+    def update_threshold(self):
+        """
+        Returns the window, in bytes, from which the client can send again: one segment, or the whole buffer when it is smaller than a segment.
+
+        Args:
+            None
+
+        Returns:
+            int: The threshold in bytes.
+        """
+        full = min(self.server.receive_buffer_size >> self.window_scale, MAX_WINDOW) << self.window_scale
+        return min(full, self.largest_segment)
+
+    async def receive(self, length):
+        """
+        receive data from the client
+        waits until the requested amount of data is received
+
+        arguments:
+        length -- the number of bytes to receive
+
+        return:
+        data -- the bytes received from the client, guaranteed to be in its original order, shorter than length only if the client closed the connection first
+        """
+        data = bytearray(length)
+        received = 0
+        with memoryview(data) as view:
+            while received < length:
+                size = await self.recv_into(view[received:])
+                if size == 0:
+                    break
+                received += size
+        del data[received:]
+        return data
+
+    async def recv_into(self, buffer):
+        """
+        receive data from the client into a buffer of the application
+        waits until some data is available or the client closed the connection
+
+        the data is handed over as soon as it arrives in order, reading it frees room in the receive buffer for the segments that follow
+
+        arguments:
+        buffer -- a writable bytes-like object
+
+        return:
+        the number of bytes written to the buffer, 0 once the client closed the connection and every byte has been read
+        """
+        view = memoryview(buffer).cast('B')
+        while not self.data_buffer and not self.end_of_stream:
+            self.data_ready.clear()
+            await self.data_ready.wait()
+        size = min(len(view), len(self.data_buffer))
+        with memoryview(self.data_buffer) as pending:
+            view[:size] = pending[:size]
+        del self.data_buffer[:size]
+        self.consumed += size
+        self.release()
+        return size
+
+    async def recv_message(self):
+        """
+        receive the next message sent by the client, the data of one AsyncClient.send call
+        waits until the last segment of the message arrived or the client closed the connection
+
+        the message is read from the receive buffer as it arrives, so it may be larger than the buffer
+
+        return:
+        the bytes of the message, None once the client closed the connection and every message has been read
+        """
+        # Message ends already read through recv_into do not bound the next message
+        while self.message_ends and self.message_ends[0] <= self.consumed:
+            self.message_ends.popleft()
+        message = bytearray()
+        while not self.message_ends or self.message_ends[0] > self.consumed:
+            if not self.data_buffer:
+                if self.end_of_stream:
+                    return bytes(message) if message else None
+                self.data_ready.clear()
+                await self.data_ready.wait()
+                continue
+            size = min(self.message_ends[0] - self.consumed, len(self.data_buffer)) if self.message_ends else len(self.data_buffer)
+            message += self.data_buffer[:size]
+            del self.data_buffer[:size]
+            self.consumed += size
+            self.release()
+        self.message_ends.popleft()
+        return bytes(message)
+
+    async def stream(self, chunk_size=65536):
+        """
+        iterate over the data received from the client as it arrives
+        the iteration ends when the client closes the connection
+
+        arguments:
+        chunk_size -- the maximum size of a chunk
+
+        return:
+        an asynchronous iterator of bytes chunks, guaranteed to be in their original order
+        """
+        buffer = bytearray(chunk_size)
+        while True:
+            size = await self.recv_into(buffer)
+            if size == 0:
+                return
+            yield bytes(buffer[:size])
+
+    async def close(self):
+        """
+        close the connection
+        waits until the client closed its side of the connection
+        data the application did not read is discarded
+        """
+        self.discard = True
+        self.data_buffer.clear()
+        self.release()
+        await self.closing_conn.wait()
+
+
+class AsyncServer(asyncio.DatagramProtocol):
+    """
+    The receiving side of MRT on an asyncio event loop.
+
+    The server is the datagram protocol of its UDP endpoint and keeps a connection table keyed by the address of the client. A SYN from an unknown address creates a new AsyncConnection, other segments are routed to the connection of their sender and handled right away on the event loop.
+    """
+
+    async def init(self, src_port, receive_buffer_size, log_level='packet', log_binary=False, ack_every=ACK_EVERY, ack_delay=ACK_DELAY, metrics_interval=None, max_segment_size=MAX_SEGMENT_SIZE):
+        """
+        initialize the server, create the UDP endpoint, and configure the receive buffer
+
+        arguments:
+        src_port -- the port the server is using to receive segments
+        receive_buffer_size -- the maximum size of the receive buffer of every connection
+        log_level -- 'off', 'summary' or 'packet' (one record per segment in log_{src_port}.txt)
+        log_binary -- write the per-packet log as binary records to log_{src_port}.bin
+        ack_every -- the number of in-order segments covered by one acknowledgment, 1 to acknowledge every segment
+        ack_delay -- the longest time in seconds an in-order segment waits for its acknowledgment
+        metrics_interval -- append a snapshot of the metrics of every connection to metrics_{src_port}.jsonl every metrics_interval seconds, None to only keep them in memory
+        max_segment_size -- the largest segment the clients may send, granted in the SYN-ACK to the clients that offer a larger one
+        """
+        if ack_every < 1:
+            raise ValueError(f"ack_every must be at least 1: {ack_every}")
+        if not MIN_SEGMENT_SIZE <= max_segment_size <= MAX_SEGMENT_SIZE:
+            raise ValueError(f"The maximum segment size must be between {MIN_SEGMENT_SIZE} and {MAX_SEGMENT_SIZE}: {max_segment_size}")
+        self.max_segment_size = max_segment_size
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.src_port = src_port
+        self.log_sink = LogSink(src_port, log_level, log_binary)
+        self.verbose = self.log_sink.level == LOG_PACKET # per-segment progress messages are only printed along with the per-packet log
+        self.loop = asyncio.get_running_loop()
+        self.wheel = get_timer_wheel(self.loop)
+        self.metrics = ServerMetrics(self.loop.time)
+        self.metrics_dump = MetricsDump(self.wheel, src_port, metrics_interval, self.metrics) if metrics_interval is not None else None
+        # configuring the receive buffer
+        self.receive_buffer_size = receive_buffer_size
+        self.connections = {} # client address -> AsyncConnection
+        self.accept_queue = asyncio.Queue() # established connections not yet returned by accept
+        self.transport, _ = await create_endpoint(self.loop, lambda: self, ('localhost', src_port), family=socket.AF_INET) # network.py forwards to IPv4 addresses
+        print("The server is ready to accept")
+
+    def datagram_received(self, datagram, addr):
+        """
+        Routes a segment to the connection of the client that sent it.
+
+        A SYN from an unknown address (or from a closed connection) creates a new connection, other segments from unknown addresses are dropped.
+
+        Args:
+            datagram (bytes): The segment.
+            addr (tuple): The address of the client.
+
+        Returns:
+            None
+        """
+        conn = self.connections.get(addr)
+        # Only a SYN (bit 2 of the flags byte that follows the packet number) opens a connection
+        syn = len(datagram) > FLAGS_OFFSET and datagram[FLAGS_OFFSET] & 0b100
+        if syn and (conn is None or conn.state == STATE_CLOSED):
+            conn = self.connections[addr] = AsyncConnection(self, addr)
+            self.metrics.add(addr, conn.metrics)
+            print(f"New connection from {addr}, {len(self.connections)} connections")
+        if conn is not None:
+            conn.segment_received(datagram)
+
+    def error_received(self, exc):
+        print("Socket error:", exc)
+
+    def purge(self, conn):
+        """
+        Removes a connection from the connection table TIME_WAIT seconds after it was closed, unless a new connection from the same address replaced it. Its counters stay in the totals of the server metrics.
+
+        Args:
+            conn (AsyncConnection): The closed connection.
+
+        Returns:
+            None
+        """
+        if self.connections.get(conn.addr) is conn:
+            del self.connections[conn.addr]
+            self.metrics.remove(conn.addr)
+
+    async def accept(self):
+        """
+        accept a client request
+        waits until a client completed the handshake (SYN, SYN-ACK, then the ACK or the first data segment), or sent a fast open SYN
+
+        return:
+        the connection to the client, an AsyncConnection
+        """
+        conn = await self.accept_queue.get()
+        print("Connection accepted")
+        return conn
+
+    async def receive(self, conn, length):
+        """
+        receive data from the given client, see AsyncConnection.receive
+        """
+        print("Receiving....")
+        return await conn.receive(length)
+
+    async def recv_into(self, conn, buffer):
+        """
+        receive data from the given client into a buffer of the application, see AsyncConnection.recv_into
+        """
+        return await conn.recv_into(buffer)
+
+    def stream(self, conn, chunk_size=65536):
+        """
+        iterate over the data received from the given client as it arrives, see AsyncConnection.stream
+        """
+        return conn.stream(chunk_size)
+
+    async def recv_message(self, conn):
+        """
+        receive the next message of the given client, see AsyncConnection.recv_message
+        """
+        return await conn.recv_message()
+
+    async def close(self):
+        """
+        close the server and the clients that are still connected
+        waits until every connection that completed the handshake is closed
+        data the application did not read is discarded
+        """
+        # A client that never completed the handshake will not send a FIN
+        await asyncio.gather(*(conn.close() for conn in list(self.connections.values()) if conn.state != STATE_SYN_RECEIVED))
+        if self.metrics_dump is not None:
+            self.metrics_dump.close()
+        print("Closing connection...")
+        self.transport.close()
+        self.log_sink.close()
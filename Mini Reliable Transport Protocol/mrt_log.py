@@ -0,0 +1,200 @@
+import atexit # to flush the sinks still open when the program exits
+import struct # for the binary record format
+import threading # for the background writer
+import time # for timestamps
+
+# Log levels
+LOG_OFF = 0     # nothing is recorded
+LOG_SUMMARY = 1 # only per segment type counters, written when the sink is closed
+LOG_PACKET = 2  # one record per segment sent or received
+
+LOG_LEVELS = {'off': LOG_OFF, 'summary': LOG_SUMMARY, 'packet': LOG_PACKET}
+
+# Segment types
+TYPE_UNKNOWN = 0
+TYPE_SYN = 1
+TYPE_SYN_ACK = 2
+TYPE_ACK = 3
+TYPE_FIN = 4
+TYPE_FIN_ACK = 5
+TYPE_DATA = 6     # data segment, printed as pkt<packet number>
+TYPE_DATA_ACK = 7 # acknowledgment of data, printed as ack<packet number>
+TYPE_PARITY = 8   # parity segment, printed as fec<first packet number covered>
+
+TYPE_NAMES = {TYPE_UNKNOWN: 'UNKNOWN', TYPE_SYN: 'SYN', TYPE_SYN_ACK: 'SYN-ACK', TYPE_ACK: 'ACK', TYPE_FIN: 'FIN',
+              TYPE_FIN_ACK: 'FIN-ACK', TYPE_DATA: 'pkt', TYPE_DATA_ACK: 'ack', TYPE_PARITY: 'fec'}
+
+# Binary record: time, source port, destination port, sequence number, acknowledgment number, packet number, type, length
+BINARY_RECORD = struct.Struct('!dHHIIIBI')
+
+# Flush pending records after this many seconds, or as soon as this many records are pending
+FLUSH_INTERVAL = 0.5
+FLUSH_RECORDS = 4096
+
+_open_sinks = set()
+
+
+class LogSink:
+    """
+    Collects the log records of one connection and writes them to disk from a background thread.
+
+    Segments only append a tuple to an in-memory batch. The writer thread wakes up every FLUSH_INTERVAL seconds (or when FLUSH_RECORDS records are pending), formats the whole batch and writes it with a single call to a file that stays open for the lifetime of the sink. This keeps the open/format/write/close sequence off the per-packet path.
+
+    The text format is the one of the original per-packet log, 'log_{port}.txt':
+
+        <date> <time> <src_port> <dst_port> <seq_num> <ack_num> <segment_type> <length>
+
+    The binary format writes fixed size BINARY_RECORD structs to 'log_{port}.bin' instead, which is cheaper to produce and to parse. At the summary level only counters are kept and a single line is written when the sink is closed.
+    """
+
+    def __init__(self, port, level='packet', binary=False):
+        """
+        arguments:
+        port -- the port of the connection, used to name the log file
+        level -- 'off', 'summary' or 'packet'
+        binary -- write BINARY_RECORD structs instead of text lines
+        """
+        if level not in LOG_LEVELS:
+            raise ValueError(f"Unknown log level: {level}")
+        self.port = port
+        self.level = LOG_LEVELS[level]
+        self.binary = binary and self.level == LOG_PACKET
+        self.records = []
+        self.counts = {}
+        self.total_bytes = 0
+        self.lock = threading.Lock() # guards the pending records and counters
+        self.write_lock = threading.Lock() # guards the log file
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.file = None
+        self.writer = None
+        if self.level == LOG_PACKET:
+            self.writer = threading.Thread(target=self.run, daemon=True)
+            self.writer.start()
+        _open_sinks.add(self)
+
+    def record(self, src_port, dst_port, seq_num, ack_num, segment_type, packet_num, length):
+        """
+        record a segment that was sent or received
+
+        arguments:
+        src_port -- the source port of the segment
+        dst_port -- the destination port of the segment
+        seq_num -- the sequence number of the segment
+        ack_num -- the acknowledgment number of the segment
+        segment_type -- one of the TYPE_* constants
+        packet_num -- the packet number of the segment
+        length -- the length of the data of the segment
+        """
+        if self.level == LOG_PACKET:
+            with self.lock:
+                self.records.append((time.time(), src_port, dst_port, seq_num, ack_num, segment_type, packet_num, length))
+                pending = len(self.records)
+            if pending >= FLUSH_RECORDS:
+                self.wakeup.set()
+        elif self.level == LOG_SUMMARY:
+            with self.lock:
+                self.counts[segment_type] = self.counts.get(segment_type, 0) + 1
+                self.total_bytes += length
+
+    def run(self):
+        """
+        body of the writer thread, flushes the pending records until the sink is closed
+        """
+        while not self.closed:
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        write every pending record to the log file
+        """
+        with self.lock:
+            records, self.records = self.records, []
+        if not records:
+            return
+        if self.binary:
+            self.write(b''.join(BINARY_RECORD.pack(*r) for r in records))
+        else:
+            self.write(''.join(self.format(*r) for r in records))
+
+    def format(self, timestamp, src_port, dst_port, seq_num, ack_num, segment_type, packet_num, length):
+        """
+        return the text line of a record
+        """
+        name = TYPE_NAMES.get(segment_type, 'UNKNOWN')
+        if segment_type in (TYPE_DATA, TYPE_DATA_ACK, TYPE_PARITY):
+            name = f'{name}{packet_num}'
+        return f'{time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(timestamp))} {src_port} {dst_port} {seq_num} {ack_num} {name} {length}\n'
+
+    def write(self, content):
+        """
+        append text or bytes to the log file, opening it on first use
+        """
+        with self.write_lock:
+            if self.file is None:
+                if self.binary:
+                    self.file = open(f'log_{self.port}.bin', 'ab')
+                else:
+                    self.file = open(f'log_{self.port}.txt', 'a')
+            self.file.write(content)
+            self.file.flush()
+
+    def close(self):
+        """
+        stop the writer thread, write the remaining records (or the summary line) and close the log file
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        if self.writer is not None and self.writer is not threading.current_thread():
+            self.writer.join()
+        self.flush()
+        if self.level == LOG_SUMMARY:
+            counts = ' '.join(f'{TYPE_NAMES[t]}={n}' for t, n in sorted(self.counts.items()))
+            self.write(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())} {self.port} SUMMARY segments={sum(self.counts.values())} bytes={self.total_bytes} {counts}\n')
+        with self.write_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        _open_sinks.discard(self)
+
+
+def read_binary_log(path):
+    """
+    read back a binary log written by a LogSink
+
+    arguments:
+    path -- the path of the 'log_{port}.bin' file
+
+    return:
+    a list of tuples (time, src_port, dst_port, seq_num, ack_num, segment_type, packet_num, length)
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    size = BINARY_RECORD.size
+    return [BINARY_RECORD.unpack_from(content, i) for i in range(0, len(content) - len(content) % size, size)]
+
+
+_default_sinks = {}
+
+
+def default_sink(port):
+    """
+    return the per-packet text sink of a port, used by segments that were not given a sink explicitly
+    """
+    sink = _default_sinks.get(port)
+    if sink is None or sink.closed:
+        sink = _default_sinks[port] = LogSink(port)
+    return sink
+
+
+@atexit.register
+def close_all():
+    """
+    flush and close every sink that is still open, so no record is lost when the program exits
+    """
+    for sink in list(_open_sinks):
+        sink.close()
@@ -0,0 +1,223 @@
+import collections # for the bounded window history
+import json # for the periodic dump
+
+# Counters of a Metrics object, in the order of the snapshot
+COUNTERS = ('segments_sent', 'segments_received', 'bytes_sent', 'bytes_received', 'transmissions', 'retransmissions', 'timeouts',
+            'probes', 'parities_sent', 'corrupt', 'dup_acks', 'duplicates', 'out_of_order', 'recovered', 'acks_sent', 'bytes_delivered')
+
+# Window samples kept per connection, older samples are dropped
+WINDOW_SAMPLES = 4096
+
+
+class Metrics:
+    """
+    The counters of one side of one connection.
+
+    The protocol bumps plain attributes on its hot path and records the round-trip time samples and the windows as they change. snapshot() turns them into a dict that can be printed, compared or serialized, without parsing the log files. Not every counter applies to both sides: the client counts transmissions, retransmissions, timeouts, probes, parity segments and duplicate ACKs, the server counts duplicate and out-of-order segments, recovered segments and the acknowledgments it sent.
+    """
+
+    def __init__(self, clock):
+        """
+        arguments:
+        clock -- a callable returning the current time in seconds, the time of the event loop
+        """
+        self.clock = clock
+        self.start = clock()
+        self.segments_sent = 0 # datagrams sent, control segments included
+        self.segments_received = 0 # datagrams received, corrupt ones included
+        self.bytes_sent = 0 # bytes of the datagrams sent, headers included
+        self.bytes_received = 0 # bytes of the datagrams received, headers included
+        self.transmissions = 0 # data segments sent, retransmissions and probes included
+        self.retransmissions = 0 # data segments sent more than once
+        self.timeouts = 0 # expirations of the retransmission timer
+        self.probes = 0 # zero-window probes sent
+        self.parities_sent = 0 # forward error correction parity segments sent
+        self.corrupt = 0 # segments that failed the checksum
+        self.dup_acks = 0 # duplicate acknowledgments received
+        self.duplicates = 0 # data segments received that were already delivered
+        self.out_of_order = 0 # data segments received above the next in-order one
+        self.recovered = 0 # data segments rebuilt from a parity segment instead of being retransmitted
+        self.acks_sent = 0 # acknowledgments of data sent
+        self.bytes_delivered = 0 # data acknowledged by the server (client) or delivered in order (server)
+        self.rtt_count = 0
+        self.rtt_last = None
+        self.rtt_min = None
+        self.rtt_max = None
+        self.rtt_total = 0.0
+        self.srtt = None
+        self.rto = None
+        self.windows = collections.deque(maxlen=WINDOW_SAMPLES) # (clock time, receive window, congestion window) when either changed
+
+    def sent(self, size):
+        """
+        count a datagram sent
+
+        arguments:
+        size -- the length of the datagram
+        """
+        self.segments_sent += 1
+        self.bytes_sent += size
+
+    def received(self, size):
+        """
+        count a datagram received
+
+        arguments:
+        size -- the length of the datagram
+        """
+        self.segments_received += 1
+        self.bytes_received += size
+
+    def record_rtt(self, sample, srtt, rto):
+        """
+        record a round-trip time sample and the estimate it led to
+
+        arguments:
+        sample -- the measured round-trip time in seconds
+        srtt -- the smoothed round-trip time after the sample
+        rto -- the retransmission timeout after the sample
+        """
+        self.rtt_count += 1
+        self.rtt_last = sample
+        self.rtt_min = sample if self.rtt_min is None else min(self.rtt_min, sample)
+        self.rtt_max = sample if self.rtt_max is None else max(self.rtt_max, sample)
+        self.rtt_total += sample
+        self.srtt = srtt
+        self.rto = rto
+
+    def record_window(self, receive_window, congestion_window=None):
+        """
+        record the windows of the connection if either changed since the last sample
+
+        arguments:
+        receive_window -- the receive window in bytes, advertised by the server
+        congestion_window -- the congestion window in segments, None on the server
+        """
+        if self.windows and self.windows[-1][1:] == (receive_window, congestion_window):
+            return
+        self.windows.append((self.clock(), receive_window, congestion_window))
+
+    def snapshot(self, since=None):
+        """
+        return the metrics as a dict
+
+        arguments:
+        since -- only include the window samples taken after this time of the clock, None for every sample kept
+
+        return:
+        a dict with the elapsed time, the counters of COUNTERS, the goodput (bytes delivered per second), the round-trip time statistics and the window samples as [seconds since the start, receive window, congestion window] lists
+        """
+        elapsed = self.clock() - self.start
+        snapshot = {'elapsed': elapsed}
+        for name in COUNTERS:
+            snapshot[name] = getattr(self, name)
+        snapshot['goodput'] = self.bytes_delivered / elapsed if elapsed > 0 else 0.0
+        snapshot['rtt'] = {'count': self.rtt_count, 'last': self.rtt_last, 'min': self.rtt_min, 'max': self.rtt_max,
+                           'mean': self.rtt_total / self.rtt_count if self.rtt_count else None, 'srtt': self.srtt, 'rto': self.rto}
+        # Copied at once, the blocking API takes snapshots from another thread than the event loop
+        samples = list(self.windows)
+        snapshot['windows'] = [[at - self.start, receive_window, congestion_window] for at, receive_window, congestion_window in samples if since is None or at > since]
+        return snapshot
+
+
+class ServerMetrics:
+    """
+    The metrics of a server: the Metrics of every connection in its table, and the totals of the connections already removed from it.
+    """
+
+    def __init__(self, clock):
+        """
+        arguments:
+        clock -- a callable returning the current time in seconds, the time of the event loop
+        """
+        self.clock = clock
+        self.start = clock()
+        self.connections = {} # client address -> Metrics
+        self.retired = dict.fromkeys(COUNTERS, 0) # counters of the connections removed from the table
+        self.opened = 0 # connections created by a SYN
+
+    def add(self, addr, metrics):
+        """
+        start tracking the metrics of a new connection, a connection replacing one from the same address retires it
+        """
+        if addr in self.connections:
+            self.remove(addr)
+        self.connections[addr] = metrics
+        self.opened += 1
+
+    def remove(self, addr):
+        """
+        stop tracking the metrics of a connection, its counters stay in the totals
+        """
+        metrics = self.connections.pop(addr)
+        for name in COUNTERS:
+            self.retired[name] += getattr(metrics, name)
+
+    def snapshot(self, since=None):
+        """
+        return the metrics of the server as a dict
+
+        arguments:
+        since -- passed on to Metrics.snapshot, only include the window samples taken after this time of the clock
+
+        return:
+        a dict with the elapsed time, the number of connections opened, the totals of COUNTERS over every connection and the snapshot of every connection in the table, keyed by 'host:port'
+        """
+        totals = dict(self.retired)
+        connections = {}
+        for addr, metrics in list(self.connections.items()):
+            connections[f'{addr[0]}:{addr[1]}'] = metrics.snapshot(since)
+            for name in COUNTERS:
+                totals[name] += getattr(metrics, name)
+        return {'elapsed': self.clock() - self.start, 'connections_opened': self.opened, 'totals': totals, 'connections': connections}
+
+
+class MetricsDump:
+    """
+    Appends a snapshot of some metrics to 'metrics_{port}.jsonl' every few seconds, one JSON object per line.
+
+    The dump runs on the timer wheel of the event loop of the connection. Each line only carries the window samples taken since the previous one, so the file grows with the time the connection stays open rather than with the square of it.
+    """
+
+    def __init__(self, wheel, port, interval, metrics):
+        """
+        arguments:
+        wheel -- the TimerWheel of the event loop
+        port -- the port of the connection, used to name the file
+        interval -- the time between two snapshots in seconds
+        metrics -- the Metrics or ServerMetrics to dump
+        """
+        if interval <= 0:
+            raise ValueError(f"The metrics interval must be positive: {interval}")
+        self.wheel = wheel
+        self.path = f'metrics_{port}.jsonl'
+        self.interval = interval
+        self.metrics = metrics
+        self.last = None # clock time of the last snapshot
+        self.timer = wheel.schedule(interval, self.dump)
+
+    def dump(self):
+        """
+        write a snapshot and schedule the next one
+        """
+        self.write()
+        self.timer = self.wheel.schedule(self.interval, self.dump)
+
+    def write(self):
+        """
+        append a snapshot with the window samples taken since the last one
+        """
+        now = self.metrics.clock()
+        snapshot = self.metrics.snapshot(self.last)
+        self.last = now
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(snapshot) + '\n')
+
+    def close(self):
+        """
+        stop the periodic dump and write a last snapshot
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+            self.write()
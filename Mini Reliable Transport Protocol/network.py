@@ -4,8 +4,51 @@ from socket import *
 import threading
 import time
 import random
+import math
+import heapq # for the timer heap of delayed datagrams
+import select # to wait for a datagram or the next timer
+from collections import deque
+
+try:
+    import numpy as np # optional, draws the bit errors of a datagram in bulk
+except ImportError:
+    np = None
 
 loss = {}
+link = {} # time -> link parameters, from the optional key=value fields of the loss file
+
+# Link parameters and their defaults, the link forwards datagrams instantly unless the loss file sets them
+LINK_DEFAULTS = {
+    'delay': 0.0,         # one-way propagation delay in seconds
+    'jitter': 0.0,        # standard deviation of a normally distributed delay added to each datagram, in seconds
+    'rate': 0.0,          # bandwidth of the token bucket in bytes per second, 0 for unlimited
+    'burst': 3000.0,      # depth of the token bucket in bytes
+    'queue': 1000.0,      # capacity of the queue in datagrams, datagrams arriving at a full queue are dropped (drop-tail)
+    'redmin': 0.0,        # RED: average queue length where early drops start, 0 disables RED
+    'redmax': 0.0,        # RED: average queue length above which every datagram is dropped
+    'redp': 0.1,          # RED: drop probability reached at redmax
+    'reorder': 0.0,       # probability that a datagram is held back so that the following ones overtake it
+    'reorderdelay': 0.01, # extra delay of a reordered datagram, in seconds
+}
+
+# Weight of the newest queue length in the RED average
+RED_WEIGHT = 0.02
+
+# Random generators of the simulator, seeded by seedRandom for reproducible runs
+rng = random.Random()
+npRng = np.random.default_rng() if np is not None else None
+
+def seedRandom(seed):
+    """
+    seeds the random generators used for packet loss and bit errors, so a run can be reproduced
+
+    arguments:
+    seed -- an integer seed, None for a fresh random seed
+    """
+    global npRng
+    rng.seed(seed)
+    if np is not None:
+        npRng = np.random.default_rng(seed)
 
 def createSocket(p):
     """
@@ -18,15 +61,33 @@ def createSocket(p):
     s.bind(('',p))
     return s
 
-def setUpLoss(lossFile):
+def setUpLoss(lossFile, lossTable=loss, linkTable=link):
     """
     reads loss file
 
+    every line holds a time, the packet loss rate and the bit error rate from that time on, optionally followed by key=value link parameters (see LINK_DEFAULTS), e.g.
+
+        5 .1 .001 delay=0.05 jitter=0.005 rate=125000 queue=50
+
+    parameters a line does not set take their default value
+
     arguments:
     lossFile -- name of the loss file
+    lossTable -- the dict receiving the loss rates, the loss table of the simulator by default
+    linkTable -- the dict receiving the link parameters, the link table of the simulator by default
     """
     for line in open(lossFile, 'r').readlines():
-        loss[line.split()[0]] = [float(line.split()[1]), float(line.split()[2])]
+        fields = line.split()
+        if not fields:
+            continue
+        lossTable[fields[0]] = [float(fields[1]), float(fields[2])]
+        params = dict(LINK_DEFAULTS)
+        for field in fields[3:]:
+            key, value = field.split('=')
+            if key not in LINK_DEFAULTS:
+                raise ValueError(f"Unknown link parameter: {key}")
+            params[key] = float(value)
+        linkTable[fields[0]] = params
     return True
 
 def getCurrentLoss(st):
@@ -36,20 +97,243 @@ def getCurrentLoss(st):
     arguments:
     st -- the start time of the client connection
     """
-    ct = time.time() - st
+    return lossAt(time.time() - st)
+
+def lossAt(ct, lossTable=loss):
+    """
+    determines the loss rate and bit error of the link a given time after the start
 
+    arguments:
+    ct -- the time since the start of the client connection, in seconds
+    lossTable -- the loss rates read from a loss file
+    """
     lastPktLoss = 0
     lastBitError = 0
 
-    for t in loss.keys():
-        if ct > int(t):
-            lastPktLoss = loss[t][0]
-            lastBitError = loss[t][1]
+    for t in lossTable.keys():
+        if ct >= int(t):
+            lastPktLoss = lossTable[t][0]
+            lastBitError = lossTable[t][1]
     return lastPktLoss, lastBitError
 
+def getCurrentLink(st):
+    """
+    determines current delay, bandwidth, queue and reordering parameters of the link
+
+    arguments:
+    st -- the start time of the client connection
+
+    return:
+    a dict with every key of LINK_DEFAULTS
+    """
+    return linkAt(time.time() - st)
+
+def linkAt(ct, linkTable=link):
+    """
+    determines the link parameters a given time after the start
+
+    arguments:
+    ct -- the time since the start of the client connection, in seconds
+    linkTable -- the link parameters read from a loss file
+
+    return:
+    a dict with every key of LINK_DEFAULTS
+    """
+    current = LINK_DEFAULTS
+    for t in linkTable.keys():
+        if ct >= int(t):
+            current = linkTable[t]
+    return current
+
+class TimerHeap:
+    """
+    pending deliveries ordered by due time
+
+    the forwarding loop waits for the next datagram no longer than the earliest due time and then runs what is due, so delayed datagrams need neither a thread nor a sleep each
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = 0 # keeps datagrams due at the same time in order
+
+    def push(self, when, callback, *args):
+        """
+        schedules a callback
+
+        arguments:
+        when -- the due time, in seconds
+        callback -- the function to call with args
+        """
+        heapq.heappush(self.heap, (when, self.counter, callback, args))
+        self.counter += 1
+
+    def timeout(self, now):
+        """
+        returns how long the loop may wait before the next due time, None if nothing is pending
+        """
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - now)
+
+    def runDue(self, now):
+        """
+        runs every callback whose due time has come, in order
+        """
+        while self.heap and self.heap[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self.heap)
+            callback(*args)
+
+class Link:
+    """
+    one direction of the emulated link
+
+    a datagram first waits in a FIFO queue for the tokens of a token bucket (rate bytes per second, burst bytes deep), which models the bandwidth of the link. The queue holds at most queue datagrams, further arrivals are dropped (drop-tail) and RED drops arrivals early with a probability that grows with the average queue length. Once it leaves the queue the datagram travels for the propagation delay plus a jitter sample, and a fraction of the datagrams is held back a little longer so that the following ones overtake them
+
+    the state of the bucket is advanced only when a datagram arrives: the departure time of every datagram is computed up front, so the queue is just the list of departure times still in the future
+    """
+
+    def __init__(self):
+        self.tokens = LINK_DEFAULTS['burst']
+        self.tokenTime = 0.0 # time at which the bucket holds self.tokens, the departure of the last queued datagram
+        self.departures = deque() # departure times of the queued datagrams
+        self.average = 0.0 # RED average queue length
+        self.drops = 0
+
+    def transmit(self, size, now, params):
+        """
+        queues a datagram on the link
+
+        arguments:
+        size -- the length of the datagram in bytes
+        now -- the current time in seconds
+        params -- the link parameters, see LINK_DEFAULTS
+
+        return:
+        the time at which the datagram reaches the other end, None if the queue dropped it
+        """
+        while self.departures and self.departures[0] <= now:
+            self.departures.popleft()
+        queued = len(self.departures)
+
+        if params['rate'] > 0:
+            if queued >= params['queue']:
+                self.drops += 1
+                return None
+            if params['redmin'] > 0:
+                self.average = (1 - RED_WEIGHT) * self.average + RED_WEIGHT * queued
+                if self.average >= params['redmax']:
+                    self.drops += 1
+                    return None
+                if self.average > params['redmin']:
+                    p = params['redp'] * (self.average - params['redmin']) / (params['redmax'] - params['redmin'])
+                    if rng.random() < p:
+                        self.drops += 1
+                        return None
+            # Refill the bucket up to the time the datagram reaches the head of the queue
+            start = max(now, self.tokenTime)
+            tokens = min(params['burst'], self.tokens + (start - self.tokenTime) * params['rate'])
+            if tokens >= size:
+                departure = start
+                tokens -= size
+            else:
+                departure = start + (size - tokens) / params['rate']
+                tokens = 0.0
+            self.tokens = tokens
+            self.tokenTime = departure
+            self.departures.append(departure)
+        else:
+            departure = now
+
+        arrival = departure + params['delay']
+        if params['jitter'] > 0:
+            arrival += abs(rng.gauss(0.0, params['jitter']))
+        if params['reorder'] > 0 and rng.random() < params['reorder']:
+            arrival += params['reorderdelay']
+        return arrival
+
+def errorPositions(nbits, bitError):
+    """
+    draws the positions of the bits flipped in a datagram, each bit being flipped independently with probability bitError
+
+    with NumPy the number of flipped bits is drawn from a binomial distribution and that many distinct positions are picked at once. Otherwise the gaps between flipped bits are drawn from a geometric distribution, by inversion of a uniform sample. Either way the work is proportional to the number of errors rather than to the number of bits
+
+    arguments:
+    nbits -- the number of bits of the datagram
+    bitError -- the probability that a bit is flipped
+
+    return:
+    the positions of the flipped bits
+    """
+    if bitError <= 0 or nbits == 0:
+        return []
+    if bitError >= 1:
+        return range(nbits)
+    if npRng is not None:
+        count = npRng.binomial(nbits, bitError)
+        if count == 0:
+            return []
+        return npRng.choice(nbits, count, replace=False)
+    positions = []
+    logq = math.log1p(-bitError)
+    position = -1
+    while True:
+        position += 1 + int(math.log(1.0 - rng.random()) / logq)
+        if position >= nbits:
+            return positions
+        positions.append(position)
+
+def corrupt(d, bitError):
+    """
+    flips the bits of a datagram in place, each bit with probability bitError
+
+    with NumPy the flips are applied as XOR masks over the datagram in one call, otherwise byte by byte
+
+    arguments:
+    d -- the datagram, a bytearray
+    bitError -- the probability that a bit is flipped
+    """
+    positions = errorPositions(len(d) * 8, bitError)
+    if len(positions) == 0:
+        return
+    if npRng is not None:
+        positions = np.asarray(positions)
+        np.bitwise_xor.at(np.frombuffer(d, dtype=np.uint8), positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+        return
+    for position in positions:
+        d[position >> 3] ^= 1 << (position & 7)
+
+def impair(data, ct, now, direction, lossTable=loss, linkTable=link):
+    """
+    passes a datagram through the link: drops it with the packet loss rate, flips its bits with the bit error rate and queues it on its direction of the link (see Link)
+
+    network.py, the channel of simulation.py and the relay of benchmark.py all forward datagrams with it, so they emulate the same link
+
+    arguments:
+    data -- the datagram
+    ct -- the time since the start of the client connection, in seconds
+    now -- the current time in seconds
+    direction -- the Link towards the destination of the datagram
+    lossTable -- the loss rates read from a loss file
+    linkTable -- the link parameters read from a loss file
+
+    return:
+    the datagram as it arrives, a bytearray, and its arrival time, or None if it was dropped
+    """
+    pktLoss, bitError = lossAt(ct, lossTable)
+    if rng.random() <= pktLoss:
+        return None
+    d = bytearray(data)
+    corrupt(d, bitError)
+    arrival = direction.transmit(len(d), now, linkAt(ct, linkTable))
+    if arrival is None:
+        return None
+    return d, arrival
+
 def handleMessage(ns, ca, sa, st): 
     """
-    handling the server's response (data)
+    forwarding the datagrams of the client and the server to each other
+
+    a datagram is dropped with the current packet loss rate, its bits are flipped with the current bit error rate and it is then queued on the direction of the link towards its destination (see impair). Datagrams are delivered from a timer heap when their arrival time comes, the loop waits for new datagrams only until then
 
     arguments:
     ns -- the network socket
@@ -57,22 +341,20 @@ def handleMessage(ns, ca, sa, st):
     sa - the server address
     st - the connection start time
     """
-    buff_size = 2000000000
+    buff_size = 65536
+    timers = TimerHeap()
+    links = {ca: Link(), sa: Link()} # one direction of the link per destination
     while True:
-        c, a = ns.recvfrom(buff_size)
-        pktLoss, bitError = getCurrentLoss(st)
-        if random.random() <= pktLoss:
-            continue
-        else:
-            d = bytearray(c)
-            for i in range(len(d)):
-                for j in range(8):
-                    if random.random() <= bitError:
-                        d[i] = d[i] ^ (1 << j)
-            if a == sa:
-              ns.sendto(d, ca)
-            else:
-              ns.sendto(d, sa)
+        ready, _, _ = select.select([ns], [], [], timers.timeout(time.time()))
+        if ready:
+            c, a = ns.recvfrom(buff_size)
+            dest = ca if a == sa else sa
+            now = time.time()
+            forwarded = impair(c, now - st, now, links[dest])
+            if forwarded is not None:
+                d, arrival = forwarded
+                timers.push(arrival, ns.sendto, d, dest)
+        timers.runDue(time.time())
   
 if __name__ == '__main__':
     # accepts commandline arguments
@@ -85,11 +367,13 @@ if __name__ == '__main__':
     parser.add_argument('serverAddr', type=str)
     parser.add_argument('serverPort', type=int, choices=range(49151,65535), metavar='serverPort: (49151 – 65535)')
     parser.add_argument('lossFile', type=str)
+    parser.add_argument('--seed', type=int, default=None, help='seed of the packet loss and bit error generators, for reproducible runs')
 
     args = parser.parse_args()
 
     # reads in loss file and connects required sockets
     setup = setUpLoss(args.lossFile)
+    seedRandom(args.seed)
 
     clientAddr = (args.clientAddr, args.clientPort)
     serverAddr = (args.serverAddr, args.serverPort)
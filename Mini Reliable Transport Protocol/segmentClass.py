@@ -1,9 +1,265 @@
 import time # for sleep & log files
 import struct # for packing and unpacking data
 import hashlib # To convert checksum
+import zlib # for the CRC-32 checksum
+from mrt_log import default_sink, TYPE_UNKNOWN, TYPE_SYN, TYPE_SYN_ACK, TYPE_ACK, TYPE_FIN, TYPE_FIN_ACK, TYPE_DATA, TYPE_DATA_ACK, TYPE_PARITY
+
+try:
+    import crc32c # optional, hardware accelerated CRC-32C
+except ImportError:
+    crc32c = None
+
+# Option kinds carried in the SYN / SYN-ACK payload as (kind, length, value) triples
+OPT_SACK_PERMITTED = 1  # the sender asks for (or the server grants) selective-repeat with SACK blocks
+OPT_CHECKSUM = 2        # checksum modes offered by the client in order of preference, or the one chosen by the server
+OPT_WINDOW_SCALE = 3    # shift count applied to the window field of the segments of the side that sends it
+OPT_FAST_OPEN = 4       # the rest of the SYN payload is the first data segment (or the server accepted it), always the last option
+OPT_FEC = 5             # number of data segments covered by each parity segment (forward error correction)
+OPT_MSS = 6             # largest segment the client sends, or the server accepts, as a 16-bit number of bytes
+
+# Bit of the flags byte set on the last data segment of a message
+FLAG_EOM = 0b100000
+# Bit of the flags byte set on parity segments, whose packet number is the first data segment they cover
+FLAG_PARITY = 0b1000000
+# Bit of the flags byte set on acknowledgments that answer a corrupt segment
+FLAG_CORRUPT_SEEN = 0b10000000
+
+# Largest segment that fits in a UDP datagram over IPv4, the default limit of the server
+MAX_SEGMENT_SIZE = 65507
+
+# Checksum modes, recorded in bits 3-4 of the flags byte of every segment
+CHECKSUM_MD5 = 0    # 16 byte MD5 digest
+CHECKSUM_CRC32 = 1  # 4 byte CRC-32 (zlib)
+CHECKSUM_CRC32C = 2 # 4 byte CRC-32C (Castagnoli), only available with the crc32c package
+CHECKSUM_INET = 3   # 2 byte 16-bit ones' complement sum (RFC 1071)
+
+CHECKSUM_SIZES = {CHECKSUM_MD5: 16, CHECKSUM_CRC32: 4, CHECKSUM_CRC32C: 4, CHECKSUM_INET: 2}
+CHECKSUM_NAMES = {'md5': CHECKSUM_MD5, 'crc32': CHECKSUM_CRC32, 'crc32c': CHECKSUM_CRC32C, 'inet': CHECKSUM_INET}
+
+# Checksum modes supported by this host, in order of preference
+SUPPORTED_CHECKSUMS = ([CHECKSUM_CRC32C] if crc32c is not None else []) + [CHECKSUM_CRC32, CHECKSUM_INET, CHECKSUM_MD5]
+
+# Sequence number, acknowledgment number, packet number, flags and receive window
+HEADER_FORMAT = '!IIIBH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+FLAGS_OFFSET = 12 # offset of the flags byte, read by the server to find SYNs before decoding a segment
+
+# Sequence, acknowledgment and packet numbers are carried modulo 2^32 and compared with serial number arithmetic (RFC 1982)
+SEQ_MODULUS = 1 << 32
+SEQ_MASK = SEQ_MODULUS - 1
+
+# The window field is 16 bits wide, the window scale option shifts it by at most 14 bits (RFC 7323)
+MAX_WINDOW = 0xFFFF
+MAX_WINDOW_SCALE = 14
+
+# Largest header with any checksum mode, the size of a preallocated header buffer
+MAX_HEADER_SIZE = HEADER_SIZE + max(CHECKSUM_SIZES.values())
+
+# Maximum number of SACK blocks reported in a single acknowledgment
+MAX_SACK_BLOCKS = 8
+
+
+def pack_options(options):
+    """
+    Packs handshake options into bytes.
+
+    Each option is encoded as a one byte kind, a one byte length and the value itself, so that a receiver can skip the options it does not understand.
+
+    Args:
+        options (dict): A mapping of option kind to its value (bytes).
+
+    Returns:
+        bytes: The encoded options.
+    """
+    return b''.join(struct.pack('!BB', kind, len(value)) + value for kind, value in options.items())
+
+
+def unpack_options(data):
+    """
+    Extracts the handshake options from the given bytes.
+
+    Args:
+        data (bytes): The encoded options, as built by pack_options.
+
+    Returns:
+        dict: A mapping of option kind to its value (bytes). Truncated options are ignored.
+    """
+    options = {}
+    i = 0
+    while i + 2 <= len(data):
+        kind, length = struct.unpack('!BB', data[i:i+2])
+        if i + 2 + length > len(data):
+            break
+        options[kind] = bytes(data[i+2:i+2+length])
+        i += 2 + length
+    return options
+
+
+def split_early_data(payload):
+    """
+    Splits the payload of a SYN into its options and the data carried along with them (fast open).
+
+    Args:
+        payload (bytes-like): The payload of the SYN.
+
+    Returns:
+        tuple: The encoded options and the early data, empty when the SYN does not carry the fast open option.
+    """
+    i = 0
+    while i + 2 <= len(payload):
+        kind, length = payload[i], payload[i+1]
+        i += 2 + length
+        if kind == OPT_FAST_OPEN:
+            return payload[:i], payload[i:]
+    return payload, payload[:0]
+
+
+def pack_sack(blocks):
+    """
+    Packs SACK blocks into bytes.
+
+    Every block is a half-open range [start, end) of packet numbers that the receiver holds out of order.
+
+    Args:
+        blocks (list): A list of (start, end) tuples.
+
+    Returns:
+        bytes: The encoded blocks, at most MAX_SACK_BLOCKS of them.
+    """
+    return b''.join(struct.pack('!II', start & SEQ_MASK, end & SEQ_MASK) for start, end in blocks[:MAX_SACK_BLOCKS])
+
+
+def unpack_sack(data):
+    """
+    Extracts the SACK blocks from the payload of an acknowledgment.
+
+    Args:
+        data (bytes): The payload of the acknowledgment.
+
+    Returns:
+        list: A list of (start, end) tuples, as carried on the wire (modulo 2^32, see unwrap).
+    """
+    return list(struct.iter_unpack('!II', memoryview(data)[:len(data) - len(data) % 8]))
+
+
+def unwrap(value, reference):
+    """
+    Recovers a full packet number from the 32 bits carried by a segment.
+
+    Packet numbers are counted without bound by both sides, but only their value modulo 2^32 is sent. The full number is the one congruent to the value that lies closest to a reference the receiver already knows, such as the base of the send window or the next packet expected, so the numbers keep increasing across the wraparound as long as the two sides are less than 2^31 packets apart.
+
+    Args:
+        value (int): The 32-bit number read from the segment.
+        reference (int): A full number close to the one that was sent.
+
+    Returns:
+        int: The full number.
+    """
+    return reference + (value - reference + (SEQ_MODULUS >> 1)) % SEQ_MODULUS - (SEQ_MODULUS >> 1)
+
+
+def seq_before(a, b):
+    """
+    Tells whether the 32-bit number a comes before b in serial number arithmetic (RFC 1982), which stays correct when the numbers wrap around.
+
+    Args:
+        a (int): A sequence, acknowledgment or packet number modulo 2^32.
+        b (int): Another number modulo 2^32.
+
+    Returns:
+        bool: True if a precedes b by less than 2^31.
+    """
+    return 0 < (b - a) % SEQ_MODULUS < (SEQ_MODULUS >> 1)
+
+
+def window_scale(buffer_size):
+    """
+    Returns the smallest shift count that lets the 16-bit window field describe a receive buffer of the given size.
+
+    Args:
+        buffer_size (int): The size of the receive buffer in bytes.
+
+    Returns:
+        int: The shift count, at most MAX_WINDOW_SCALE.
+    """
+    shift = 0
+    while shift < MAX_WINDOW_SCALE and buffer_size >> shift > MAX_WINDOW:
+        shift += 1
+    return shift
+
+
+def header_size(checksum_mode):
+    """
+    Returns the number of bytes a segment spends on its header with the given checksum mode.
+
+    Args:
+        checksum_mode (int): One of the CHECKSUM_* constants.
+
+    Returns:
+        int: The size of the header fields plus the checksum.
+    """
+    return HEADER_SIZE + CHECKSUM_SIZES[checksum_mode]
+
+
+def choose_checksum(offered):
+    """
+    Picks the checksum mode of a connection from the modes offered by the client.
+
+    Args:
+        offered (bytes): The value of the OPT_CHECKSUM option, the client's modes in order of preference.
+
+    Returns:
+        int: The first offered mode this host supports, CHECKSUM_MD5 if there is none.
+    """
+    for mode in offered:
+        if mode in SUPPORTED_CHECKSUMS:
+            return mode
+    return CHECKSUM_MD5
+
+
+def checksum_offer(preferred='auto'):
+    """
+    Builds the list of checksum modes a client offers in its SYN.
+
+    Args:
+        preferred (str): 'auto' to offer every supported mode in order of preference, or the name of a mode ('crc32c', 'crc32', 'inet', 'md5') to offer it ahead of the MD5 fallback.
+
+    Returns:
+        bytes: The value of the OPT_CHECKSUM option.
+    """
+    if preferred == 'auto':
+        return bytes(SUPPORTED_CHECKSUMS)
+    if preferred not in CHECKSUM_NAMES:
+        raise ValueError(f"Unknown checksum mode: {preferred}")
+    mode = CHECKSUM_NAMES[preferred]
+    if mode not in SUPPORTED_CHECKSUMS:
+        raise ValueError(f"Checksum mode {preferred} is not available on this host")
+    return bytes(dict.fromkeys([mode, CHECKSUM_MD5]))
+
+def inet_checksum(header, data):
+    """
+    Calculates the 16-bit ones' complement checksum (RFC 1071) of the header followed by the data.
+
+    Since 2^16 = 1 (mod 0xFFFF), the ones' complement sum of the 16-bit words of a message equals the message read as one big-endian integer modulo 0xFFFF. This lets the sum run in C through int.from_bytes instead of a Python loop over the words. The header is shifted by the length of the data, and a message of odd length is padded with a zero byte.
+
+    Args:
+        header (bytes): The packed header fields.
+        data (bytes): The data of the segment.
+
+    Returns:
+        int: The checksum, the ones' complement of the sum.
+    """
+    value = int.from_bytes(header, 'big') * pow(256, len(data), 0xFFFF) + int.from_bytes(data, 'big')
+    if (len(header) + len(data)) % 2:
+        value <<= 8
+    total = value % 0xFFFF
+    if total == 0 and value:
+        total = 0xFFFF # ones' complement arithmetic never yields +0 for a non-zero sum
+    return ~total & 0xFFFF
+
 
 class Segment:
-    def __init__(self, src_port, dst_port, seq_num=0, ack_num=0, packet_num=0, syn=False, ack=False, fin=False):
+    def __init__(self, src_port, dst_port, seq_num=0, ack_num=0, packet_num=0, syn=False, ack=False, fin=False, checksum_mode=CHECKSUM_MD5, log_sink=None, window=0, eom=False, parity=False, corrupt_seen=False):
         self.src_port = src_port
         self.dst_port = dst_port
         self.seq_num = seq_num
@@ -12,98 +268,187 @@ class Segment:
         self.ack = ack
         self.fin = fin
         self.packet_num = packet_num
+        self.checksum_mode = checksum_mode
+        self.window = window # receive window of the sender, in units of 2^window_scale bytes
+        self.eom = eom # the segment ends a message
+        self.parity = parity # the segment carries the parity of data segments instead of data
+        self.corrupt_seen = corrupt_seen # the acknowledgment answers a corrupt segment
+        self.log_sink = log_sink if log_sink is not None else default_sink(src_port)
         
 
+    def pack_into(self, buffer, data):
+        """
+        Writes the header of the segment into a preallocated buffer.
+
+        The method first converts the SYN, ACK, FIN and end-of-message flags and the checksum mode to a single byte. It then packs the sequence number, acknowledgment number and packet number (modulo 2^32), the flags and the window at the start of the buffer with struct.pack_into.
+
+        A checksum of the negotiated mode is then calculated over the header and the data and written right after the header fields. The checksum follows the fixed header fields so that a receiver can read the mode from the flags before it knows the checksum length. The data itself is only read, never copied.
+
+        Args:
+            buffer (bytearray): A writable buffer of at least header_size(self.checksum_mode) bytes, MAX_HEADER_SIZE fits every mode.
+            data (bytes-like): The data to be included in the segment.
+
+        Returns:
+            int: The number of bytes of the buffer used by the header, 15 + 2..16.
+        """
+
+        # Convert flags and checksum mode to a single byte
+        flags = (self.corrupt_seen and FLAG_CORRUPT_SEEN) | (self.parity and FLAG_PARITY) | (self.eom and FLAG_EOM) | (self.checksum_mode << 3) | (self.syn << 2) | (self.ack << 1) | self.fin
+        self.log(data)   # Log the segment information
+        struct.pack_into(HEADER_FORMAT, buffer, 0, self.seq_num & SEQ_MASK, self.ack_num & SEQ_MASK, self.packet_num & SEQ_MASK, flags, min(self.window, MAX_WINDOW))
+        checksum = self.checksum(memoryview(buffer)[:HEADER_SIZE], data)
+        size = HEADER_SIZE + len(checksum)
+        buffer[HEADER_SIZE:size] = checksum
+        return size
+
     def to_bytes(self, data):
         """
         Constructs a segment and returns it as bytes.
 
-        The method first converts the SYN, ACK, and FIN flags to a single byte. It then packs the sequence number, acknowledgment number, packet number, and flags into a byte array to form the header.
+        The header and checksum are built by pack_into, the data is appended to them.
+
+        Args:
+            data (bytes-like): The data to be included in the segment.
+
+        Returns:
+            bytes: The constructed segment as bytes.
+        """
+        buffer = bytearray(header_size(self.checksum_mode))
+        self.pack_into(buffer, data)
+        return bytes(buffer) + data #  15 + 2..16 + len(data)
 
-        The payload is formed by concatenating the header and the data. A checksum is then calculated for the payload.
+    def to_buffer(self, buffer, data):
+        """
+        Constructs the segment in a preallocated buffer.
 
-        The method returns the checksum, header, and data concatenated together.
+        The header is packed by pack_into and the data copied right after it, so sending a segment costs one copy of the data into a buffer that is reused for every segment, and no allocation. The returned view can be handed to DatagramTransport.sendto: the batched transport copies it straight into the slot sendmmsg reads it from, and the asyncio transport sends it at once or copies it if it has to queue it.
 
         Args:
-            data (bytes): The data to be included in the segment.
+            buffer (bytearray): A writable buffer of at least MAX_HEADER_SIZE plus the length of the data.
+            data (bytes-like): The data to be included in the segment.
 
         Returns:
-            bytes: The constructed segment as bytes.
+            memoryview: The part of the buffer holding the segment.
         """
+        size = self.pack_into(buffer, data)
+        end = size + len(data)
+        buffer[size:end] = data
+        return memoryview(buffer)[:end]
 
-        # Convert flags to a single byte
-        flags = (self.syn << 2) | (self.ack << 1) | self.fin
-        # Pack header fields and data into a byte array
-        self.log(data)   # Log the segment information
-        header = struct.pack('!HHHB', self.seq_num, self.ack_num, self.packet_num, flags)
-        payload = header + data
-        checksum = self.checksum(payload)
-        return checksum + header + data #  16 + 7 + len(data)
-    
-    
-    def from_bytes(self, segment):
+    def from_bytes(self, segment, checksum_mode=None):
         """
         Extracts segment information from the given bytes.
 
-        The method first unpacks the checksum from the first 16 bytes of the segment. It then unpacks the header fields from the next 7 bytes of the segment and assigns them to the corresponding instance variables.
+        The method first unpacks the header fields from the first 15 bytes of the segment and assigns them to the corresponding instance variables. The sequence, acknowledgment and packet numbers are the 32-bit values carried by the segment (see unwrap), the window is left in the window attribute.
 
-        The flags are then extracted from the header and used to set the SYN, ACK, and FIN flags.
+        The flags are then extracted from the header and used to set the SYN, ACK, and FIN flags. The end-of-message, parity and corrupt-seen flags are left in the eom, parity and corrupt_seen attributes. The checksum mode tells how many bytes of checksum follow the header. When the receiver knows the mode the segment must use, a segment whose flags carry another mode is corrupt: otherwise a damaged flags byte could get the segment checked with a weaker checksum than the one negotiated.
 
-        The data is extracted from the remaining bytes of the segment. If the data is None or all bytes are 0, the segment is not considered corrupt. Otherwise, the method checks if the data is corrupt by comparing the checksum of the segment (excluding the checksum) with the extracted checksum.
+        The data is the rest of the segment. All fields are read through a memoryview, so the data returned is a view of the received datagram and no part of it is copied. The method checks if the segment is corrupt by comparing the checksum of the header and data with the extracted checksum. A segment too short to hold its header, using another checksum mode than the one required, or using a checksum mode this host cannot compute, is considered corrupt.
 
         The method logs the segment information and returns a tuple containing the sequence number, acknowledgment number, packet number, SYN flag, ACK flag, FIN flag, corruption status, and data.
 
         Args:
-            segment (bytes): The segment from which to extract information.
+            segment (bytes-like): The segment from which to extract information.
+            checksum_mode (int): The checksum mode the segment must use, or None to take the one in its flags (before the mode is negotiated).
 
         Returns:
-            tuple: A tuple containing the sequence number, acknowledgment number, packet number, SYN flag, ACK flag, FIN flag, corruption status, and data.
+            tuple: A tuple containing the sequence number, acknowledgment number, packet number, SYN flag, ACK flag, FIN flag, corruption status, and data (a memoryview).
         """
 
-        # Unpack the header fields and data from the byte array
-        checksum = segment[:16]
-        header = struct.unpack('!HHHB', segment[16:23])
-        self.seq_num = header[0]
-        self.ack_num = header[1]
-        self.packet_num = header[2]
-        flags = header[3]
+        segment = memoryview(segment)
+        if len(segment) < HEADER_SIZE:
+            return (self.seq_num, self.ack_num, self.packet_num, False, False, False, True, segment[:0])
+
+        # Unpack the header fields from the start of the datagram
+        self.seq_num, self.ack_num, self.packet_num, flags, self.window = struct.unpack_from(HEADER_FORMAT, segment)
         self.syn = bool(flags & 0b100)
         self.ack = bool(flags & 0b010)
         self.fin = bool(flags & 0b001)
-        data = segment[23:]
+        self.eom = bool(flags & FLAG_EOM)
+        self.parity = bool(flags & FLAG_PARITY)
+        self.corrupt_seen = bool(flags & FLAG_CORRUPT_SEEN)
+        mode = (flags >> 3) & 0b11
+        self.checksum_mode = mode if checksum_mode is None else checksum_mode
+        size = header_size(self.checksum_mode)
+        checksum = segment[HEADER_SIZE:size]
+        data = segment[size:]
 
-        if data is None and all(b == 0 for b in data):
-            corrupt = False
+        if len(segment) < size or mode != self.checksum_mode or self.checksum_mode not in SUPPORTED_CHECKSUMS:
+            corrupt = True
         else:
-            corrupt = self.is_data_corrupt(segment[16:], checksum)
+            corrupt = self.is_data_corrupt(segment[:HEADER_SIZE], data, checksum)
 
         self.log(data)   # Log the segment information
         return (self.seq_num, self.ack_num, self.packet_num, self.syn, self.ack, self.fin, corrupt, data)
     
-    def is_data_corrupt(self, data, checksum):
+    def is_data_corrupt(self, header, data, checksum):
         """
-        This function checks if the data is corrupted by comparing the calculated checksum of the data with a provided checksum.
+        This function checks if the data is corrupted by comparing the calculated checksum of the header and data with a provided checksum.
 
         Parameters:
-        data -- The data that you want to check for corruption. It could be any data type that is accepted by the checksum function, but it's typically a string or bytes.
-        checksum -- A function that calculates the checksum of the data. It takes the data as input and returns a checksum. The checksum is a value that is used to check the integrity of the data. If the data is changed in any way, the checksum will also change.
+        header -- The header fields of the segment, as a bytes-like object.
+        data -- The data of the segment, as a bytes-like object.
+        checksum -- The checksum carried by the segment. If the header or data changed in any way, the calculated checksum will differ from it.
 
         Returns:
         True if the calculated checksum of the data does not match the provided checksum (indicating the data is corrupted), False otherwise.
         """
-        return self.checksum(data) != checksum 
+        return self.checksum(header, data) != checksum 
+
+
+    def checksum(self, header, data):
+        """
+        Calculates the checksum of the header and data with the checksum mode of the segment.
+
+        The header and data are fed to the checksum separately so that they never need to be concatenated.
+
+        Args:
+            header (bytes-like): The packed header fields.
+            data (bytes-like): The data of the segment.
+
+        Returns:
+            bytes: The checksum, 16 bytes for MD5, 4 bytes for CRC-32 and CRC-32C, 2 bytes for the Internet checksum.
+        """
+        if self.checksum_mode == CHECKSUM_CRC32:
+            return struct.pack('!I', zlib.crc32(data, zlib.crc32(header)))
+        if self.checksum_mode == CHECKSUM_CRC32C:
+            return struct.pack('!I', crc32c.crc32c(data, crc32c.crc32c(header)))
+        if self.checksum_mode == CHECKSUM_INET:
+            return struct.pack('!H', inet_checksum(header, data))
+        digest = hashlib.md5(header)
+        digest.update(data)
+        return digest.digest()
 
+    def segment_type(self):
+        """
+        Determines the type of the segment based on the SYN, ACK, and FIN flags, the packet number, the acknowledgment number, and the sequence number.
 
-    def checksum(self, data):
-        return hashlib.md5(data).digest()
+        Returns:
+            int: One of the TYPE_* constants of mrt_log.
+        """
+        if self.syn and self.ack:
+            return TYPE_SYN_ACK
+        if self.syn:
+            return TYPE_SYN
+        if self.fin and self.ack:
+            return TYPE_FIN_ACK
+        if self.ack:
+            if self.packet_num >= 0 and (self.ack_num > 1 or self.seq_num > 1):
+                return TYPE_DATA_ACK
+            return TYPE_ACK
+        if self.fin:
+            return TYPE_FIN
+        if self.parity:
+            return TYPE_PARITY
+        if self.seq_num > 0 and self.ack_num > 0:
+            return TYPE_DATA
+        return TYPE_UNKNOWN
 
     def log(self, data):
         """
         Logs the segment information.
 
-        The method first determines the type of the segment based on the SYN, ACK, and FIN flags, the packet number, the acknowledgment number, and the sequence number. The type of the segment is then used to set the segment_type variable.
-
-        The method then opens a log file named 'log_{self.src_port}.txt' in append mode and writes the current time, source port, destination port, sequence number, acknowledgment number, segment type, and length of the data to the file.
+        The method hands the source port, destination port, sequence number, acknowledgment number, segment type, packet number and length of the data to the log sink of the connection. The sink batches the records in memory and a background thread writes them to 'log_{self.src_port}.txt' (see mrt_log.LogSink), so no file is opened on the per-packet path.
 
         Args:
             data (bytes): The data of the segment.
@@ -111,28 +456,4 @@ class Segment:
         Returns:
             None
         """
-        # Default value for segment_type
-        segment_type = 'UNKNOWN'
-
-        # Determine the type of the segment
-        if self.syn and self.ack:
-            segment_type = 'SYN-ACK'
-        elif self.syn:
-            segment_type = 'SYN'
-        elif data[:5] == 'ready' and not (self.syn and self.ack and self.fin):
-            segment_type = 'ACK'
-        elif self.ack:
-            if self.packet_num >= 0 and (self.ack_num > 1 or self.seq_num > 1) :
-                segment_type = f'ack{self.packet_num}'
-            else: 
-                segment_type = 'ACK'
-        elif self.fin:
-            segment_type = 'FIN' 
-        else:
-            if self.seq_num > 0 and self.ack_num > 0:
-                segment_type = f'pkt{self.packet_num}'
-                
-
-        # Log the segment information
-        with open(f'log_{self.src_port}.txt', 'a') as f:
-            f.write(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())} {self.src_port} {self.dst_port} {self.seq_num} {self.ack_num} {segment_type} {len(data)}\n')
\ No newline at end of file
+        self.log_sink.record(self.src_port, self.dst_port, self.seq_num & SEQ_MASK, self.ack_num & SEQ_MASK, self.segment_type(), self.packet_num & SEQ_MASK, len(data))
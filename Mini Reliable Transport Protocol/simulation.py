@@ -0,0 +1,329 @@
+#!/usr/bin/env python3.10
+import argparse
+import asyncio # for the event loop the protocol runs on
+import contextlib
+import os
+import random
+import selectors # for the selector interface of the event loop
+import time
+import network # for the loss file, the link model and the bit errors
+from mrt_async import AsyncClient, AsyncServer
+
+# Scenarios that can be named on the command line of simulation.py and benchmark.py instead of a loss file, in the format of loss file lines. Their losses and bit errors apply from the first datagram, so even short transfers meet them
+SCENARIOS = {
+    'lossy': ['0 .1 .0001 delay=0.005'],
+    'biterr': ['0 0 .0001 delay=0.005'],
+    'clean': ['0 0 0 delay=0.005'],
+    'loss1': ['0 .01 0 delay=0.005'],
+    'loss5': ['0 .05 .00001 delay=0.005'],
+    'wan': ['0 .01 0 delay=0.04 jitter=0.005 rate=1250000 queue=100'],
+    'bursty': ['0 0 0 delay=0.005', '2 .2 .0001 delay=0.005', '4 0 0 delay=0.005'],
+}
+
+
+def load_scenario(spec):
+    """
+    return the loss and link tables of a scenario
+
+    arguments:
+    spec -- the name of a scenario of SCENARIOS, or the path of a loss file
+
+    return:
+    the loss table and the link table, see network.setUpLoss
+    """
+    loss, link = {}, {}
+    if spec not in SCENARIOS:
+        network.setUpLoss(spec, loss, link)
+        return loss, link
+    for line in SCENARIOS[spec]:
+        fields = line.split()
+        loss[fields[0]] = [float(fields[1]), float(fields[2])]
+        link[fields[0]] = dict(network.LINK_DEFAULTS, **{key: float(value) for key, value in (field.split('=') for field in fields[3:])})
+    return loss, link
+
+
+def first_difference(received, data):
+    """
+    return the offset of the first byte where the received data differs from the data sent, or where the shorter of the two ends
+    """
+    for offset, (a, b) in enumerate(zip(received, data)):
+        if a != b:
+            return offset
+    return min(len(received), len(data))
+
+
+class VirtualSelector(selectors.BaseSelector):
+    """
+    A selector that never waits.
+
+    The simulated endpoints exchange datagrams through callbacks scheduled on the event loop, so there is never any I/O to wait for: instead of blocking for the timeout the event loop asks for, the selector moves the virtual clock forward by that much. The loop then runs the callbacks that became due, and a transfer that takes minutes of protocol time runs as fast as its callbacks.
+    """
+
+    def __init__(self, loop):
+        """
+        arguments:
+        loop -- the SimulationLoop whose clock is advanced
+        """
+        self.loop = loop
+        self.keys = {}
+
+    def register(self, fileobj, events, data=None):
+        key = selectors.SelectorKey(fileobj, fileobj if isinstance(fileobj, int) else fileobj.fileno(), events, data)
+        self.keys[fileobj] = key
+        return key
+
+    def unregister(self, fileobj):
+        return self.keys.pop(fileobj)
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("Simulation stalled: nothing is scheduled and no datagram is in flight")
+        self.loop.clock += timeout
+        return []
+
+    def get_map(self):
+        return self.keys
+
+
+class SimulationLoop(asyncio.SelectorEventLoop):
+    """
+    An asyncio event loop running on a virtual clock, with in-memory datagram endpoints.
+
+    time() returns the virtual clock, which only moves when the loop has nothing to run but a later callback (see VirtualSelector). create_datagram_endpoint connects the protocol to a Channel instead of a socket, and batched_io tells batch_io.create_endpoint to use it rather than a batched socket. AsyncClient and AsyncServer read every time from the loop and only open endpoints through batch_io.create_endpoint, so they run unchanged.
+    """
+
+    batched_io = False
+
+    def __init__(self, channel):
+        """
+        arguments:
+        channel -- the Channel carrying the datagrams of the endpoints
+        """
+        self.clock = 0.0
+        super().__init__(VirtualSelector(self))
+        self._clock_resolution = 1e-9
+        self.channel = channel
+        channel.loop = self
+
+    def time(self):
+        return self.clock
+
+    async def create_datagram_endpoint(self, protocol_factory, local_addr=None, remote_addr=None, **kwargs):
+        protocol = protocol_factory()
+        transport = ChannelTransport(self.channel, local_addr, protocol)
+        self.channel.endpoints[local_addr] = transport
+        protocol.connection_made(transport)
+        return transport, protocol
+
+
+class ChannelTransport(asyncio.DatagramTransport):
+    """
+    The datagram transport of an endpoint attached to a Channel.
+    """
+
+    def __init__(self, channel, addr, protocol):
+        super().__init__()
+        self.channel = channel
+        self.addr = addr
+        self.protocol = protocol
+        self.closed = False
+
+    def sendto(self, data, addr=None):
+        if not self.closed:
+            self.channel.send(bytes(data), self.addr, addr)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.channel.endpoints.pop(self.addr, None)
+            self.protocol.connection_lost(None)
+
+    def is_closing(self):
+        return self.closed
+
+    def get_extra_info(self, name, default=None):
+        if name == 'sockname':
+            return self.addr
+        return default
+
+
+class Channel:
+    """
+    An in-memory lossy link between the simulated endpoints.
+
+    Datagrams are dropped and corrupted with the rates of the loss file and delayed, queued and reordered by one network.Link per direction by network.impair, as network.py does: a loss file line applies from its time on, counted from the first datagram. Delivery is a callback scheduled on the event loop at the arrival time. The event loop does not keep callbacks due at the same time in order, so the datagrams arriving at the same time share one callback that delivers them in the order they were sent, like the timer heap of network.py.
+    """
+
+    def __init__(self, loss=None, link=None):
+        """
+        arguments:
+        loss -- the loss table of a loss file, time -> [packet loss rate, bit error rate], no loss by default
+        link -- the link table of a loss file, time -> link parameters, an instant link by default
+        """
+        self.loss = loss or {}
+        self.link = link or {}
+        self.loop = None
+        self.endpoints = {} # address -> ChannelTransport
+        self.links = {} # destination -> network.Link
+        self.arrivals = {} # arrival time -> datagrams due at that time, in the order they were sent
+        self.start = None
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, data, src, dst):
+        """
+        carry a datagram from one endpoint to another
+        """
+        now = self.loop.time()
+        if self.start is None:
+            self.start = now
+        self.sent += 1
+        if dst not in self.links:
+            self.links[dst] = network.Link()
+        forwarded = network.impair(data, now - self.start, now, self.links[dst], self.loss, self.link)
+        if forwarded is None:
+            self.dropped += 1
+            return
+        d, arrival = forwarded
+        if arrival not in self.arrivals:
+            self.arrivals[arrival] = []
+            self.loop.call_at(arrival, self.deliver, arrival)
+        self.arrivals[arrival].append((d, src, dst))
+
+    def deliver(self, arrival):
+        """
+        hand the datagrams due at the given time to their destination, if it is still open
+        """
+        for data, src, dst in self.arrivals.pop(arrival):
+            endpoint = self.endpoints.get(dst)
+            if endpoint is not None:
+                endpoint.protocol.datagram_received(bytes(data), src)
+
+
+async def transfer(data, segment_size, receive_buffer_size, mode, congestion, checksum, server_port=60000, client_port=50000, network_port=None, fec=0, adapt_segment_size=False):
+    """
+    connect a client to a server, send the data and return what the server received
+
+    arguments:
+    network_port -- the port the client sends to when a relay sits between the client and the server, the server port by default
+    fec -- the FEC block size of the client, 0 to disable forward error correction
+    adapt_segment_size -- adapt the segment size of the client to the corruption of the link
+
+    return:
+    the bytes received by the server and the AsyncClient
+    """
+    server = AsyncServer()
+    await server.init(server_port, receive_buffer_size, 'off')
+    client = AsyncClient()
+    await client.init(client_port, 'localhost', network_port or server_port, segment_size, mode, congestion, checksum, 'off', fec=fec, adapt_segment_size=adapt_segment_size)
+
+    async def receive():
+        conn = await server.accept()
+        received = bytearray()
+        async for chunk in server.stream(conn):
+            received += chunk
+        await conn.close()
+        return received
+
+    receiver = asyncio.ensure_future(receive())
+    await client.connect()
+    await client.send(data)
+    await client.close()
+    received = await receiver
+    await server.close()
+    return received, client
+
+
+def run_transfer(data, loss=None, link=None, seed=0, segment_size=1460, receive_buffer_size=65536, mode='sr', congestion='reno', checksum='auto', timeout=3600, fec=0, adapt_segment_size=False):
+    """
+    simulate one transfer from a client to a server on a virtual clock
+
+    the client and server run on a SimulationLoop: the transfer takes as many virtual seconds as it would on a real link with the given characteristics, but only as much real time as its callbacks need
+
+    arguments:
+    data -- the bytes to send
+    loss -- the loss table of a loss file (see network.setUpLoss), no loss by default
+    link -- the link table of a loss file, an instant link by default
+    seed -- seed of the random generators of the channel
+    segment_size, mode, congestion, checksum, fec, adapt_segment_size -- as for Client.init
+    receive_buffer_size -- as for Server.init
+    timeout -- the virtual time after which the transfer is abandoned, in seconds
+
+    return:
+    a dict with ok (the server received exactly the data), the virtual duration of the transfer in seconds, the number of datagrams sent and dropped by the channel, the number of data segments, transmissions, timeouts and parity segments and the congestion state of the client, and error if the transfer failed, with the first offset at which the data differs if it completed with the wrong data
+    """
+    network.seedRandom(seed)
+    channel = Channel(loss, link)
+    loop = SimulationLoop(channel)
+    result = {'ok': False, 'duration': None, 'datagrams': 0, 'dropped': 0}
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            received, client = loop.run_until_complete(asyncio.wait_for(transfer(data, segment_size, receive_buffer_size, mode, congestion, checksum, fec=fec, adapt_segment_size=adapt_segment_size), timeout))
+        result['ok'] = received == data
+        if not result['ok']:
+            result['error'] = f"data mismatch at offset {first_difference(received, data)} ({len(received)} bytes received, {len(data)} sent)"
+        result['segments'] = client.num_segments
+        result['transmissions'] = client.metrics.transmissions
+        result['timeouts'] = client.metrics.timeouts
+        result['parities'] = client.metrics.parities_sent
+        result['congestion'] = client.congestion_state()
+    except Exception as e:
+        result['error'] = repr(e)
+    result['duration'] = loop.time()
+    result['datagrams'] = channel.sent
+    result['dropped'] = channel.dropped
+    loop.close()
+    return result
+
+
+def run_scenarios(count, size, loss=None, link=None, seed=0, **kwargs):
+    """
+    simulate many transfers of random data, each with its own seed
+
+    arguments:
+    count -- the number of transfers
+    size -- the number of bytes of each transfer
+    loss, link -- the loss and link tables shared by every transfer
+    seed -- the seed of the first transfer, transfer i uses seed + i
+    kwargs -- passed on to run_transfer
+
+    return:
+    the list of the results of run_transfer, with the seed of each transfer
+    """
+    results = []
+    for i in range(count):
+        data = random.Random(seed + i).randbytes(size)
+        result = run_transfer(data, loss, link, seed + i, **kwargs)
+        result['seed'] = seed + i
+        results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    # accepts commandline arguments
+    parser = argparse.ArgumentParser(
+                    prog='simulation.py',
+                    description='simulation.py runs seeded MRT transfers against a virtual clock and an in-memory lossy channel.')
+    parser.add_argument('scenario', type=str, nargs='?', default='lossy', help=f'a loss file or a scenario among {", ".join(SCENARIOS)}')
+    parser.add_argument('--count', type=int, default=1000, help='number of transfers')
+    parser.add_argument('--size', type=int, default=8000, help='bytes sent by each transfer')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first transfer')
+    parser.add_argument('--segment-size', type=int, default=1460)
+    parser.add_argument('--buffer-size', type=int, default=65536)
+    parser.add_argument('--mode', type=str, default='sr', choices=['sr', 'gbn'])
+    parser.add_argument('--congestion', type=str, default='reno')
+    parser.add_argument('--fec', type=int, default=0, help='FEC block size, 0 to disable forward error correction')
+    parser.add_argument('--adapt', action='store_true', help='adapt the segment size to the corruption of the link')
+
+    args = parser.parse_args()
+
+    loss, link = load_scenario(args.scenario)
+    start = time.time()
+    results = run_scenarios(args.count, args.size, loss, link, args.seed, segment_size=args.segment_size, receive_buffer_size=args.buffer_size, mode=args.mode, congestion=args.congestion, fec=args.fec, adapt_segment_size=args.adapt)
+    elapsed = time.time() - start
+    failed = [r for r in results if not r['ok']]
+    durations = sorted(r['duration'] for r in results)
+    print(f">> {len(results) - len(failed)}/{len(results)} transfers succeeded in {elapsed:.2f}s of real time")
+    print(f">> virtual duration: median {durations[len(durations) // 2]:.3f}s, max {durations[-1]:.3f}s")
+    for r in failed:
+        print(f">> seed {r['seed']} failed: {r['error']}")
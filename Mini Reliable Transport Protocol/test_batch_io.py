@@ -0,0 +1,80 @@
+import asyncio
+import socket
+import pytest
+import batch_io
+
+
+class Collector(asyncio.DatagramProtocol):
+    def __init__(self, expected):
+        self.datagrams = []
+        self.expected = expected
+        self.done = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        self.datagrams.append(bytes(data))
+        if len(self.datagrams) == self.expected and not self.done.done():
+            self.done.set_result(None)
+
+
+async def burst(count, mmsg):
+    loop = asyncio.get_running_loop()
+    receiver, collector = await batch_io.create_endpoint(loop, lambda: Collector(count), ('127.0.0.1', 0))
+    sock = receiver.get_extra_info('socket')
+    sender, _ = await batch_io.create_endpoint(loop, asyncio.DatagramProtocol, ('127.0.0.1', 0))
+    sender.mmsg = mmsg
+    if mmsg is None:
+        sender.pending = []
+    buffer = bytearray(1000)
+    try:
+        # One buffer reused for every datagram, as the client does with its segment buffer
+        for i in range(count):
+            buffer[:4] = i.to_bytes(4, 'big')
+            sender.sendto(memoryview(buffer)[:4 + i % 100], sock.getsockname())
+        await asyncio.wait_for(collector.done, 5)
+    finally:
+        sender.close()
+        receiver.close()
+    return collector.datagrams, sender
+
+
+@pytest.mark.parametrize('mmsg', [batch_io.MMSG, None])
+@pytest.mark.parametrize('count', [1, batch_io.BATCH_SIZE, 3 * batch_io.BATCH_SIZE + 5])
+def test_burst_arrives_in_order(count, mmsg):
+    loop = asyncio.SelectorEventLoop()
+    try:
+        datagrams, _ = loop.run_until_complete(burst(count, mmsg))
+    finally:
+        loop.close()
+    assert [int.from_bytes(d[:4], 'big') for d in datagrams] == list(range(count))
+    assert [len(d) for d in datagrams] == [4 + i % 100 for i in range(count)]
+
+
+@pytest.mark.skipif(batch_io.MMSG is None, reason='sendmmsg is not available')
+def test_outgoing_slots_are_reused_once_written():
+    loop = asyncio.SelectorEventLoop()
+    try:
+        _, sender = loop.run_until_complete(burst(3 * batch_io.BATCH_SIZE, batch_io.MMSG))
+    finally:
+        loop.close()
+    assert len(sender.outgoing) == 3
+    assert sender.head == sender.tail == 0
+
+
+class IPv6FirstLoop(asyncio.SelectorEventLoop):
+    """
+    resolves 'localhost' to ::1 before 127.0.0.1 unless a family is asked for, as some hosts do
+    """
+
+    async def getaddrinfo(self, host, port, *, family=0, type=0, proto=0, flags=0):
+        addresses = [(socket.AF_INET6, socket.SOCK_DGRAM, 0, '', ('::1', port, 0, 0)), (socket.AF_INET, socket.SOCK_DGRAM, 0, '', ('127.0.0.1', port))]
+        return [address for address in addresses if family in (0, address[0])]
+
+
+def test_endpoint_binds_ipv4_when_localhost_resolves_to_ipv6_first():
+    loop = IPv6FirstLoop()
+    try:
+        transport, _ = loop.run_until_complete(batch_io.create_endpoint(loop, asyncio.DatagramProtocol, ('localhost', 0)))
+        assert transport.get_extra_info('socket').family == socket.AF_INET
+        transport.close()
+    finally:
+        loop.close()
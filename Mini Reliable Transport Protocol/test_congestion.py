@@ -0,0 +1,96 @@
+import math
+import pytest
+from congestion import Reno, Cubic, create_congestion_control, INITIAL_CWND, MIN_CWND, MIN_SSTHRESH, CUBIC_C, CUBIC_BETA
+
+
+@pytest.mark.parametrize('cc', [Reno, Cubic])
+def test_slow_start_grows_one_segment_per_acknowledged_segment(cc):
+    cc = cc()
+    assert cc.cwnd == INITIAL_CWND and cc.in_slow_start()
+    cc.on_ack(5, 0.0, 0.1)
+    assert cc.cwnd == INITIAL_CWND + 5
+    cc.on_ack(15, 0.1, 0.1)
+    assert cc.window() == 2 * INITIAL_CWND + 10
+
+
+def test_reno_slow_start_then_congestion_avoidance():
+    cc = Reno()
+    cc.ssthresh = 16
+    cc.on_ack(10, 0.0, 0.1)
+    assert cc.cwnd == 20 and not cc.in_slow_start()
+    # One segment per window of acknowledged segments
+    cc.on_ack(20, 0.1, 0.1)
+    assert cc.cwnd == pytest.approx(21)
+    for _ in range(21):
+        cc.on_ack(1, 0.2, 0.1)
+    assert cc.cwnd == pytest.approx(22, abs=0.05)
+
+
+def test_reno_halves_the_window_on_loss():
+    cc = Reno()
+    cc.cwnd = 40.0
+    cc.on_loss(1.0)
+    assert cc.cwnd == 20 and cc.ssthresh == 20
+    assert not cc.in_slow_start()
+    cc.cwnd = 3.0
+    cc.on_loss(2.0)
+    assert cc.cwnd == cc.ssthresh == MIN_SSTHRESH
+
+
+def test_cubic_reduces_the_window_by_beta_on_loss():
+    cc = Cubic()
+    cc.cwnd = 100.0
+    cc.on_loss(1.0)
+    assert cc.cwnd == pytest.approx(100 * CUBIC_BETA)
+    assert cc.ssthresh == pytest.approx(100 * CUBIC_BETA)
+    assert cc.w_max == 100
+    # A loss before the window got back to W_max lowers W_max further (fast convergence)
+    cc.cwnd = 80.0
+    cc.on_loss(2.0)
+    assert cc.w_max == pytest.approx(80 * (1 + CUBIC_BETA) / 2)
+    assert cc.cwnd == pytest.approx(80 * CUBIC_BETA)
+
+
+@pytest.mark.parametrize('cc, factor', [(Reno, 0.5), (Cubic, CUBIC_BETA)])
+def test_timeout_resets_the_window(cc, factor):
+    cc = cc()
+    cc.cwnd = 40.0
+    cc.on_timeout(1.0)
+    assert cc.cwnd == MIN_CWND
+    assert cc.ssthresh == pytest.approx(40 * factor)
+    assert cc.in_slow_start()
+    cc.on_ack(1, 1.5, 0.1)
+    assert cc.cwnd == MIN_CWND + 1
+
+
+def test_cubic_window_follows_w_of_t_around_k():
+    # W(t) = W_max + C (t - K)^3, with K the time to get back to W_max after the loss
+    srtt = 0.1
+    cc = Cubic()
+    cc.cwnd = 100.0
+    cc.on_loss(0.0)
+    k = math.pow(100 * (1 - CUBIC_BETA) / CUBIC_C, 1 / 3)
+    now = 0.0
+    cc.on_ack(1, now, srtt)
+    assert cc.k == pytest.approx(k)
+    assert cc.origin == 100
+    windows = {}
+    # A window of acknowledgments per round trip brings the window to W(t) of the next round trip
+    while now < k + 3:
+        now += srtt
+        cc.on_ack(cc.window(), now, srtt)
+        windows[round(now / srtt)] = cc.cwnd
+    w = lambda t: 100 + CUBIC_C * (t - k) ** 3
+    for rtt, cwnd in windows.items():
+        assert cwnd == pytest.approx(w(rtt * srtt + srtt), abs=1.5), rtt
+    # Concave up to K, a plateau around W_max, convex beyond
+    before, at, after = windows[round(k / 2 / srtt)], windows[round(k / srtt)], windows[round((k + 3) / srtt) - 1]
+    assert 70 < before < 100
+    assert at == pytest.approx(100, abs=1)
+    assert after > 105
+
+
+def test_unknown_congestion_control():
+    assert isinstance(create_congestion_control('cubic'), Cubic)
+    with pytest.raises(ValueError):
+        create_congestion_control('vegas')
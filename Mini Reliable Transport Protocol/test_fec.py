@@ -0,0 +1,31 @@
+import random
+from fec import ParityEncoder, recover_segment
+
+
+def encode(segments):
+    parity = ParityEncoder(len(segments))
+    for packet_num, (payload, eom) in enumerate(segments):
+        parity.add(packet_num, payload, eom)
+    assert parity.full()
+    payload = parity.payload()
+    assert payload[0] == len(segments)
+    return payload[1:]
+
+
+def test_parity_rebuilds_any_one_lost_segment_of_a_block():
+    rng = random.Random(0)
+    # Segments of different lengths, the shortest ends a message
+    segments = [(rng.randbytes(1400), False), (rng.randbytes(1400), False), (rng.randbytes(300), True), (rng.randbytes(1400), False)]
+    parity = encode(segments)
+    for lost in range(len(segments)):
+        others = [segment for i, segment in enumerate(segments) if i != lost]
+        assert recover_segment(parity, others) == segments[lost]
+
+
+def test_parity_cannot_rebuild_two_lost_segments():
+    rng = random.Random(1)
+    segments = [(rng.randbytes(1400), False) for _ in range(4)]
+    parity = encode(segments)
+    # The parity of the block is the XOR of both missing segments, which decodes to neither of them
+    result = recover_segment(parity, segments[2:])
+    assert result not in (segments[0], segments[1])
@@ -0,0 +1,141 @@
+import asyncio
+import pytest
+import simulation
+from mrt_async import AsyncClient, RTTEstimator, INITIAL_RTO, MIN_RTO, MAX_RTO, CLOCK_GRANULARITY, RTT_ALPHA, RTT_BETA
+
+
+def test_initial_rto():
+    rtt = RTTEstimator()
+    assert rtt.srtt is None
+    assert rtt.rto == INITIAL_RTO
+
+
+def test_first_sample():
+    # RFC 6298 2.2: SRTT <- R, RTTVAR <- R/2, RTO <- SRTT + max(G, 4 * RTTVAR)
+    rtt = RTTEstimator()
+    rtt.sample(0.5)
+    assert rtt.srtt == 0.5
+    assert rtt.rttvar == 0.25
+    assert rtt.rto == pytest.approx(0.5 + 4 * 0.25)
+
+
+def test_later_samples():
+    # RFC 6298 2.3: RTTVAR is updated with the old SRTT, then SRTT
+    rtt = RTTEstimator()
+    rtt.sample(0.5)
+    rtt.sample(0.9)
+    rttvar = (1 - RTT_BETA) * 0.25 + RTT_BETA * abs(0.5 - 0.9)
+    srtt = (1 - RTT_ALPHA) * 0.5 + RTT_ALPHA * 0.9
+    assert rtt.rttvar == pytest.approx(rttvar)
+    assert rtt.srtt == pytest.approx(srtt)
+    assert rtt.rto == pytest.approx(srtt + 4 * rttvar)
+    rtt.sample(0.3)
+    rttvar = (1 - RTT_BETA) * rttvar + RTT_BETA * abs(srtt - 0.3)
+    srtt = (1 - RTT_ALPHA) * srtt + RTT_ALPHA * 0.3
+    assert rtt.rttvar == pytest.approx(rttvar)
+    assert rtt.srtt == pytest.approx(srtt)
+    assert rtt.rto == pytest.approx(srtt + 4 * rttvar)
+
+
+def test_steady_samples_converge():
+    rtt = RTTEstimator()
+    for _ in range(200):
+        rtt.sample(0.3)
+    assert rtt.srtt == pytest.approx(0.3)
+    assert rtt.rttvar == pytest.approx(0, abs=1e-9)
+    assert rtt.rto == pytest.approx(0.3 + CLOCK_GRANULARITY)
+
+
+def test_min_rto_clamp():
+    rtt = RTTEstimator()
+    rtt.sample(0.001)
+    assert rtt.rto == MIN_RTO
+    for _ in range(100):
+        rtt.sample(0.001)
+    assert rtt.rto == MIN_RTO
+
+
+def test_max_rto_clamp():
+    rtt = RTTEstimator()
+    rtt.sample(40)
+    assert rtt.rto == MAX_RTO
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    rtt = RTTEstimator()
+    rtt.sample(0.5)
+    rto = rtt.rto
+    rtt.backoff()
+    assert rtt.rto == pytest.approx(2 * rto)
+    rtt.backoff()
+    assert rtt.rto == pytest.approx(4 * rto)
+    for _ in range(20):
+        rtt.backoff()
+    assert rtt.rto == MAX_RTO
+    # The estimate itself is untouched, the next sample recomputes the timeout from it
+    assert rtt.srtt == 0.5
+    rtt.sample(0.5)
+    assert rtt.rto < MAX_RTO
+
+
+def test_backoff_before_the_first_sample():
+    rtt = RTTEstimator()
+    rtt.backoff()
+    assert rtt.rto == 2 * INITIAL_RTO
+
+
+def run_client(test):
+    """
+    run a test coroutine with an AsyncClient on a virtual clock, its segments go nowhere
+    """
+    loop = simulation.SimulationLoop(simulation.Channel())
+
+    async def main():
+        client = AsyncClient()
+        await client.init(50000, 'localhost', 60000, 1460, log_level='off')
+        client.payloads = {p: b'x' * 100 for p in range(4)}
+        client.num_segments = 4
+        client.end_of_data = True
+        await test(loop, client)
+
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+def test_acknowledged_segment_is_sampled():
+    async def test(loop, client):
+        client.send_segment(0)
+        loop.clock += 0.25
+        client.handle_ack(1, b'')
+        assert client.rtt.srtt == pytest.approx(0.25)
+        assert client.metrics.rtt_count == 1
+
+    run_client(test)
+
+
+def test_karn_retransmitted_segment_is_not_sampled():
+    async def test(loop, client):
+        client.send_segment(0)
+        loop.clock += 0.25
+        client.handle_ack(1, b'')
+        srtt, rto = client.rtt.srtt, client.rtt.rto
+        # Segment 1 is sent twice, its acknowledgment cannot tell which transmission it answers
+        client.send_segment(1)
+        loop.clock += 2.0
+        client.send_segment(1)
+        loop.clock += 0.01
+        client.handle_ack(2, b'')
+        assert client.base == 2
+        assert client.rtt.srtt == srtt
+        assert client.rtt.rto == rto
+        assert client.metrics.rtt_count == 1
+        # A segment sent once is sampled again
+        client.send_segment(2)
+        loop.clock += 0.5
+        client.handle_ack(3, b'')
+        assert client.metrics.rtt_count == 2
+        assert client.rtt.srtt == pytest.approx((1 - RTT_ALPHA) * srtt + RTT_ALPHA * 0.5)
+
+    run_client(test)
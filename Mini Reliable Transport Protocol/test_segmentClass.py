@@ -0,0 +1,103 @@
+import pytest
+from mrt_log import LogSink
+from segmentClass import Segment, unwrap, seq_before, pack_sack, unpack_sack, SEQ_MODULUS, FLAGS_OFFSET, CHECKSUM_CRC32, CHECKSUM_INET, CHECKSUM_MD5
+
+WRAP = SEQ_MODULUS
+
+
+@pytest.mark.parametrize('reference, number', [
+    (0, 0),
+    (5, 9),
+    (9, 5),
+    # The reference just below the wrap, the number just above it
+    (WRAP - 1, WRAP),
+    (WRAP - 1, WRAP + 1),
+    (WRAP - 3, WRAP + 5),
+    (WRAP - 1000, WRAP + 1000),
+    # The reference just above the wrap, the number just below it
+    (WRAP, WRAP - 1),
+    (WRAP + 1, WRAP - 1),
+    (WRAP + 5, WRAP - 3),
+    (WRAP + 1000, WRAP - 1000),
+    # Later wraps
+    (3 * WRAP - 2, 3 * WRAP + 2),
+    (3 * WRAP + 2, 3 * WRAP - 2),
+    # Half the number space apart, the farthest unwrap can reach
+    (WRAP - 1, WRAP - 1 + (WRAP >> 1) - 1),
+    (WRAP + 1, WRAP + 1 - (WRAP >> 1)),
+])
+def test_unwrap_recovers_the_packet_number(reference, number):
+    assert unwrap(number % WRAP, reference) == number
+
+
+def test_unwrap_at_the_boundary_of_every_value():
+    for reference in (WRAP - 2, WRAP - 1, WRAP, WRAP + 1):
+        for number in range(reference - 40, reference + 40):
+            assert unwrap(number % WRAP, reference) == number
+
+
+def test_unwrap_picks_the_closest_number_before_the_first_wrap():
+    # Seen from packet 0, the value 2^32 - 1 is one packet behind rather than 2^32 - 1 packets ahead
+    assert unwrap(WRAP - 1, 0) == -1
+    assert unwrap(WRAP - 1, WRAP >> 1) == WRAP - 1
+
+
+def test_seq_before_across_the_wrap():
+    assert seq_before(WRAP - 1, 0)
+    assert seq_before(WRAP - 5, 3)
+    assert not seq_before(3, WRAP - 5)
+    assert not seq_before(7, 7)
+
+
+def test_segment_carries_the_packet_number_across_the_wrap():
+    sink = LogSink(0, 'off')
+    for number in (WRAP - 2, WRAP - 1, WRAP, WRAP + 1, WRAP + 2):
+        sent = Segment(1, 2, number, number + 1, number, checksum_mode=CHECKSUM_CRC32, log_sink=sink).to_bytes(b'data')
+        seq_num, ack_num, packet_num, _, _, _, corrupt, data = Segment(2, 1, log_sink=sink).from_bytes(sent)
+        assert not corrupt
+        assert bytes(data) == b'data'
+        assert packet_num == number % WRAP
+        assert unwrap(packet_num, WRAP - 1) == number
+        assert unwrap(ack_num, WRAP) == number + 1
+
+
+def test_sack_blocks_across_the_wrap():
+    base = WRAP - 2
+    blocks = [((base + 3) % WRAP, (base + 6) % WRAP)]
+    start, end = unpack_sack(pack_sack(blocks))[0]
+    start = unwrap(start, base)
+    end = start + (end - start) % WRAP
+    assert (start, end) == (base + 3, base + 6)
+
+
+def build(checksum_mode, data=b'data', syn=False):
+    return Segment(1, 2, 7, 8, 9, syn, False, False, checksum_mode=checksum_mode, log_sink=LogSink(0, 'off')).to_bytes(data)
+
+
+def parse(datagram, checksum_mode=None):
+    segment = Segment(2, 1, log_sink=LogSink(0, 'off'))
+    return segment.from_bytes(datagram, checksum_mode), segment
+
+
+@pytest.mark.parametrize('mode', [CHECKSUM_MD5, CHECKSUM_CRC32, CHECKSUM_INET])
+def test_segment_in_the_negotiated_mode_is_accepted(mode):
+    (_, _, packet_num, _, _, _, corrupt, data), segment = parse(build(mode), mode)
+    assert not corrupt
+    assert packet_num == 9 and bytes(data) == b'data'
+    assert segment.checksum_mode == mode
+
+
+@pytest.mark.parametrize('sent, negotiated', [(CHECKSUM_INET, CHECKSUM_CRC32), (CHECKSUM_INET, CHECKSUM_MD5), (CHECKSUM_CRC32, CHECKSUM_MD5), (CHECKSUM_MD5, CHECKSUM_CRC32)])
+def test_segment_in_another_mode_is_corrupt(sent, negotiated):
+    # The segment is intact for its own mode, as if a damaged flags byte had been matched by a weak checksum
+    datagram = build(sent)
+    assert not parse(datagram)[0][6]
+    assert parse(datagram, negotiated)[0][6]
+
+
+def test_damaged_mode_bits_are_corrupt():
+    datagram = bytearray(build(CHECKSUM_CRC32))
+    datagram[FLAGS_OFFSET] ^= (CHECKSUM_CRC32 ^ CHECKSUM_INET) << 3
+    (_, _, _, _, _, _, corrupt, _), segment = parse(datagram, CHECKSUM_CRC32)
+    assert corrupt
+    assert segment.checksum_mode == CHECKSUM_CRC32
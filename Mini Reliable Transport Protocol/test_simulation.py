@@ -0,0 +1,334 @@
+import asyncio
+import contextlib
+import os
+import random
+import pytest
+import network
+import simulation
+from mrt_async import AsyncClient, AsyncServer, ACK_DELAY, ACK_EVERY, DUP_THRESH, TIME_WAIT
+from mrt_log import LogSink
+from segmentClass import Segment
+from timer_wheel import TICK
+
+
+@pytest.mark.parametrize('mode', ['sr', 'gbn'])
+def test_lossy_scenario_delivers_intact_data(mode):
+    loss, link = simulation.load_scenario('lossy')
+    results = simulation.run_scenarios(10, 8000, loss, link, mode=mode)
+    failed = [(r['seed'], r.get('error')) for r in results if not r['ok']]
+    assert not failed
+
+
+def test_lossy_scenario_applies_from_the_first_datagram():
+    loss, link = simulation.load_scenario('lossy')
+    result = simulation.run_transfer(random.Random(0).randbytes(8000), loss, link, seed=0)
+    assert result['ok']
+    assert result['dropped'] > 0
+    assert result['transmissions'] > result['segments']
+
+
+def test_first_difference():
+    assert simulation.first_difference(b'abcdef', b'abcxef') == 3
+    assert simulation.first_difference(b'abc', b'abcdef') == 3
+    assert simulation.first_difference(b'', b'a') == 0
+
+
+class RecordingChannel(simulation.Channel):
+    """
+    a channel without losses, with the given one-way delay, that records the packet number of every data segment sent to the server and the time it was first sent, and the time and packet number of every data acknowledgment sent to the client
+    it drops the first transmission of the packet numbers in drop, and the next drop_acks data acknowledgments
+    """
+
+    def __init__(self, drop=(), server_port=60000, delay=0.005):
+        loss, link = simulation.load_scenario('clean')
+        link['0']['delay'] = delay
+        super().__init__(loss, link)
+        self.delay = delay
+        self.drop = set(drop)
+        self.drop_acks = 0
+        self.server_port = server_port
+        self.data_segments = []
+        self.first_sent = {}
+        self.acks = []
+
+    def send(self, data, src, dst):
+        segment = Segment(0, 0, log_sink=LogSink(0, 'off'))
+        _, _, packet_num, syn, ack, fin, corrupt, payload = segment.from_bytes(data)
+        if dst[1] == self.server_port and not (syn or ack or fin or corrupt or segment.parity) and len(payload):
+            self.data_segments.append(packet_num)
+            self.first_sent.setdefault(packet_num, self.loop.time())
+            if packet_num in self.drop:
+                self.drop.discard(packet_num)
+                self.dropped += 1
+                return
+        elif dst[1] != self.server_port and ack and not (syn or fin):
+            self.acks.append((self.loop.time(), packet_num))
+            if self.drop_acks:
+                self.drop_acks -= 1
+                self.dropped += 1
+                return
+        super().send(data, src, dst)
+
+
+def run_on(channel, main):
+    """
+    run a coroutine on a SimulationLoop carrying its datagrams on the given channel, and return its result
+    """
+    loop = simulation.SimulationLoop(channel)
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return loop.run_until_complete(asyncio.wait_for(main, 3600))
+    finally:
+        loop.close()
+
+
+def test_sack_holes_are_retransmitted_once():
+    data = random.Random(1).randbytes(30 * 1400)
+    # Segment 2 is resent on the duplicate ACKs, segment 4 is a hole above the window base that only the SACK blocks reveal
+    channel = RecordingChannel(drop=[2, 4])
+    received, client = run_on(channel, simulation.transfer(data, 1460, 65536, 'sr', 'reno', 'auto'))
+    assert received == data
+    for hole in (2, 4):
+        first, resent = [i for i, p in enumerate(channel.data_segments) if p == hole]
+        # DUP_THRESH segments above the hole were sent before it was resent
+        assert len({p for p in channel.data_segments[first:resent] if p > hole}) >= DUP_THRESH
+    assert all(channel.data_segments.count(p) == 1 for p in set(channel.data_segments) - {2, 4})
+    assert client.metrics.timeouts == 0
+
+
+def test_two_clients_share_the_server_port():
+    network.seedRandom(0)
+    data = {50000: random.Random(2).randbytes(40000), 50001: random.Random(3).randbytes(30000)}
+
+    async def main():
+        server = AsyncServer()
+        await server.init(60000, 65536, 'off')
+        clients = {}
+        for port in data:
+            clients[port] = AsyncClient()
+            await clients[port].init(port, 'localhost', 60000, 1460, log_level='off')
+
+        async def receive():
+            conn = await server.accept()
+            received = bytearray()
+            async for chunk in server.stream(conn):
+                received += chunk
+            await conn.close()
+            return conn.addr[1], bytes(received)
+
+        async def send(port):
+            await clients[port].connect()
+            await clients[port].send(data[port])
+            await clients[port].close()
+
+        receivers = [asyncio.ensure_future(receive()) for _ in data]
+        # Both transfers run at once, their segments interleave on the server port
+        await asyncio.gather(*(send(port) for port in data))
+        received = dict(await asyncio.gather(*receivers))
+        open_connections = len(server.connections)
+        await asyncio.sleep(TIME_WAIT + 1)
+        purged = len(server.connections) == 0
+        await server.close()
+        return received, open_connections, purged
+
+    received, open_connections, purged = run_on(simulation.Channel(*simulation.load_scenario('loss1')), main())
+    assert received == data
+    assert open_connections == 2
+    assert purged
+
+
+def test_zero_window_is_probed_until_the_receiver_reads():
+    data = random.Random(4).randbytes(40000)
+    channel = RecordingChannel()
+
+    async def main():
+        server = AsyncServer()
+        await server.init(60000, 8192, 'off')
+        client = AsyncClient()
+        await client.init(50000, 'localhost', 60000, 1460, log_level='off')
+
+        async def send():
+            await client.connect()
+            await client.send(data)
+            await client.close()
+
+        sender = asyncio.ensure_future(send())
+        conn = await server.accept()
+        # The receiver does not read: the buffer fills up and the window closes with nothing in flight
+        await asyncio.sleep(10)
+        probes = client.metrics.probes
+        # Lose the window update sent when the receiver reads again, only a probe can reopen the window
+        channel.drop_acks = 1
+        received = bytearray()
+        async for chunk in server.stream(conn):
+            received += chunk
+        await conn.close()
+        await sender
+        await server.close()
+        return bytes(received), probes, client.metrics
+
+    received, probes, metrics = run_on(channel, main())
+    assert received == data
+    # Probes back off like the RTO, so only a few are sent in 10 seconds
+    assert 2 <= probes <= 8
+    assert metrics.probes > probes
+    assert metrics.timeouts == 0
+
+
+@pytest.mark.parametrize('ack_every', [ACK_EVERY, 3])
+def test_acks_go_out_every_ack_every_segments_or_after_ack_delay(ack_every):
+    data = random.Random(5).randbytes(60 * 1400)
+    # A round trip longer than ACK_DELAY, so a segment left over from a window waits for the delayed acknowledgment timer
+    channel = RecordingChannel(delay=0.05)
+
+    async def main():
+        server = AsyncServer()
+        await server.init(60000, 65536 * 2, 'off', ack_every=ack_every)
+        client = AsyncClient()
+        await client.init(50000, 'localhost', 60000, 1460, log_level='off')
+
+        async def receive():
+            conn = await server.accept()
+            received = bytearray()
+            async for chunk in server.stream(conn):
+                received += chunk
+            await conn.close()
+            return bytes(received)
+
+        receiver = asyncio.ensure_future(receive())
+        await client.connect()
+        await client.send(data)
+        await client.close()
+        received = await receiver
+        await server.close()
+        return received, client.num_segments
+
+    received, num_segments = run_on(channel, main())
+    assert received == data
+    acked = 0
+    delayed = 0
+    arrival = lambda p: channel.first_sent[p] + channel.delay
+    for sent, packet_num in channel.acks:
+        if packet_num == acked:
+            continue
+        if packet_num - acked == ack_every or packet_num == num_segments:
+            # Acknowledged as soon as the segment completing the count, or ending the message, arrives
+            assert sent == pytest.approx(arrival(packet_num - 1))
+        else:
+            # Fewer segments are acknowledged ACK_DELAY after the first of them arrived, the timer wheel fires at most a tick late
+            assert packet_num - acked < ack_every
+            assert sent - arrival(acked) == pytest.approx(ACK_DELAY + TICK / 2, abs=TICK / 2 + 1e-9)
+            delayed += 1
+        acked = packet_num
+    assert acked == num_segments
+    assert delayed > 0 if ack_every == 3 else delayed == 0
+
+
+def test_parity_rebuilds_one_lost_segment_per_block_without_retransmission():
+    data = random.Random(6).randbytes(39 * 1400)
+    # One segment of every block of 4 is lost, never the first so the parity arrives before DUP_THRESH duplicate ACKs; 37 is in the partial block at the end
+    drop = [4 * k + 1 + k % 3 for k in range(10)]
+    channel = RecordingChannel(drop=drop)
+    received, client = run_on(channel, simulation.transfer(data, 1460, 65536, 'sr', 'reno', 'auto', fec=4))
+    assert received == data
+    assert client.num_segments == 38
+    assert client.metrics.retransmissions == 0 and client.metrics.timeouts == 0
+    assert sorted(channel.data_segments) == list(range(client.num_segments))
+
+
+def test_two_lost_segments_of_a_block_are_retransmitted():
+    data = random.Random(6).randbytes(39 * 1400)
+    channel = RecordingChannel(drop=[5, 6])
+    received, client = run_on(channel, simulation.transfer(data, 1460, 65536, 'sr', 'reno', 'auto', fec=4))
+    assert received == data
+    assert client.metrics.retransmissions == 2
+    assert sorted(p for p in set(channel.data_segments) if channel.data_segments.count(p) > 1) == [5, 6]
+
+
+@pytest.mark.parametrize('size', [500, 5000])
+def test_fast_open_delivers_the_first_segment_with_the_syn(size):
+    data = random.Random(7).randbytes(size)
+    channel = RecordingChannel()
+
+    async def main():
+        server = AsyncServer()
+        await server.init(60000, 65536, 'off')
+        client = AsyncClient()
+        await client.init(50000, 'localhost', 60000, 1460, log_level='off', fast_open=True)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        async def receive():
+            conn = await server.accept()
+            buffer = bytearray(65536)
+            first = bytes(buffer[:await server.recv_into(conn, buffer)])
+            # Accepted and readable one way after the SYN was sent, without waiting for the handshake
+            first_read = loop.time() - start
+            received = bytearray(first)
+            async for chunk in server.stream(conn):
+                received += chunk
+            await conn.close()
+            return first, first_read, bytes(received)
+
+        receiver = asyncio.ensure_future(receive())
+        await client.connect()
+        await client.send(data)
+        await client.close()
+        first, first_read, received = await receiver
+        await server.close()
+        return first, first_read, received, client.early_payload_size(1460)
+
+    first, first_read, received, early = run_on(channel, main())
+    assert received == data
+    assert first_read == pytest.approx(channel.delay)
+    assert first == data[:early]
+    # The segment carried by the SYN is never sent on its own
+    assert 0 not in channel.data_segments
+    assert sorted(channel.data_segments) == list(range(1, -(-size // early)))
+
+
+def test_segment_size_shrinks_under_bit_errors_and_grows_back_on_a_clean_link():
+    network.seedRandom(0)
+    link = dict(network.LINK_DEFAULTS, delay=0.005)
+    # Bit errors for the first 2 seconds, a clean link afterwards
+    channel = simulation.Channel({'0': [0, 0.0001], '2': [0, 0]}, {'0': link, '2': link})
+    data = random.Random(8).randbytes(2500000)
+
+    async def main():
+        server = AsyncServer()
+        await server.init(60000, 65536, 'off')
+        client = AsyncClient()
+        await client.init(50000, 'localhost', 60000, 1460, log_level='off', adapt_segment_size=True)
+        loop = asyncio.get_running_loop()
+        sizes = []
+
+        async def watch():
+            while True:
+                await asyncio.sleep(0.25)
+                sizes.append((loop.time(), client.payload_size))
+
+        async def receive():
+            conn = await server.accept()
+            received = bytearray()
+            async for chunk in server.stream(conn):
+                received += chunk
+            await conn.close()
+            return bytes(received)
+
+        watcher = asyncio.ensure_future(watch())
+        receiver = asyncio.ensure_future(receive())
+        await client.connect()
+        await client.send(data)
+        await client.close()
+        received = await receiver
+        watcher.cancel()
+        await server.close()
+        return received, sizes, client.max_payload_size()
+
+    received, sizes, max_payload = run_on(channel, main())
+    assert received == data
+    noisy = [size for time, size in sizes if time < 2]
+    clean = [size for time, size in sizes if time >= 2.25]
+    assert noisy and clean
+    assert max(noisy) < max_payload / 4
+    assert clean[-1] == max_payload
@@ -0,0 +1,99 @@
+import math # for rounding deadlines up to the next tick
+
+# Resolution of the wheel in seconds and number of slots (one revolution covers TICK * SLOTS seconds)
+TICK = 0.01
+SLOTS = 512
+
+
+class Timer:
+    """
+    A timer scheduled on a TimerWheel, returned by TimerWheel.schedule so that it can be cancelled.
+    """
+
+    __slots__ = ('tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, tick, callback, args):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        prevent the callback from running, the timer is dropped from the wheel when its slot comes up
+        """
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel driving the timers of every connection of an event loop.
+
+    Time is cut into ticks of TICK seconds and a timer is appended to the slot of the tick of its deadline, modulo the number of slots. A single event loop callback advances the wheel one tick at a time and runs the timers of each slot it passes whose tick has come; timers further away than one revolution simply stay in their slot for the next round. Scheduling and cancelling are O(1) whatever the number of timers, and cancelled timers are dropped lazily when their slot is visited, which suits retransmission timers that are restarted on nearly every acknowledgment.
+
+    The wheel only ticks while timers are pending, and fires a timer at most one tick after its deadline.
+    """
+
+    def __init__(self, loop, tick=TICK, slots=SLOTS):
+        """
+        arguments:
+        loop -- the asyncio event loop running the timers
+        tick -- the resolution of the wheel in seconds
+        slots -- the number of slots of the wheel
+        """
+        self.loop = loop
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.current = self.now() # last tick processed
+        self.pending = 0
+        self.handle = None
+
+    def now(self):
+        """
+        return the index of the current tick
+        """
+        return int(self.loop.time() / self.tick)
+
+    def schedule(self, delay, callback, *args):
+        """
+        run a callback after the given delay
+
+        arguments:
+        delay -- the delay in seconds
+        callback -- the function to call, with args
+
+        return:
+        the Timer, to cancel it
+        """
+        if self.handle is None:
+            self.current = self.now()
+            self.handle = self.loop.call_later(self.tick, self.run)
+        tick = max(math.ceil((self.loop.time() + delay) / self.tick), self.current + 1)
+        timer = Timer(tick, callback, args)
+        self.slots[tick % len(self.slots)].append(timer)
+        self.pending += 1
+        return timer
+
+    def run(self):
+        """
+        advance the wheel to the current tick and run the timers that expired
+        """
+        self.handle = None
+        now = self.now()
+        # After a long stall every slot is visited once
+        start = max(self.current + 1, now - len(self.slots) + 1)
+        self.current = now
+        for tick in range(start, now + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if not slot:
+                continue
+            due = [timer for timer in slot if timer.tick <= now]
+            if not due:
+                continue
+            slot[:] = [timer for timer in slot if timer.tick > now]
+            self.pending -= len(due)
+            for timer in due:
+                if not timer.cancelled:
+                    timer.callback(*timer.args)
+        if self.pending and self.handle is None:
+            self.handle = self.loop.call_later(self.tick, self.run)